@@ -0,0 +1,477 @@
+# V0.1a/async_runner.py
+"""
+Gemeinsame asyncio-Ereignisschleife für alle pishrink-Prozesse.
+
+Statt eines Threads pro Prozess, der blockierend aus der Pipe liest, laufen alle
+Prozesse in einer Ereignisschleife in einem eigenen Thread:
+
+- Start ohne Shell (create_subprocess_exec), eigene Prozessgruppe
+- stdout und stderr getrennt, blockweise gelesen
+- Zeitlimits pro Phase und Abbruch (beendet den ganzen Prozessbaum)
+- Stillstandserkennung: weder Ausgabe noch I/O des Prozessbaums (/proc/<pid>/io)
+- Pause und Fortsetzen über SIGSTOP/SIGCONT an den Prozessbaum
+
+Signale und I/O-Messung betreffen alle Nachkommen (PPid in /proc/<pid>/stat), nicht die Prozessgruppe: mit
+'use_pty' (Standard ab sudo 1.9.14) startet sudo pishrink.sh in einer eigenen Sitzung auf einem pty.
+
+Die Callbacks laufen im Thread der Ereignisschleife. Für Qt werden sie wie bisher über
+WorkerSignals weitergereicht (Signale sind threadsicher und werden im GUI-Thread zugestellt).
+"""
+import os
+import signal
+import asyncio
+import threading
+import concurrent.futures
+from log_handler import logger  # Zentralen Logger importieren
+from progress_parser import ProgressParser, ProgressThrottle
+
+CHUNK_SIZE = 65536
+TERMINATE_GRACE = 10  # Sekunden zwischen SIGTERM und SIGKILL
+USER = 'user'  # Anhalten durch Benutzer oder API (im Gegensatz zur I/O-Drosselung)
+STALL_CHECK_INTERVAL = 10  # Sekunden zwischen zwei Messungen der I/O-Zähler
+SUDO_TIMEOUT = 10  # Sekunden für 'sudo -n kill'
+PROC = '/proc'
+
+
+def read_stat(pid, proc=PROC):
+    """
+    :return: Felder aus /proc/<pid>/stat ab dem Zustand (Index 1: PPid, 2: Prozessgruppe) oder None
+    """
+    try:
+        with open(os.path.join(proc, str(pid), 'stat'), 'r') as f:
+            # Der Prozessname kann Leerzeichen enthalten, die Felder beginnen nach der letzten Klammer
+            return f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+
+def process_tree(pid, proc=PROC):
+    """
+    Ermittelt einen Prozess und alle seine Nachkommen über die PPid-Verweise.
+
+    :param pid: Wurzel, z.B. der von create_subprocess_exec gestartete sudo-Prozess
+    :param proc: Pfad zu /proc
+    :return: Liste von (PID, Felder aus read_stat), Eltern vor ihren Kindern
+    """
+    stats = {}
+    children = {}
+    for entry in os.listdir(proc):
+        if not entry.isdigit():
+            continue
+        fields = read_stat(entry, proc)
+        if fields is None:
+            continue
+        stats[int(entry)] = fields
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    tree = []
+    pending = [pid] if pid in stats else []
+    while pending:
+        current = pending.pop(0)
+        tree.append((current, stats[current]))
+        pending.extend(children.get(current, []))
+    return tree
+
+
+async def signal_tree(pid, sig, proc=PROC):
+    """
+    Sendet ein Signal an einen Prozess und alle Nachkommen, ohne die Ereignisschleife zu blockieren.
+
+    :param pid: Wurzel des Prozessbaums
+    :param sig: Signal, z.B. signal.SIGSTOP
+    :return: False, wenn der Prozess nicht mehr existiert oder das Signal nicht zugestellt werden konnte
+    """
+    tree = await asyncio.get_running_loop().run_in_executor(None, process_tree, pid, proc)
+    return await signal_pids([child for child, _ in tree], sig)
+
+
+async def signal_pids(pids, sig):
+    """
+    Sendet ein Signal an mehrere Prozesse. Prozesse, die root gehören (pishrink.sh läuft über sudo),
+    erhalten es über 'sudo -n kill' (als Unterprozess der Ereignisschleife, nicht blockierend).
+
+    :param pids: PIDs, z.B. aus process_tree
+    :param sig: Signal
+    :return: False, wenn keiner der Prozesse mehr existiert oder das Signal nicht zugestellt werden konnte
+    """
+    denied = []
+    delivered = False
+    for child in pids:
+        try:
+            os.kill(child, sig)
+            delivered = True
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            denied.append(child)
+    if not denied:
+        return delivered
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'sudo', '-n', 'kill', f'-{sig.name[3:]}', '--', *(str(child) for child in denied),
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    except OSError as e:
+        logger.error(f"[RUNNER ERROR] {sig.name} an Prozesse {denied} fehlgeschlagen: {e}")
+        return False
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), SUDO_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        logger.error(f"[RUNNER ERROR] {sig.name} an Prozesse {denied} fehlgeschlagen: Zeitüberschreitung")
+        return False
+    if process.returncode != 0:
+        logger.error(f"[RUNNER ERROR] {sig.name} an Prozesse {denied} fehlgeschlagen: "
+                     f"{stderr.decode(errors='replace').strip()}")
+    return process.returncode == 0
+
+
+def tree_activity(pid, proc=PROC):
+    """
+    Summiert die I/O-Zähler eines Prozesses und aller Nachkommen (process_tree). Ist /proc/<pid>/io
+    nicht lesbar (Prozess gehört root), wird ersatzweise die CPU-Zeit aus /proc/<pid>/stat verwendet.
+
+    :param pid: Wurzel des Prozessbaums
+    :param proc: Pfad zu /proc
+    :return: (PIDs des Baums, Zählerstand); ändert sich eins davon, hat der Baum gearbeitet
+    """
+    pids = []
+    total = 0
+    for child, fields in process_tree(pid, proc):
+        pids.append(child)
+        try:
+            with open(os.path.join(proc, str(child), 'io'), 'r') as f:
+                total += sum(int(line.split()[1]) for line in f
+                             if line.startswith(('rchar', 'wchar', 'read_bytes', 'write_bytes')))
+        except (OSError, ValueError, IndexError):
+            total += int(fields[11]) + int(fields[12])  # utime + stime
+    return tuple(sorted(pids)), total
+
+
+class ProcessCancelled(Exception):
+    """
+    Der Prozess wurde über ProcessHandle.cancel() abgebrochen.
+    """
+
+
+class PhaseTimeout(Exception):
+    """
+    Eine Phase hat ihr Zeitlimit überschritten, der Prozess wurde beendet.
+    """
+
+    def __init__(self, phase, limit):
+        super().__init__(f"Phase '{phase}' hat das Zeitlimit von {limit} s überschritten")
+        self.phase = phase
+        self.limit = limit
+
+
+class ProcessStalled(Exception):
+    """
+    Der Prozess hat zu lange weder Ausgabe geschrieben noch I/O ausgeführt und wurde beendet.
+    """
+
+    def __init__(self, phase, idle):
+        super().__init__(f"Keine Ausgabe und kein I/O seit {int(idle)} s in Phase '{phase}'")
+        self.phase = phase
+        self.idle = idle
+
+
+class AsyncProcess:
+    """
+    Ein laufender Prozess mit getrennten Lesern für stdout und stderr.
+    """
+
+    def __init__(self, argv, on_line=None, on_progress=None, phase_timeouts=None, throttle=None, stall_timeout=None,
+                 io_throttle=None):
+        """
+        :param argv: Befehl als Liste (ohne Shell)
+        :param on_line: Callback für jede Textzeile
+        :param on_progress: Callback für gedrosselte ProgressEvents
+        :param phase_timeouts: Dict Phase -> maximale Dauer in Sekunden
+        :param throttle: Optionale ProgressThrottle-Instanz
+        :param stall_timeout: Sekunden ohne Ausgabe und ohne I/O, nach denen der Prozess beendet wird
+        :param io_throttle: Optionale IoThrottle-Instanz, die den Prozess bei hoher Plattenlatenz bremst
+        """
+        self.argv = list(argv)
+        self.on_line = on_line
+        self.on_progress = on_progress
+        self.phase_timeouts = phase_timeouts or {}
+        self.throttle = throttle or ProgressThrottle()
+        self.stall_timeout = stall_timeout
+        self.io_throttle = io_throttle
+        self.last_activity = None
+        self.stdout_parser = ProgressParser()
+        self.stderr_parser = ProgressParser()
+        self.process = None
+        self.running = False
+        self.phase = 'start'
+        self.phase_started = None
+        self.phase_changed = None
+        self.paused_at = None  # Zeitpunkt des SIGSTOP (Zeit der Ereignisschleife) oder None
+        self.pause_owners = set()  # Wer den Prozess angehalten hat (USER, Drosselung)
+        self.signal_lock = None  # Reiht pause() und resume() ein, während Signale zugestellt werden
+
+    @property
+    def stopped(self):
+        return self.paused_at is not None
+
+    @property
+    def paused(self):
+        # Nur vom Benutzer angehalten zählt als pausiert, kurze Stopps der Drosselung nicht
+        return USER in self.pause_owners
+
+    async def run(self):
+        """
+        :return: Rückgabewert des Prozesses
+        :raises PhaseTimeout: wenn eine Phase ihr Zeitlimit überschreitet
+        :raises ProcessStalled: wenn der Prozess hängt
+        :raises asyncio.CancelledError: bei Abbruch (der Prozess ist dann bereits beendet)
+        """
+        self.running = True
+        try:
+            return await self._run()
+        finally:
+            self.running = False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self.phase_started = self.last_activity = loop.time()
+        self.phase_changed = asyncio.Event()
+        self.signal_lock = asyncio.Lock()
+        self.process = await asyncio.create_subprocess_exec(
+            *self.argv, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, start_new_session=True)
+        readers = asyncio.gather(self.read_stream(self.process.stdout, self.stdout_parser),
+                                 self.read_stream(self.process.stderr, self.stderr_parser))
+        watchdogs = [asyncio.ensure_future(self.watch_phases())]
+        if self.stall_timeout:
+            watchdogs.append(asyncio.ensure_future(self.watch_stall()))
+        if self.io_throttle:
+            watchdogs.append(asyncio.ensure_future(self.io_throttle.run(self)))
+        try:
+            done, _ = await asyncio.wait({readers, *watchdogs}, return_when=asyncio.FIRST_COMPLETED)
+            for watchdog in watchdogs:
+                if watchdog in done:
+                    watchdog.result()  # PhaseTimeout bzw. ProcessStalled
+            await readers
+            return await self.process.wait()
+        except BaseException:
+            await self.terminate()
+            readers.cancel()
+            readers.add_done_callback(lambda future: future.cancelled() or future.exception())
+            raise
+        finally:
+            for watchdog in watchdogs:
+                watchdog.cancel()
+
+    async def read_stream(self, stream, parser):
+        while True:
+            data = await stream.read(CHUNK_SIZE)
+            if not data:
+                break
+            self.last_activity = asyncio.get_running_loop().time()
+            if parser is self.stderr_parser:
+                # Phasen werden über stdout (pishrink info) gemeldet, stderr (xz, e2fsck) braucht denselben Stand
+                parser.phase = self.stdout_parser.phase
+            self.dispatch(*parser.feed(data), tracks_phase=parser is self.stdout_parser)
+        self.dispatch(*parser.flush(), tracks_phase=parser is self.stdout_parser)
+
+    def dispatch(self, lines, events, tracks_phase=True):
+        for line in lines:
+            if self.on_line:
+                self.on_line(line)
+        for event in events:
+            if tracks_phase and event.phase != self.phase:
+                self.phase = event.phase
+                self.phase_started = asyncio.get_running_loop().time()
+                self.phase_changed.set()
+            if self.on_progress and self.throttle.accept(event):
+                self.on_progress(event)
+
+    async def watch_phases(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.phase_changed.clear()
+            limit = self.phase_timeouts.get(self.phase)
+            if limit is None or self.stopped:
+                # Angehaltene Zeit zählt nicht zum Zeitlimit, resume() weckt den Wächter
+                await self.phase_changed.wait()
+                continue
+            remaining = self.phase_started + limit - loop.time()
+            if remaining <= 0:
+                raise PhaseTimeout(self.phase, limit)
+            try:
+                await asyncio.wait_for(self.phase_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def watch_stall(self):
+        loop = asyncio.get_running_loop()
+        counter = None
+        while True:
+            await asyncio.sleep(min(STALL_CHECK_INTERVAL, self.stall_timeout))
+            current = await loop.run_in_executor(None, tree_activity, self.process.pid)
+            if current != counter:
+                counter = current
+                self.last_activity = loop.time()
+            idle = loop.time() - self.last_activity
+            if not self.stopped and idle >= self.stall_timeout:
+                raise ProcessStalled(self.phase, idle)
+
+    async def pause(self, owner=USER):
+        """
+        Hält den Prozessbaum mit SIGSTOP an. Aufruf in der Ereignisschleife.
+
+        :param owner: Auslöser; der Prozess läuft erst weiter, wenn alle Auslöser resume() aufgerufen haben
+        :return: True, wenn der Prozess angehalten wurde
+        """
+        if self.signal_lock is None:
+            return False
+        async with self.signal_lock:
+            if owner in self.pause_owners or self.process.returncode is not None:
+                return False
+            if not self.stopped:
+                if not await signal_tree(self.process.pid, signal.SIGSTOP):
+                    # Teilweise angehaltene Prozesse nicht hängen lassen
+                    await signal_tree(self.process.pid, signal.SIGCONT)
+                    return False
+                self.paused_at = asyncio.get_running_loop().time()
+            self.pause_owners.add(owner)
+            return True
+
+    async def resume(self, owner=USER):
+        """
+        Setzt den Prozessbaum mit SIGCONT fort. Das Zeitlimit der Phase verlängert sich um die Pause.
+
+        :param owner: Auslöser wie bei pause()
+        :return: True, wenn der Auslöser entfernt wurde
+        """
+        if self.signal_lock is None:
+            return False
+        async with self.signal_lock:
+            if owner not in self.pause_owners:
+                return False
+            self.pause_owners.discard(owner)
+            if self.pause_owners:
+                return True
+            if self.process.returncode is None and not await signal_tree(self.process.pid, signal.SIGCONT):
+                self.pause_owners.add(owner)
+                return False
+            now = asyncio.get_running_loop().time()
+            self.phase_started += now - self.paused_at
+            self.last_activity = now
+            self.paused_at = None
+            self.phase_changed.set()
+            return True
+
+    async def terminate(self):
+        """
+        Beendet den Prozessbaum (SIGTERM, nach TERMINATE_GRACE Sekunden SIGKILL).
+        """
+        if self.process is None or self.process.returncode is not None:
+            return
+        for owner in list(self.pause_owners):
+            # Angehaltene Prozesse verarbeiten SIGTERM erst nach SIGCONT (z.B. der cleanup-Trap von pishrink.sh)
+            await self.resume(owner)
+        loop = asyncio.get_running_loop()
+        known = set()
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            # Bekannte Nachkommen behalten: endet sudo zuerst, hängen sie nicht mehr am Baum
+            known.update(child for child, _ in await loop.run_in_executor(None, process_tree, self.process.pid))
+            if not await signal_pids(sorted(known), sig):
+                # z.B. ohne passende sudo-Rechte: wenigstens den direkten Kindprozess signalisieren
+                try:
+                    self.process.send_signal(sig)
+                except ProcessLookupError:
+                    return
+            try:
+                await asyncio.wait_for(self.process.wait(), TERMINATE_GRACE)
+                return
+            except asyncio.TimeoutError:
+                logger.warning(f"[RUNNER] Prozess {self.process.pid} reagiert nicht auf {sig.name}")
+
+
+class ProcessHandle:
+    """
+    Verweis auf einen Prozess in der Ereignisschleife, nutzbar aus beliebigen Threads.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.task = None
+        self.future = concurrent.futures.Future()
+
+    def cancel(self):
+        """
+        Bricht den Prozess ab. result() liefert danach ProcessCancelled, sobald er beendet ist.
+        """
+        self.loop.call_soon_threadsafe(lambda: self.task and self.task.cancel())
+
+    def result(self, timeout=None):
+        """
+        Wartet auf das Ende des Prozesses.
+
+        :return: Rückgabewert des Prozesses
+        :raises ProcessCancelled: nach cancel()
+        :raises PhaseTimeout: bei überschrittenem Zeitlimit
+        """
+        return self.future.result(timeout)
+
+    def _done(self, task):
+        if task.cancelled():
+            self.future.set_exception(ProcessCancelled())
+        elif task.exception() is not None:
+            self.future.set_exception(task.exception())
+        else:
+            self.future.set_result(task.result())
+
+
+class AsyncRunner:
+    """
+    Besitzt die Ereignisschleife und ihren Thread; wird beim ersten Prozess gestartet.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+
+    def ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="async-runner", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def start(self, coroutine):
+        """
+        Startet eine Coroutine (z.B. AsyncProcess.run() oder ShrinkJob.run_async()) in der Ereignisschleife.
+
+        :param coroutine: Coroutine-Objekt
+        :return: ProcessHandle
+        """
+        loop = self.ensure_loop()
+        handle = ProcessHandle(loop)
+
+        def create_task():
+            handle.task = loop.create_task(coroutine)
+            handle.task.add_done_callback(handle._done)
+
+        loop.call_soon_threadsafe(create_task)
+        return handle
+
+    def run(self, coroutine):
+        """
+        Führt eine Coroutine aus und wartet blockierend auf das Ergebnis.
+        """
+        return self.start(coroutine).result()
+
+
+_runner = AsyncRunner()
+
+
+def get_runner():
+    """
+    :return: Die gemeinsame AsyncRunner-Instanz
+    """
+    return _runner
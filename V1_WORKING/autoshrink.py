@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# V0.1a/autoshrink.py
+"""
+Kommandozeile für den Shrink ohne GUI (z.B. um einen Rückstau abzuarbeiten oder per cron).
+
+    python3 autoshrink.py batch /media/raphi/hdd/backups/raspiHauptDD/raspihaupt --jobs 3 --compress xz --since 7d
+    python3 autoshrink.py batch "/media/raphi/hdd/backups/**/*.img" --dry-run
+    python3 autoshrink.py batch /pfad --summary ergebnis.json
+
+Pro Image wird bei jedem Phasenwechsel eine Fortschrittszeile ausgegeben,
+am Ende eine JSON-Zusammenfassung auf stdout.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from log_handler import logger, console_handler  # Zentralen Logger importieren
+from config import SETTINGS_FILE, get_config
+from backup_roots import DeviceLimiter
+from progress_parser import format_progress
+from shrink_api import ShrinkResult, shrink_image
+from shrink_history import image_size
+from shrink_utils import delete_old_backups
+from memory_budget import MemoryBudget
+from space_budget import InsufficientSpace, SpaceBudget, space_needed
+
+COMPRESS_OPTIONS = {'none': [], 'gzip': ['-z'], 'xz': ['-Z']}
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(text):
+    """
+    Wandelt eine Zeitangabe wie '7d', '12h' oder '90m' in Sekunden um.
+
+    :param text: Zeitangabe (ohne Einheit: Sekunden)
+    :return: Sekunden
+    :raises argparse.ArgumentTypeError: bei ungültiger Angabe
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*', text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Ungültige Zeitangabe: {text} (z.B. 7d, 12h, 90m)")
+    return float(match.group(1)) * DURATION_UNITS.get(match.group(2) or 's')
+
+
+def find_images(paths, since=None):
+    """
+    Sammelt Images aus Verzeichnissen (rekursiv), Glob-Mustern oder einzelnen Dateien.
+
+    :param paths: Liste von Pfaden bzw. Mustern
+    :param since: Nur Images, die in den letzten 'since' Sekunden geändert wurden
+    :return: Sortierte Liste eindeutiger Image-Pfade (älteste zuerst)
+    """
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                found.update(os.path.join(root, f) for f in files if f.endswith('.img'))
+        elif glob.has_magic(path):
+            found.update(p for p in glob.glob(path, recursive=True) if p.endswith('.img') and os.path.isfile(p))
+        elif os.path.isfile(path):
+            found.add(path)
+        else:
+            logger.warning(f"[BATCH] Pfad nicht gefunden: {path}")
+    images = []
+    cutoff = time.time() - since if since else None
+    for path in found:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if cutoff is None or mtime >= cutoff:
+            images.append((mtime, os.path.realpath(path)))
+    return [path for _, path in sorted(images)]
+
+
+class BatchRunner:
+    """
+    Führt ShrinkJobs für eine Liste von Images in einem Thread-Pool aus.
+    """
+
+    def __init__(self, images, settings, jobs=1, per_device=1, stream=None, settings_file=SETTINGS_FILE):
+        self.images = images
+        self.settings = settings
+        self.settings_file = settings_file
+        self.jobs = jobs
+        self.limiter = DeviceLimiter(per_device)
+        # --jobs 3 mit 'xz -T0' braucht auf einem Pi schnell mehr Speicher, als vorhanden ist
+        self.memory_budget = MemoryBudget(settings.get('memory_budget_mb'), settings.get('memory_reserve_mb', 256))
+        self.space_budget = SpaceBudget(min_free_mib=settings.get('min_free_space_mb', 1024))
+        self.stream = stream or sys.stderr
+        self.print_lock = threading.Lock()
+        self.results = []
+
+    def print_line(self, index, img_path, text):
+        with self.print_lock:
+            self.stream.write(f"[{index}/{len(self.images)}] {os.path.basename(img_path)}: {text}\n")
+            self.stream.flush()
+
+    def make_room(self, img_path):
+        # Aufbewahrung vorziehen, falls der Batch löschen darf (--delete)
+        if not self.settings.get('delete_backups', False):
+            return False
+        return delete_old_backups(img_path, self.settings.get('delete_hours', 168)) > 0
+
+    def run_one(self, index, img_path):
+        last_phase = [None]
+
+        def on_progress(event):
+            # Eine Zeile pro Phase statt pro Prozentschritt, damit die Ausgabe für cron lesbar bleibt
+            if event.phase != last_phase[0]:
+                last_phase[0] = event.phase
+                self.print_line(index, img_path, format_progress(event))
+
+        def on_wait(reason):
+            # Nur den Beginn des Wartens melden, nicht jede erneute Prüfung (Speicherplatz, Arbeitsspeicher)
+            if reason and not last_phase[0]:
+                last_phase[0] = 'waiting'
+                self.print_line(index, img_path, reason)
+
+        options = self.settings['pishrink_options']
+        try:
+            # Ohne anderen laufenden Job auf dem Laufwerk sofort fehlschlagen statt ewig zu warten (cron)
+            with self.limiter.semaphore(img_path), \
+                    self.space_budget.admit(img_path, space_needed(img_path, options), on_wait=on_wait,
+                                            make_room=lambda: self.make_room(img_path), wait=False), \
+                    self.memory_budget.admit(img_path, options, image_size(img_path),
+                                             on_wait=on_wait) as threads:
+                self.print_line(index, img_path, "gestartet")
+                result = shrink_image(img_path, on_progress=on_progress, settings=self.settings,
+                                      settings_file=self.settings_file, compress_threads=threads)
+        except InsufficientSpace as e:
+            self.print_line(index, img_path, str(e))
+            size = image_size(img_path)
+            result = ShrinkResult(img_path, -1, size, size, 0.0, {}, [str(e)], False)
+        result = result._replace(seconds=round(result.seconds, 1),
+                                 phases={phase: round(seconds, 1) for phase, seconds in result.phases.items()})
+        if result.skipped:
+            status = f"übersprungen ({result.skipped})"
+        else:
+            status = "fertig" if result.returncode == 0 else f"fehlgeschlagen ({result.returncode})"
+        self.print_line(index, img_path, f"{status} nach {result.seconds} s")
+        return result._asdict()
+
+    def run(self):
+        """
+        :return: Zusammenfassung als Dict
+        """
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(self.run_one, index, img_path)
+                       for index, img_path in enumerate(self.images, start=1)]
+            self.results = [future.result() for future in futures]
+        skipped = [r for r in self.results if r['skipped']]
+        failed = [r for r in self.results if r['returncode'] != 0 and not r['skipped']]
+        saved = sum(r['bytes_before'] - r['bytes_after'] for r in self.results
+                    if r['returncode'] == 0 and r['bytes_before'] and r['bytes_after'] is not None)
+        return {
+            'images': len(self.results),
+            'succeeded': len(self.results) - len(failed) - len(skipped),
+            'failed': len(failed),
+            'skipped': len(skipped),
+            'bytes_saved': saved,
+            'wall_seconds': round(time.monotonic() - started, 1),
+            'results': self.results,
+        }
+
+
+def batch_main(args):
+    images = find_images(args.paths, args.since)
+    if not images:
+        logger.info("[BATCH] Keine passenden Images gefunden.")
+    if args.dry_run:
+        print(json.dumps({'images': images}, indent=4))
+        return 0
+
+    settings = get_config(args.settings).snapshot()
+    if args.compress is not None:
+        options = [opt for opt in settings['pishrink_options'] if opt not in ('-z', '-Z')]
+        settings['pishrink_options'] = options + COMPRESS_OPTIONS[args.compress]
+    if args.parallel_compress and '-a' not in settings['pishrink_options']:
+        settings['pishrink_options'].append('-a')
+    if not args.delete:
+        # Löschen alter Backups nur auf ausdrücklichen Wunsch, ein Batch soll nichts entfernen
+        settings['delete_backups'] = False
+
+    runner = BatchRunner(images, settings, jobs=args.jobs, per_device=args.per_device, settings_file=args.settings)
+    summary = runner.run()
+    output = json.dumps(summary, indent=4)
+    print(output)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(output + "\n")
+    return 0 if summary['failed'] == 0 else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='autoshrink', description="Auto DD Shrinker ohne GUI")
+    parser.add_argument('--settings', default=SETTINGS_FILE, help="Pfad zur Einstellungsdatei")
+    parser.add_argument('--verbose', action='store_true', help="Log-Meldungen auch auf der Konsole ausgeben")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch_parser = subparsers.add_parser('batch', help="Mehrere Images nacheinander bzw. parallel shrinken")
+    batch_parser.add_argument('paths', nargs='+', help="Verzeichnisse, Glob-Muster oder .img-Dateien")
+    batch_parser.add_argument('--jobs', type=int, default=1, help="Gleichzeitige Shrinks insgesamt")
+    batch_parser.add_argument('--per-device', type=int, default=1, help="Gleichzeitige Shrinks pro Laufwerk")
+    batch_parser.add_argument('--compress', choices=sorted(COMPRESS_OPTIONS), default=None,
+                              help="Komprimierung (Standard: aus den Einstellungen)")
+    batch_parser.add_argument('--parallel-compress', action='store_true', help="Mit mehreren Kernen komprimieren (-a)")
+    batch_parser.add_argument('--since', type=parse_duration, default=None,
+                              help="Nur Images, die in diesem Zeitraum geändert wurden, z.B. 7d")
+    batch_parser.add_argument('--delete', action='store_true',
+                              help="Alte Backups gemäß den Einstellungen löschen")
+    batch_parser.add_argument('--summary', default=None, help="JSON-Zusammenfassung zusätzlich in Datei schreiben")
+    batch_parser.add_argument('--dry-run', action='store_true', help="Nur gefundene Images auflisten")
+
+    args = parser.parse_args()
+    if not args.verbose:
+        # Die Log-Datei erhält weiterhin alles, die Konsole nur Warnungen und Fehler
+        console_handler.setLevel(logging.WARNING)
+    if args.command == 'batch':
+        return batch_main(args)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,49 @@
 # V0.1a/backup_monitor.py
 import os
-import time
 import threading
 import re
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from PyQt5.QtCore import pyqtSignal, QObject
 from log_handler import logger  # Zentralen Logger importieren
+from metrics import EVENTS_RECEIVED, EVENTS_DROPPED
+from folder_tracker import FolderTracker, WATCHING, FAILED
 
-class WorkerSignals(QObject):
-    new_image = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
+class Signal:
+    """
+    Qt-freier Ersatz für pyqtSignal: Callbacks werden im Thread des Aufrufers ausgeführt.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    def connect(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def disconnect(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def emit(self, *args):
+        with self.lock:
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"[ERROR] Fehler in Signal-Callback {callback}: {e}")
+
+class MonitorSignals:
+    """
+    Signale des BackupEventHandlers ohne Qt (für den Daemon).
+    Die Tray-Anwendung verwendet stattdessen qt_signals.WorkerSignals mit derselben Schnittstelle.
+    """
+
+    def __init__(self):
+        self.new_image = Signal()
+        self.error_occurred = Signal()
+        self.shrink_progress = Signal()  # Image-Pfad, ProgressEvent
 
 class BackupEventHandler(FileSystemEventHandler):
     def __init__(self, signals, backup_folder, backup_pattern):
@@ -18,7 +51,13 @@ class BackupEventHandler(FileSystemEventHandler):
         self.signals = signals
         self.backup_folder = backup_folder
         self.backup_pattern = backup_pattern
-        self.monitored_folders = set()
+        # Begrenzte Zustände statt eines wachsenden Sets, siehe folder_tracker.py
+        self.tracker = FolderTracker(self.emit_images, self.signals.error_occurred.emit)
+
+    @property
+    def waiting_folders(self):
+        # Backup-Ordner, deren Backup noch läuft (kein raspiBackup.log)
+        return self.tracker.folders(WATCHING)
 
     def on_created(self, event):
         self.process_event(event)
@@ -28,39 +67,51 @@ class BackupEventHandler(FileSystemEventHandler):
 
     def process_event(self, event):
         logger.debug(f"[EVENT] Event erkannt: {event.src_path}")
+        EVENTS_RECEIVED.inc(type=event.event_type)
         try:
             if event.is_directory:
                 folder_name = os.path.basename(event.src_path)
                 if re.match(self.backup_pattern, folder_name):
-                    if event.src_path not in self.monitored_folders:
-                        self.monitored_folders.add(event.src_path)
-                        threading.Thread(target=self.monitor_new_folder, args=(event.src_path,), daemon=True).start()
+                    self.arm_folder(event.src_path)
+                else:
+                    EVENTS_DROPPED.inc(reason='ignored')
             else:
-                if os.path.basename(event.src_path) == "raspiBackup.log":
-                    folder_path = os.path.dirname(event.src_path)
-                    if folder_path not in self.monitored_folders:
-                        folder_name = os.path.basename(folder_path)
-                        if re.match(self.backup_pattern, folder_name):
-                            self.monitored_folders.add(folder_path)
-                            threading.Thread(target=self.monitor_new_folder, args=(folder_path,), daemon=True).start()
+                file_name = os.path.basename(event.src_path)
+                folder_path = os.path.dirname(event.src_path)
+                if file_name == "raspiBackup.log":
+                    if re.match(self.backup_pattern, os.path.basename(folder_path)):
+                        self.arm_folder(folder_path)
+                    else:
+                        EVENTS_DROPPED.inc(reason='ignored')
+                elif file_name.endswith('.img') and self.tracker.state(folder_path) == FAILED:
+                    # Verspätet geschriebenes Image: fehlgeschlagenen Ordner erneut überwachen
+                    self.arm_folder(folder_path)
+                else:
+                    self.tracker.touch(folder_path)  # Backup schreibt noch, WATCH_TIMEOUT verlängern
+                    EVENTS_DROPPED.inc(reason='ignored')
         except Exception as e:
+            EVENTS_DROPPED.inc(reason='error')
             error_message = f"Fehler bei der Verarbeitung des Ereignisses {event.src_path}: {e}"
             logger.error(f"[ERROR] {error_message}")
             self.signals.error_occurred.emit(error_message)
 
-    def monitor_new_folder(self, folder_path):
-        log_file_path = os.path.join(folder_path, "raspiBackup.log")
-        while True:
-            if os.path.exists(log_file_path):
-                logger.info(f"[FOUND] raspiBackup.log gefunden: {log_file_path}")
-                time.sleep(10)  # Warten, bis das Log-File vollständig geschrieben ist
-                img_files = [f for f in os.listdir(folder_path) if f.endswith('.img')]
-                if img_files:
-                    for img_file in img_files:
-                        img_path = os.path.join(folder_path, img_file)
-                        self.signals.new_image.emit(img_path)
-                else:
-                    logger.warning(f"[WARNING] Keine .img-Datei im Ordner gefunden: {folder_path}")
-                break
-            else:
-                time.sleep(5)
+    def arm_folder(self, folder_path):
+        """
+        Nimmt einen Backup-Ordner in die Überwachung auf.
+
+        :param folder_path: Backup-Ordner
+        :return: False, wenn der Ordner bereits überwacht wird oder erledigt ist
+        """
+        if not self.tracker.arm(folder_path):
+            EVENTS_DROPPED.inc(reason='duplicate')
+            return False
+        self.start_monitoring_folder(folder_path)
+        return True
+
+    def start_monitoring_folder(self, folder_path):
+        # Ein gemeinsamer Thread prüft alle Ordner (FolderTracker.run)
+        self.tracker.start()
+
+    def emit_images(self, folder_path, img_paths):
+        for img_path in img_paths:
+            self.signals.new_image.emit(img_path)
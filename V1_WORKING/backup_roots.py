@@ -0,0 +1,149 @@
+# V0.1a/backup_roots.py
+"""
+Backup-Wurzelverzeichnisse mit eigenem Ordnermuster, eigenen Shrink-Optionen,
+eigener Aufbewahrung und eigener Worker-Anzahl.
+
+Beispiel in settings.json (mehrere Pis auf zwei Platten):
+
+    "backup_roots": [
+        {"path": "/media/raphi/hdd/backups/raspiHauptDD/raspihaupt",
+         "pattern": "raspihaupt-dd-backup-(\\d{8})-(\\d{6})",
+         "pishrink_options": ["-z"], "delete_backups": true, "delete_hours": 250, "workers": 1},
+        {"path": "/media/raphi/hdd2/backups/pihole",
+         "pattern": "pihole-dd-backup-(\\d{8})-(\\d{6})", "delete_hours": 336}
+    ],
+    "disk_workers": 1
+
+Verzeichnisse aus 'backup_folders' ohne eigenen Eintrag verwenden die globalen Einstellungen.
+Wurzeln auf verschiedenen Platten shrinken parallel, Wurzeln auf derselben Platte teilen
+sich 'disk_workers' gleichzeitige Shrinks.
+"""
+import os
+import re
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+from config import coerce
+from shrink_utils import BACKUP_PATTERN
+from schedule_policy import disk_of
+
+# Einstellungen, die pro Wurzel überschrieben werden können
+ROOT_OVERRIDES = ('pishrink_options', 'logging_enabled', 'delete_backups', 'delete_hours')
+
+
+class BackupRoot:
+    """
+    Ein überwachtes Backup-Verzeichnis und seine Richtlinien.
+    """
+
+    def __init__(self, path, pattern=BACKUP_PATTERN, workers=None, overrides=None):
+        """
+        :param path: Backup-Verzeichnis, in dem raspiBackup die Backup-Ordner anlegt
+        :param pattern: Regulärer Ausdruck für die Backup-Ordner (Datums- und Zeitgruppe)
+        :param workers: Gleichzeitige Shrinks dieser Wurzel (None: 'shrink_workers')
+        :param overrides: Einstellungen, die für Jobs dieser Wurzel die globalen ersetzen
+        :raises ValueError: bei ungültigem Muster oder ungültigen Einstellungen
+        """
+        self.path = path
+        self.realpath = os.path.realpath(path)
+        try:
+            self.regex = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"{path}: ungültiges Muster {pattern!r}: {e}")
+        if self.regex.groups < 2:
+            # delete_old_backups und die Platzprognose lesen Datum und Uhrzeit aus group(1) und group(2)
+            raise ValueError(f"{path}: Muster {pattern!r} braucht zwei Gruppen (Datum und Uhrzeit)")
+        self.pattern = pattern
+        self.workers = coerce('shrink_workers', workers)
+        self.overrides = {key: coerce(key, value) for key, value in (overrides or {}).items()
+                          if key in ROOT_OVERRIDES and value is not None}
+
+    @classmethod
+    def from_dict(cls, entry):
+        if isinstance(entry, str):
+            return cls(entry)
+        if not isinstance(entry, dict) or not entry.get('path'):
+            raise ValueError(f"Eintrag ohne 'path': {entry!r}")
+        return cls(entry['path'], entry.get('pattern') or BACKUP_PATTERN, entry.get('workers'),
+                   {key: entry.get(key) for key in ROOT_OVERRIDES})
+
+    def to_dict(self):
+        return dict(self.overrides, path=self.path, pattern=self.pattern, workers=self.workers)
+
+    def __eq__(self, other):
+        return isinstance(other, BackupRoot) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"BackupRoot({self.path!r})"
+
+    def contains(self, path):
+        """
+        :param path: Pfad einer Datei oder eines Ordners
+        :return: True, wenn der Pfad unterhalb dieser Wurzel liegt
+        """
+        return os.path.realpath(path).startswith(self.realpath.rstrip(os.sep) + os.sep)
+
+    def matches_folder(self, folder_name):
+        return self.regex.match(folder_name) is not None
+
+    def job_settings(self, settings):
+        """
+        :param settings: Globale Einstellungen
+        :return: Einstellungen für einen Job dieser Wurzel
+        """
+        merged = dict(settings)
+        merged.update(self.overrides)
+        return merged
+
+
+def load_roots(settings):
+    """
+    Ermittelt die Backup-Wurzeln aus 'backup_roots' und 'backup_folders'.
+
+    Fehlerhafte Einträge werden protokolliert und übersprungen.
+
+    :param settings: Dict der Einstellungen
+    :return: Liste von BackupRoot (ohne doppelte Pfade)
+    """
+    roots = []
+    seen = set()
+    entries = list(settings.get('backup_roots') or []) + list(settings.get('backup_folders') or [])
+    for entry in entries:
+        try:
+            root = BackupRoot.from_dict(entry)
+        except ValueError as e:
+            logger.error(f"[CONFIG ERROR] Ungültige Backup-Wurzel übersprungen: {e}")
+            continue
+        if root.realpath not in seen:
+            seen.add(root.realpath)
+            roots.append(root)
+    return roots
+
+
+def root_for_path(roots, path):
+    """
+    :param roots: Liste von BackupRoot
+    :param path: Pfad eines Images oder Backup-Ordners
+    :return: Die am tiefsten verschachtelte Wurzel, die den Pfad enthält, oder None
+    """
+    matching = [root for root in roots if root.contains(path)]
+    return max(matching, key=lambda root: len(root.realpath)) if matching else None
+
+
+class DeviceLimiter:
+    """
+    Begrenzt die gleichzeitigen Jobs pro physischer Platte, damit parallele Shrinks auf
+    derselben Platte sich nicht gegenseitig ausbremsen. Partitionen derselben Platte
+    teilen sich ein Budget (siehe disk_of).
+    """
+
+    def __init__(self, per_device):
+        self.per_device = per_device
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    def semaphore(self, path):
+        device = disk_of(path)
+        with self.lock:
+            if device not in self.semaphores:
+                self.semaphores[device] = threading.BoundedSemaphore(self.per_device)
+            return self.semaphores[device]
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# V0.1a/benchmarks/backup_simulator.py
+"""
+Simuliert raspiBackup-Läufe in einem temporären Verzeichnis und misst den BackupEventHandler.
+
+Jeder simulierte Lauf legt wie raspiBackup einen Ordner
+raspihaupt-dd-backup-YYYYMMDD-HHMMSS an, schreibt ein großes, dünn besetztes
+(sparse) .img mit fester Datenrate und danach schrittweise die raspiBackup.log.
+Die Schreiber laufen in eigenen Prozessen, damit CPU-Zeit und Threads des
+Messprozesses nur Observer und Handler enthalten.
+
+Gemessen werden Erkennungslatenz (Ende des Backups bis new_image), CPU-Zeit des
+Messprozesses, Spitzenzahl der Threads und die Anzahl der Dateisystem-Ereignisse.
+
+Beispiele:
+    python3 benchmarks/backup_simulator.py --backups 1 --size 4G --rate 200M
+    python3 benchmarks/backup_simulator.py --backups 4 --bursts 3 --burst-interval 5 --log-during
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import datetime
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from watchdog.observers import Observer  # noqa: E402
+from log_handler import logger  # noqa: E402
+from backup_monitor import BackupEventHandler  # noqa: E402
+from shrink_utils import BACKUP_PATTERN  # noqa: E402
+from metrics import EVENTS_RECEIVED, EVENTS_DROPPED  # noqa: E402
+
+CHUNK = 2**20  # Schreibblock 1 MiB
+
+
+def parse_size(text):
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def simulate_backup(root, moment, size, rate, data_ratio, log_lines, log_during, done_queue):
+    """
+    Schreibt einen Backup-Ordner wie raspiBackup (läuft in einem eigenen Prozess).
+
+    :param root: Backup-Verzeichnis
+    :param moment: Zeitstempel für den Ordnernamen
+    :param size: Scheinbare Größe des Images in Bytes
+    :param rate: Schreibrate in Bytes pro Sekunde (bezogen auf die scheinbare Größe)
+    :param data_ratio: Anteil tatsächlich geschriebener Daten (Rest bleibt Loch)
+    :param log_lines: Anzahl Zeilen der raspiBackup.log
+    :param log_during: Log bereits während des Image-Schreibens füllen
+    :param done_queue: Queue für (Image-Pfad, Endzeitpunkt)
+    """
+    name = moment.strftime("raspihaupt-dd-backup-%Y%m%d-%H%M%S")
+    folder = os.path.join(root, name)
+    os.makedirs(folder)
+    img_path = os.path.join(folder, name + ".img")
+    log_path = os.path.join(folder, "raspiBackup.log")
+    data = os.urandom(CHUNK)
+    data_every = max(1, round(1 / data_ratio)) if data_ratio > 0 else 0
+    started = time.monotonic()
+    log_written = 0
+
+    with open(img_path, 'wb') as img:
+        position = 0
+        block = 0
+        while position < size:
+            length = min(CHUNK, size - position)
+            if data_every and block % data_every == 0:
+                img.seek(position)
+                img.write(data[:length])
+                img.flush()
+            position += length
+            block += 1
+            if log_during and log_written < log_lines and block % 64 == 0:
+                with open(log_path, 'a') as log:
+                    log.write(f"{datetime.datetime.now():%Y%m%d-%H%M%S} --- RBK0085I: Backup Fortschritt {position}\n")
+                log_written += 1
+            # Schreibrate einhalten
+            delay = started + position / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        img.truncate(size)
+
+    # raspiBackup schreibt sein Log am Ende schrittweise in den Backup-Ordner
+    while log_written < log_lines:
+        with open(log_path, 'a') as log:
+            log.write(f"{datetime.datetime.now():%Y%m%d-%H%M%S} --- RBK0033I: Schritt {log_written}\n")
+        log_written += 1
+        time.sleep(0.01)
+    done_queue.put((img_path, time.time()))
+
+
+class RecordingSignals:
+    """
+    Ersatz für WorkerSignals, der die Zeitpunkte der Emissionen festhält.
+    """
+
+    class Signal:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.calls = []
+
+        def emit(self, *args):
+            with self.lock:
+                self.calls.append((time.time(), args))
+
+    def __init__(self):
+        self.new_image = self.Signal()
+        self.error_occurred = self.Signal()
+        self.shrink_progress = self.Signal()
+
+
+def counter_total(counter):
+    with counter.lock:
+        return sum(counter.values.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Last-Simulator für den BackupEventHandler")
+    parser.add_argument('--backups', type=int, default=1, help="Gleichzeitige Backups pro Burst")
+    parser.add_argument('--bursts', type=int, default=1, help="Anzahl Bursts")
+    parser.add_argument('--burst-interval', type=float, default=10.0, help="Abstand der Bursts in Sekunden")
+    parser.add_argument('--size', default='2G', help="Scheinbare Imagegröße, z.B. 4G")
+    parser.add_argument('--rate', default='100M', help="Schreibrate pro Backup in Bytes/s, z.B. 200M")
+    parser.add_argument('--data-ratio', type=float, default=0.05, help="Anteil tatsächlich geschriebener Blöcke")
+    parser.add_argument('--log-lines', type=int, default=200, help="Zeilen der raspiBackup.log")
+    parser.add_argument('--log-during', action='store_true', help="Log schon während des Schreibens füllen")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Maximale Wartezeit auf die Erkennung")
+    parser.add_argument('--root', default=None, help="Backup-Verzeichnis (Standard: temporär)")
+    parser.add_argument('--output', default=None, help="Ergebnisse als JSON speichern")
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='backup-sim-')
+    os.makedirs(root, exist_ok=True)
+    size = parse_size(args.size)
+    rate = parse_size(args.rate)
+
+    signals = RecordingSignals()
+    handler = BackupEventHandler(signals, [root], BACKUP_PATTERN)
+    observer = Observer()
+    observer.schedule(handler, root, recursive=True)
+    observer.start()
+
+    threads_peak = threading.active_count()
+    stop_sampling = threading.Event()
+
+    def sample_threads():
+        nonlocal threads_peak
+        while not stop_sampling.wait(0.2):
+            threads_peak = max(threads_peak, threading.active_count())
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+
+    events_before = counter_total(EVENTS_RECEIVED)
+    dropped_before = counter_total(EVENTS_DROPPED)
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.time()
+
+    done_queue = multiprocessing.Queue()
+    writers = []
+    base = datetime.datetime.now().replace(microsecond=0)
+    for burst in range(args.bursts):
+        if burst:
+            time.sleep(args.burst_interval)
+        for index in range(args.backups):
+            # Ordnernamen müssen eindeutig sein: Sekunden hochzählen
+            moment = base + datetime.timedelta(seconds=burst * args.backups + index)
+            writer = multiprocessing.Process(target=simulate_backup, args=(
+                root, moment, size, rate, args.data_ratio, args.log_lines, args.log_during, done_queue))
+            writer.start()
+            writers.append(writer)
+    logger.info(f"[SIM] {len(writers)} simulierte Backups gestartet in {root}")
+
+    finished = {}
+    for _ in writers:
+        img_path, end_time = done_queue.get()
+        finished[img_path] = end_time
+    for writer in writers:
+        writer.join()
+
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        detected = {call_args[0] for _, call_args in signals.new_image.calls}
+        if set(finished) <= detected:
+            break
+        time.sleep(0.2)
+
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    stop_sampling.set()
+    observer.stop()
+    observer.join()
+
+    first_detection = {}
+    emissions = {}
+    for emit_time, call_args in signals.new_image.calls:
+        path = call_args[0]
+        emissions[path] = emissions.get(path, 0) + 1
+        first_detection.setdefault(path, emit_time)
+    latencies = sorted(first_detection[path] - end for path, end in finished.items() if path in first_detection)
+
+    results = {
+        'backups': len(writers),
+        'size_bytes': size,
+        'rate_bytes_per_second': rate,
+        'wall_seconds': time.time() - started,
+        'detected': len(latencies),
+        'missed': len(finished) - len(latencies),
+        'duplicate_emissions': sum(count - 1 for count in emissions.values() if count > 1),
+        'latency_seconds': {
+            'min': latencies[0] if latencies else None,
+            'median': latencies[len(latencies) // 2] if latencies else None,
+            'max': latencies[-1] if latencies else None,
+        },
+        'cpu_user_seconds': usage_after.ru_utime - usage_before.ru_utime,
+        'cpu_system_seconds': usage_after.ru_stime - usage_before.ru_stime,
+        'threads_peak': threads_peak,
+        'events_received': counter_total(EVENTS_RECEIVED) - events_before,
+        'events_dropped': counter_total(EVENTS_DROPPED) - dropped_before,
+        'errors': len(signals.error_occurred.calls),
+    }
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.root is None:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0 if results['missed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
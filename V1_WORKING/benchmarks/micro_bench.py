@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# V0.1a/benchmarks/micro_bench.py
+"""
+Mikro-Benchmarks für die Python-Hot-Paths von Überwachung, Log-Viewer und Aufräumen.
+
+Jeder Benchmark erzeugt seine Arbeitslast selbst (Ereignisflut, große Log-Datei,
+tausende Backup-Ordner) und misst die Laufzeit mehrerer Runden. Die schnellste
+Runde wird mit der gespeicherten Baseline verglichen, da sie am wenigsten von
+anderer Last auf dem Rechner beeinflusst wird; ist ein Benchmark um mehr als den
+Schwellwert langsamer, endet das Skript mit Rückgabewert 1.
+
+Beispiele:
+    python3 benchmarks/micro_bench.py                      # Vergleich mit baseline.json
+    python3 benchmarks/micro_bench.py --threshold 15       # strengerer Schwellwert
+    python3 benchmarks/micro_bench.py --save-baseline      # Baseline neu schreiben
+    python3 benchmarks/micro_bench.py -k process_event     # nur passende Benchmarks
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from watchdog.events import DirCreatedEvent, FileCreatedEvent, FileModifiedEvent  # noqa: E402
+from PyQt5 import QtWidgets  # noqa: E402
+from log_handler import logger  # noqa: E402
+from backup_monitor import BackupEventHandler  # noqa: E402
+from shrink_utils import BACKUP_PATTERN, delete_old_backups  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+LEVELS = ['DEBUG', 'INFO', 'INFO', 'INFO', 'WARNING', 'ERROR']
+
+
+class SignalSink:
+    """
+    Ersatz für WorkerSignals, der Emissionen nur zählt.
+    """
+
+    class Signal:
+        def __init__(self):
+            self.count = 0
+
+        def emit(self, *args):
+            self.count += 1
+
+    def __init__(self):
+        self.new_image = self.Signal()
+        self.error_occurred = self.Signal()
+        self.shrink_progress = self.Signal()
+
+
+def backup_folder_name(moment):
+    return moment.strftime("raspihaupt-dd-backup-%Y%m%d-%H%M%S")
+
+
+def make_event_flood(root, count, seed=0):
+    """
+    Erzeugt eine Ereignisflut wie beim Schreiben eines Images durch raspiBackup.
+
+    :param root: Backup-Verzeichnis
+    :param count: Anzahl Ereignisse
+    :param seed: Startwert für den Zufallsgenerator
+    :return: Tupel (Liste der Ereignisse, Pfad des bereits überwachten Ordners)
+    """
+    rng = random.Random(seed)
+    folder = os.path.join(root, backup_folder_name(datetime.datetime(2024, 1, 1, 3, 0, 0)))
+    img = os.path.join(folder, "raspihaupt-dd-backup-20240101-030000.img")
+    events = []
+    for index in range(count):
+        roll = rng.random()
+        if roll < 0.90:
+            events.append(FileModifiedEvent(img))
+        elif roll < 0.95:
+            events.append(FileModifiedEvent(os.path.join(folder, "raspiBackup.log")))
+        elif roll < 0.98:
+            events.append(FileCreatedEvent(os.path.join(folder, f"tmp{index}.msg")))
+        else:
+            events.append(DirCreatedEvent(os.path.join(root, f"other-{index}")))
+    return events, folder
+
+
+def make_log_file(path, lines, seed=0):
+    """
+    Schreibt eine Log-Datei im Format des zentralen Loggers.
+
+    :param path: Zieldatei
+    :param lines: Anzahl Zeilen
+    :param seed: Startwert für den Zufallsgenerator
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    with open(path, 'w') as f:
+        for index in range(lines):
+            moment = start + datetime.timedelta(seconds=index * 7)
+            level = rng.choice(LEVELS)
+            f.write(f"{moment:%Y-%m-%d %H:%M:%S},{index % 1000:03d} - {level} - "
+                    f"[SHRINK OUTPUT] Zeile {index} resize2fs pass {index % 5} {'x' * rng.randint(0, 80)}\n")
+
+
+def make_backup_folders(root, count, old_count=0, with_logs=False):
+    """
+    Legt viele Backup-Ordner an.
+
+    :param root: Backup-Verzeichnis
+    :param count: Anzahl aktueller Ordner (werden nicht gelöscht)
+    :param old_count: Anzahl alter Ordner (älter als ein Jahr)
+    :param with_logs: In jedem Ordner eine shrink.log anlegen
+    :return: Pfad eines Images im neuesten Ordner
+    """
+    now = datetime.datetime.now()
+    newest = None
+    for index in range(count + old_count):
+        if index < old_count:
+            moment = now - datetime.timedelta(days=400, minutes=index)
+        else:
+            moment = now - datetime.timedelta(minutes=index - old_count)
+        folder = os.path.join(root, backup_folder_name(moment))
+        os.makedirs(folder, exist_ok=True)
+        if with_logs:
+            with open(os.path.join(folder, "shrink.log"), 'w') as f:
+                f.write("log\n")
+        if index == old_count:
+            newest = folder
+    return os.path.join(newest, os.path.basename(newest) + ".img")
+
+
+class Benchmark:
+    def __init__(self, name, setup, run, teardown=None, rounds=7):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.teardown = teardown
+        self.rounds = rounds
+
+    def measure(self):
+        timings = []
+        for _ in range(self.rounds):
+            state = self.setup()
+            # Wie timeit: Garbage Collection während der Messung abschalten
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                self.run(state)
+                timings.append(time.perf_counter() - started)
+            finally:
+                gc.enable()
+            if self.teardown:
+                self.teardown(state)
+        return {'min': min(timings), 'median': statistics.median(timings), 'rounds': self.rounds}
+
+
+def build_benchmarks(workdir, scale):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    from gui import LogViewer  # Erst nach QApplication importieren
+    from main import clean_old_logs
+
+    benchmarks = []
+
+    # process_event unter einer Ereignisflut
+    flood_root = os.path.join(workdir, 'flood')
+    os.makedirs(flood_root, exist_ok=True)
+    events, monitored = make_event_flood(flood_root, 50000 * scale)
+
+    def setup_flood():
+        handler = BackupEventHandler(SignalSink(), [flood_root], BACKUP_PATTERN)
+        handler.tracker.arm(monitored)
+        return handler
+
+    def run_flood(handler):
+        for event in events:
+            handler.process_event(event)
+
+    benchmarks.append(Benchmark('process_event_flood', setup_flood, run_flood))
+
+    # LogViewer.load_logs und apply_filters auf einer großen Log-Datei
+    log_root = os.path.join(workdir, 'logs')
+    os.makedirs(log_root, exist_ok=True)
+    log_file = os.path.join(log_root, 'autodds_monitor.log')
+    make_log_file(log_file, 20000 * scale)
+    viewer = LogViewer(log_file, log_root, BACKUP_PATTERN)
+
+    benchmarks.append(Benchmark('logviewer_load_logs', lambda: viewer,
+                                lambda v: v.load_logs(log_file, v.main_log_table), rounds=5))
+
+    def setup_filter():
+        viewer.search_field.blockSignals(True)
+        viewer.search_field.setText("pass 3")
+        viewer.search_field.blockSignals(False)
+        return viewer
+
+    benchmarks.append(Benchmark('logviewer_apply_filters', setup_filter, lambda v: v.apply_filters()))
+
+    # delete_old_backups über tausende Ordner (nur Prüfung, nichts zu löschen)
+    scan_root = os.path.join(workdir, 'retention_scan')
+    scan_img = make_backup_folders(scan_root, 3000 * scale)
+    benchmarks.append(Benchmark('delete_old_backups_scan', lambda: scan_img,
+                                lambda img: delete_old_backups(img, 24 * 365)))
+
+    # delete_old_backups mit tatsächlichem Löschen
+    delete_root = os.path.join(workdir, 'retention_delete')
+
+    def setup_delete():
+        shutil.rmtree(delete_root, ignore_errors=True)
+        return make_backup_folders(delete_root, 1000 * scale, old_count=1000 * scale)
+
+    benchmarks.append(Benchmark('delete_old_backups_delete', setup_delete,
+                                lambda img: delete_old_backups(img, 24 * 365), rounds=5))
+
+    # clean_old_logs über tausende Ordner mit shrink.log
+    clean_root = os.path.join(workdir, 'clean_logs')
+    make_backup_folders(clean_root, 3000 * scale, with_logs=True)
+    benchmarks.append(Benchmark('clean_old_logs', lambda: [clean_root], clean_old_logs))
+
+    benchmarks.append(app)  # Referenz halten, bis die Messung vorbei ist
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mikro-Benchmarks mit Regressionsprüfung gegen eine Baseline")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline-Datei (JSON)")
+    parser.add_argument('--threshold', type=float, default=25.0, help="Erlaubte Verlangsamung in Prozent")
+    parser.add_argument('--save-baseline', action='store_true', help="Ergebnisse als neue Baseline speichern")
+    parser.add_argument('--scale', type=int, default=1, help="Faktor für die Größe der Arbeitslasten")
+    parser.add_argument('-k', dest='keyword', default=None, help="Nur Benchmarks, deren Name dies enthält")
+    parser.add_argument('--output', default=None, help="Ergebnisse zusätzlich als JSON speichern")
+    args = parser.parse_args()
+
+    # Datensätze werden erzeugt, aber nicht in Datei oder Konsole geschrieben
+    logger.handlers = [logging.NullHandler()]
+
+    workdir = tempfile.mkdtemp(prefix='micro-bench-')
+    results = {}
+    try:
+        *benchmarks, _app = build_benchmarks(workdir, args.scale)
+        for benchmark in benchmarks:
+            if args.keyword and args.keyword not in benchmark.name:
+                continue
+            results[benchmark.name] = benchmark.measure()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('benchmarks', {})
+
+    failed = []
+    print(f"{'Benchmark':30s} {'Min (ms)':>12s} {'Median (ms)':>12s} {'Baseline (ms)':>14s} {'Änderung':>10s}")
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get('min')
+        line = f"{name:30s} {result['min'] * 1000:12.2f} {result['median'] * 1000:12.2f}"
+        if reference:
+            change = (result['min'] / reference - 1) * 100
+            line += f" {reference * 1000:14.2f} {change:+9.1f}%"
+            if change > args.threshold:
+                failed.append(name)
+                line += "  REGRESSION"
+        else:
+            line += f" {'-':>14s} {'-':>10s}"
+        print(line)
+
+    document = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'scale': args.scale,
+        'benchmarks': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=4)
+        print(f"Baseline gespeichert: {args.baseline}")
+        return 0
+    if failed:
+        print(f"Regression (> {args.threshold:.0f}% langsamer): {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
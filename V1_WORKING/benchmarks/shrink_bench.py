@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# V0.1a/benchmarks/shrink_bench.py
+"""
+End-to-End-Benchmark für den Shrink-Ablauf mit synthetischen Raspberry-Pi-Images.
+
+Die Images werden ohne Root-Rechte erzeugt (MBR in Python, FAT-Boot mit
+mkfs.vfat, ext4-Root mit mke2fs -d). Das Shrinken selbst läuft wie in der
+Anwendung über "sudo bash pishrink.sh", da losetup Root-Rechte benötigt.
+
+Beispiel:
+    python3 benchmarks/shrink_bench.py --sizes 2G,4G --fill 0.3,0.7 --mix mixed \\
+        --options "-s" "-s -z" "-s -Z" "-s -a -z" --output results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shlex
+import struct
+import shutil
+import socket
+import argparse
+import datetime
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from progress_parser import ProgressParser  # noqa: E402
+
+PISHRINK_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'pishrink.sh')
+SECTOR = 512
+BOOT_START = 8192  # Sektor, wie bei Raspberry Pi OS
+BOOT_SIZE = 256 * 2**20
+
+# Dateigrößen-Mischungen: Liste aus (Anteil am Datenvolumen, minimale Größe, maximale Größe)
+FILE_MIXES = {
+    'small': [(1.0, 512, 64 * 2**10)],
+    'mixed': [(0.2, 512, 64 * 2**10), (0.5, 64 * 2**10, 4 * 2**20), (0.3, 4 * 2**20, 64 * 2**20)],
+    'large': [(1.0, 16 * 2**20, 256 * 2**20)],
+}
+
+
+def parse_size(text):
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30}
+    text = text.strip().upper()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def write_tree(root, data_bytes, mix, compressible, seed):
+    """
+    Erzeugt einen Verzeichnisbaum mit der gewünschten Datenmenge und Dateigrößenverteilung.
+
+    :param root: Zielverzeichnis
+    :param data_bytes: Gesamte Datenmenge in Bytes
+    :param mix: Schlüssel aus FILE_MIXES
+    :param compressible: Anteil gut komprimierbarer Dateien (0.0 - 1.0)
+    :param seed: Startwert für den Zufallsgenerator
+    :return: Anzahl erzeugter Dateien
+    """
+    rng = random.Random(seed)
+    random_block = os.urandom(2**20)
+    text_block = (b"Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20000)[:2**20]
+    files = 0
+    for share, min_size, max_size in FILE_MIXES[mix]:
+        remaining = int(data_bytes * share)
+        while remaining > 0:
+            size = min(remaining, rng.randint(min_size, max_size))
+            directory = os.path.join(root, f"d{files // 500:04d}")
+            os.makedirs(directory, exist_ok=True)
+            block = text_block if rng.random() < compressible else random_block
+            with open(os.path.join(directory, f"f{files:06d}.bin"), 'wb') as f:
+                written = 0
+                while written < size:
+                    chunk = min(size - written, len(block))
+                    offset = rng.randrange(0, len(block) - chunk + 1)
+                    f.write(block[offset:offset + chunk])
+                    written += chunk
+            remaining -= size
+            files += 1
+    return files
+
+
+def write_mbr(image_path, partitions):
+    """
+    Schreibt eine MBR-Partitionstabelle in das Image.
+
+    :param image_path: Pfad zum Image
+    :param partitions: Liste aus (Typ, Startsektor, Anzahl Sektoren)
+    """
+    table = b''
+    for part_type, start, count in partitions:
+        # CHS-Felder auf "LBA verwenden" (0xFE 0xFF 0xFF) setzen
+        table += struct.pack('<B3sB3sII', 0x00, b'\xfe\xff\xff', part_type, b'\xfe\xff\xff', start, count)
+    table += b'\x00' * (16 * (4 - len(partitions)))
+    with open(image_path, 'r+b') as f:
+        f.seek(440)
+        f.write(struct.pack('<I', random.getrandbits(32)) + b'\x00\x00')
+        f.write(table + b'\x55\xaa')
+
+
+def copy_sparse(source, target, offset):
+    """
+    Kopiert eine Datei an einen Offset im Ziel und überspringt dabei Löcher.
+
+    :param source: Quelldatei
+    :param target: Zieldatei
+    :param offset: Byte-Offset im Ziel
+    """
+    with open(source, 'rb') as src, open(target, 'r+b') as dst:
+        fd = src.fileno()
+        end = os.fstat(fd).st_size
+        position = 0
+        while position < end:
+            try:
+                data_start = os.lseek(fd, position, os.SEEK_DATA)
+            except OSError:
+                break  # Nur noch Loch bis zum Ende
+            data_end = os.lseek(fd, data_start, os.SEEK_HOLE)
+            src.seek(data_start)
+            dst.seek(offset + data_start)
+            remaining = data_end - data_start
+            while remaining > 0:
+                chunk = src.read(min(remaining, 8 * 2**20))
+                dst.write(chunk)
+                remaining -= len(chunk)
+            position = data_end
+
+
+def build_image(image_path, size, fill, mix, compressible, workdir, seed=0):
+    """
+    Erzeugt ein Raspberry-Pi-artiges Image (FAT-Boot + ext4-Root) ohne Root-Rechte.
+
+    :param image_path: Zielpfad des Images
+    :param size: Gesamtgröße in Bytes
+    :param fill: Füllgrad der Root-Partition (0.0 - 1.0)
+    :param mix: Schlüssel aus FILE_MIXES
+    :param compressible: Anteil gut komprimierbarer Dateien
+    :param workdir: Arbeitsverzeichnis für temporäre Dateien
+    :param seed: Startwert für den Zufallsgenerator
+    :return: Dict mit Eckdaten des Images
+    """
+    boot_sectors = BOOT_SIZE // SECTOR
+    root_start = BOOT_START + boot_sectors
+    root_sectors = size // SECTOR - root_start
+    root_bytes = root_sectors * SECTOR
+
+    with open(image_path, 'wb') as f:
+        f.truncate(size)
+    write_mbr(image_path, [(0x0c, BOOT_START, boot_sectors), (0x83, root_start, root_sectors)])
+
+    boot_path = os.path.join(workdir, 'boot.part')
+    root_path = os.path.join(workdir, 'root.part')
+    tree = tempfile.mkdtemp(prefix='tree-', dir=workdir)
+    try:
+        if os.path.exists(boot_path):
+            os.remove(boot_path)
+        subprocess.run(['mkfs.vfat', '-F', '32', '-n', 'bootfs', '-C', boot_path, str(BOOT_SIZE // 1024)],
+                       check=True, stdout=subprocess.DEVNULL)
+        files = write_tree(tree, int(root_bytes * fill), mix, compressible, seed)
+        with open(root_path, 'wb') as f:
+            f.truncate(root_bytes)
+        subprocess.run(['mke2fs', '-q', '-F', '-t', 'ext4', '-L', 'rootfs', '-d', tree, root_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        copy_sparse(boot_path, image_path, BOOT_START * SECTOR)
+        copy_sparse(root_path, image_path, root_start * SECTOR)
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+        for path in (boot_path, root_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return {'size': size, 'fill': fill, 'mix': mix, 'compressible': compressible, 'files': files}
+
+
+def run_shrink(image_path, options, use_sudo=True):
+    """
+    Führt pishrink.sh aus und misst Laufzeit, CPU, Spitzen-RSS und Block-I/O.
+
+    :param image_path: Pfad zum Image (wird verändert)
+    :param options: Liste der pishrink-Optionen
+    :param use_sudo: pishrink.sh über sudo starten
+    :return: Dict mit Messwerten
+    """
+    command = (['sudo', '-n'] if use_sudo else []) + ['bash', PISHRINK_SCRIPT] + options + [image_path]
+    parser = ProgressParser()
+    phases = {}
+    current = None
+    phase_started = None
+
+    started = time.monotonic()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+    while True:
+        data = process.stdout.read(65536)
+        if not data:
+            break
+        _, events = parser.feed(data)
+        for event in events:
+            if event.phase != current:
+                now = time.monotonic()
+                if current is not None:
+                    phases[current] = phases.get(current, 0.0) + now - phase_started
+                current, phase_started = event.phase, now
+    process.stdout.close()
+    # wait4 liefert die Ressourcen des Prozesses inklusive aller abgewarteten Unterprozesse
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - started
+    if current is not None and current != 'done':
+        phases[current] = phases.get(current, 0.0) + time.monotonic() - phase_started
+
+    return {
+        'exit_code': process.returncode,
+        'wall_seconds': wall,
+        'cpu_user_seconds': usage.ru_utime,
+        'cpu_system_seconds': usage.ru_stime,
+        'peak_rss_bytes': usage.ru_maxrss * 1024,
+        'bytes_read': usage.ru_inblock * SECTOR,
+        'bytes_written': usage.ru_oublock * SECTOR,
+        'phases': phases,
+    }
+
+
+def result_size(image_path):
+    for path in (image_path, image_path + '.gz', image_path + '.xz'):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return path, stat.st_size, stat.st_blocks * 512
+    return None, None, None
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old_path, results):
+    with open(old_path) as f:
+        old = json.load(f)
+    old_runs = {run['case']: run for run in old.get('runs', [])}
+    print(f"{'Fall':50s} {'alt (s)':>10s} {'neu (s)':>10s} {'Faktor':>8s}")
+    for run in results['runs']:
+        previous = old_runs.get(run['case'])
+        if not previous or not previous.get('wall_seconds'):
+            continue
+        factor = run['wall_seconds'] / previous['wall_seconds']
+        print(f"{run['case']:50s} {previous['wall_seconds']:10.1f} {run['wall_seconds']:10.1f} {factor:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-End-Benchmark für pishrink mit synthetischen Images")
+    parser.add_argument('--sizes', default='2G', help="Kommagetrennte Imagegrößen, z.B. 2G,4G")
+    parser.add_argument('--fill', default='0.5', help="Kommagetrennte Füllgrade der Root-Partition")
+    parser.add_argument('--mix', default='mixed', help=f"Kommagetrennte Dateigrößen-Mischungen ({', '.join(FILE_MIXES)})")
+    parser.add_argument('--compressible', type=float, default=0.5, help="Anteil gut komprimierbarer Dateien")
+    parser.add_argument('--options', nargs='+', default=['-s', '-s -z', '-s -Z', '-s -a -z'],
+                        help="pishrink-Optionssätze, jeweils als ein Argument")
+    parser.add_argument('--repeat', type=int, default=1, help="Wiederholungen pro Fall")
+    parser.add_argument('--workdir', default=None, help="Arbeitsverzeichnis (Standard: temporär)")
+    parser.add_argument('--output', default=None, help="Ergebnisdatei (JSON)")
+    parser.add_argument('--compare', default=None, help="Frühere Ergebnisdatei zum Vergleich")
+    parser.add_argument('--no-sudo', action='store_true', help="pishrink.sh ohne sudo starten (bereits root)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='shrink-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'host': socket.gethostname(),
+        'git_revision': git_revision(),
+        'cpu_count': os.cpu_count(),
+        'runs': [],
+    }
+
+    try:
+        for size_text in args.sizes.split(','):
+            for fill in (float(value) for value in args.fill.split(',')):
+                for mix in args.mix.split(','):
+                    base = os.path.join(workdir, f"base-{size_text}-{fill}-{mix}.img")
+                    print(f"[BENCH] Erzeuge Image {base}")
+                    build_started = time.monotonic()
+                    image_info = build_image(base, parse_size(size_text), fill, mix, args.compressible, workdir)
+                    image_info['build_seconds'] = time.monotonic() - build_started
+                    for option_set in args.options:
+                        options = shlex.split(option_set)
+                        for repetition in range(args.repeat):
+                            case = f"{size_text} fill={fill} mix={mix} opts='{option_set}'"
+                            target = os.path.join(workdir, 'run.img')
+                            for path in (target, target + '.gz', target + '.xz'):
+                                if os.path.exists(path):
+                                    os.remove(path)
+                            subprocess.run(['cp', '--reflink=auto', '--sparse=always', base, target], check=True)
+                            print(f"[BENCH] {case} (Durchlauf {repetition + 1}/{args.repeat})")
+                            run = run_shrink(target, options, use_sudo=not args.no_sudo)
+                            result_path, apparent, allocated = result_size(target)
+                            run.update({'case': case, 'repetition': repetition, 'options': options,
+                                        'image': image_info, 'result_bytes': apparent,
+                                        'result_allocated_bytes': allocated})
+                            results['runs'].append(run)
+                            print(f"[BENCH]   exit={run['exit_code']} {run['wall_seconds']:.1f}s "
+                                  f"cpu={run['cpu_user_seconds'] + run['cpu_system_seconds']:.1f}s "
+                                  f"rss={run['peak_rss_bytes'] / 2**20:.0f}MiB "
+                                  f"read={run['bytes_read'] / 2**20:.0f}MiB write={run['bytes_written'] / 2**20:.0f}MiB")
+                            if result_path:
+                                # Ergebnis gehört nach sudo ggf. root
+                                subprocess.run((['sudo', '-n'] if not args.no_sudo else []) + ['rm', '-f', result_path])
+                    os.remove(base)
+    finally:
+        output = args.output or f"shrink-bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"[BENCH] Ergebnisse gespeichert: {output}")
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
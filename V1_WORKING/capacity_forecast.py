@@ -0,0 +1,285 @@
+# V0.1a/capacity_forecast.py
+"""
+Prognose, wann das Laufwerk einer Backup-Wurzel voll läuft.
+
+Grundlage sind die Backup-Ordner der Wurzel (Datum aus dem Ordnernamen, belegter Platz nach dem
+Shrink) und der Shrink-Verlauf (Imagegröße vor und nach dem Shrink). Daraus ergeben sich:
+
+- Takt: Median der Abstände zwischen zwei Backups
+- Rohgröße: Median der Images vor dem Shrink (so viel schreibt raspiBackup zunächst)
+- Belegung: Median des Platzes, den ein Backup-Ordner nach dem Shrink behält
+
+Für alle Wurzeln auf demselben Laufwerk wird der Ablauf gemeinsam simuliert: raspiBackup schreibt
+das Roh-Image, der Shrink verkleinert es, danach löscht die Aufbewahrung ('delete_backups',
+'delete_hours') ältere Ordner. Reicht der Platz beim Schreiben eines Backups nicht (abzüglich
+'min_free_space_mb'), ist das Laufwerk zu diesem Zeitpunkt voll.
+
+Mit 'auto_tighten_retention' wird die Aufbewahrung der gefährdeten Wurzeln schrittweise um je
+einen Takt verkürzt, bis die Simulation ohne Platzmangel durch den Horizont kommt (nicht unter
+'min_retention_hours'). settings.json bleibt unverändert, nur die Shrinks dieser Wurzeln löschen
+mit der verkürzten Zeit.
+
+Beispiel in settings.json:
+
+    "forecast_horizon_days": 60,
+    "auto_tighten_retention": true,
+    "min_retention_hours": 72
+"""
+import os
+import time
+import datetime
+import threading
+from collections import namedtuple
+from log_handler import logger  # Zentralen Logger importieren
+from metrics import ROOT_FULL_SECONDS, ROOT_RETENTION_HOURS
+from shrink_utils import folder_size
+from shrink_history import ShrinkHistory
+from backup_roots import root_for_path
+
+INTERVAL = 900  # Sekunden zwischen zwei Prognosen (folder_size liest alle Backup-Ordner)
+SAMPLES = 10  # Berücksichtigte Backups bzw. Shrinks für Mediane
+
+# Eingaben und Ergebnis der Prognose einer Wurzel (Zeiten als Unix-Zeit, Dauern in Sekunden)
+Forecast = namedtuple('Forecast', ['root', 'free_bytes', 'cadence', 'raw_bytes', 'stored_bytes',
+                                   'retention_hours', 'full_at', 'recommended_hours'])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def list_backups(root):
+    """
+    :param root: BackupRoot
+    :return: Liste von (Zeitpunkt, belegte Bytes) der Backup-Ordner, älteste zuerst
+    """
+    backups = []
+    try:
+        with os.scandir(root.path) as entries:
+            folders = [entry for entry in entries if entry.is_dir()]
+    except OSError as e:
+        logger.warning(f"[FORECAST] Backup-Verzeichnis nicht lesbar: {root.path} ({e})")
+        return backups
+    for entry in folders:
+        match = root.regex.match(entry.name)
+        if not match:
+            continue
+        try:
+            stamp = datetime.datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M%S').timestamp()
+        except (ValueError, IndexError):
+            continue
+        backups.append((stamp, folder_size(entry.path)))
+    return sorted(backups)
+
+
+def simulate(now, free, plans, horizon, reserve=0):
+    """
+    Simuliert Backups, Shrinks und Aufbewahrung aller Wurzeln eines Laufwerks.
+
+    :param now: Startzeitpunkt
+    :param free: Aktuell freie Bytes
+    :param plans: Liste von Dicts mit 'backups' [(Zeitpunkt, Bytes)], 'cadence', 'raw', 'stored'
+                  und 'retention' (Sekunden oder None: nie löschen)
+    :param horizon: Simulierter Zeitraum in Sekunden
+    :param reserve: Bytes, die immer frei bleiben müssen
+    :return: (Zeitpunkt des ersten Platzmangels oder None, Index des Plans, der ihn auslöst)
+    """
+    kept = [list(plan['backups']) for plan in plans]
+    upcoming = []
+    for index, plan in enumerate(plans):
+        last = plan['backups'][-1][0] if plan['backups'] else now
+        # Nächstes Backup im Takt, frühestens jetzt (ein überfälliges zählt sofort)
+        upcoming.append(max(now, last + plan['cadence']))
+    while True:
+        index = min(range(len(plans)), key=lambda i: upcoming[i])
+        stamp = upcoming[index]
+        if stamp > now + horizon:
+            return None, None
+        plan = plans[index]
+        if free - plan['raw'] < reserve:
+            return stamp, index
+        free -= plan['stored']  # Roh-Image geschrieben und wieder auf die Belegung geschrumpft
+        kept[index].append((stamp, plan['stored']))
+        if plan['retention'] is not None:
+            # delete_old_backups: Ordner älter als die Aufbewahrung, nie den aktuellen
+            cutoff = stamp - plan['retention']
+            for backup in [b for b in kept[index][:-1] if b[0] < cutoff]:
+                kept[index].remove(backup)
+                free += backup[1]
+        upcoming[index] = stamp + plan['cadence']
+
+
+class CapacityForecaster:
+    """
+    Erstellt periodisch die Prognosen aller Backup-Wurzeln und verkürzt bei Bedarf deren Aufbewahrung.
+    """
+
+    def __init__(self, roots_provider, settings_provider, space_sampler=None, history=None, interval=INTERVAL):
+        """
+        :param roots_provider: Funktion ohne Parameter, die die aktuellen BackupRoots liefert
+        :param settings_provider: Funktion ohne Parameter, die die aktuellen Einstellungen liefert
+        :param space_sampler: Gemeinsamer SpaceSampler (ohne Messwert: statvfs)
+        :param history: ShrinkHistory (Standard: Verlaufsdatenbank neben dem Haupt-Log)
+        :param interval: Sekunden zwischen zwei Prognosen
+        """
+        self.roots_provider = roots_provider
+        self.settings_provider = settings_provider
+        self.space_sampler = space_sampler
+        self.history = history or ShrinkHistory()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.forecasts = {}  # Wurzelpfad -> Forecast
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def free_bytes(self, path):
+        free = self.space_sampler.free_bytes(path) if self.space_sampler else None
+        if free is None:
+            statvfs = os.statvfs(path)
+            free = statvfs.f_bavail * statvfs.f_frsize
+        return free
+
+    def plan_for(self, root, settings, now):
+        """
+        :return: Plan für simulate oder None, wenn für die Wurzel noch zu wenig bekannt ist
+        """
+        backups = list_backups(root)
+        sizes = self.history.size_history([root.path, root.realpath], SAMPLES)
+        stamps = [stamp for stamp, _ in backups] or sorted(started for started, _, _ in sizes)
+        cadence = median([b - a for a, b in zip(stamps, stamps[1:]) if b > a][-SAMPLES:])
+        stored = median([size for _, size in backups[-SAMPLES:] if size]) or median([after for _, _, after in sizes])
+        raw = median([before for _, before, _ in sizes]) or stored
+        if not cadence or not stored:
+            return None
+        retention = settings.get('delete_hours', 168) * 3600 if settings.get('delete_backups', False) else None
+        return {'root': root, 'backups': backups, 'cadence': cadence, 'raw': raw, 'stored': stored,
+                'retention': retention, 'configured': retention}
+
+    def tighten(self, now, free, plans, horizon, reserve, minimum):
+        # Jeweils die Wurzel mit der größten Belegung (Aufbewahrung * Belegung / Takt) um einen Takt kürzen
+        while True:
+            full_at, _ = simulate(now, free, plans, horizon, reserve)
+            if full_at is None:
+                return True
+            candidates = [plan for plan in plans
+                          if plan['retention'] is not None and plan['retention'] - plan['cadence'] >= minimum]
+            if not candidates:
+                return False
+            plan = max(candidates, key=lambda p: p['retention'] * p['stored'] / p['cadence'])
+            plan['retention'] -= plan['cadence']
+
+    def update(self):
+        """
+        Erstellt die Prognosen neu und aktualisiert die Metriken.
+        """
+        settings = self.settings_provider()
+        now = time.time()
+        horizon = settings.get('forecast_horizon_days', 60) * 86400
+        reserve = (settings.get('min_free_space_mb') or 0) * 2**20
+        devices = {}  # st_dev -> [Plan]
+        for root in self.roots_provider():
+            try:
+                plan = self.plan_for(root, root.job_settings(settings), now)
+                if plan:
+                    devices.setdefault(os.stat(root.path).st_dev, []).append(plan)
+            except OSError as e:
+                logger.warning(f"[FORECAST] Keine Prognose für {root.path}: {e}")
+        forecasts = {}
+        for plans in devices.values():
+            try:
+                free = self.free_bytes(plans[0]['root'].path)
+            except OSError as e:
+                logger.warning(f"[FORECAST] Speicherplatz nicht verfügbar: {e}")
+                continue
+            full_at, _ = simulate(now, free, plans, horizon, reserve)
+            if full_at is not None and settings.get('auto_tighten_retention', False):
+                minimum = settings.get('min_retention_hours', 72) * 3600
+                if not self.tighten(now, free, plans, horizon, reserve, minimum):
+                    logger.warning(f"[FORECAST] Auch mit kürzester Aufbewahrung läuft das Laufwerk von "
+                                   f"{plans[0]['root'].path} innerhalb des Horizonts voll.")
+                full_at, _ = simulate(now, free, plans, horizon, reserve)  # Mit verkürzter Aufbewahrung
+            for plan in plans:
+                root = plan['root']
+                recommended = None
+                if plan['retention'] != plan['configured']:
+                    recommended = int(plan['retention'] // 3600)
+                forecasts[root.path] = Forecast(root.path, free, plan['cadence'], plan['raw'], plan['stored'],
+                                                plan['configured'] / 3600 if plan['configured'] else None,
+                                                full_at, recommended)
+        with self.lock:
+            previous = self.forecasts
+            self.forecasts = forecasts
+        self.publish(previous, forecasts, now)
+
+    def publish(self, previous, forecasts, now):
+        for path in set(previous) - set(forecasts):
+            ROOT_FULL_SECONDS.remove(root=path)
+            ROOT_RETENTION_HOURS.remove(root=path)
+        for path, forecast in forecasts.items():
+            old = previous.get(path)
+            if forecast.full_at is None:
+                ROOT_FULL_SECONDS.remove(root=path)
+            else:
+                ROOT_FULL_SECONDS.set(max(0.0, forecast.full_at - now), root=path)
+                if old is None or old.full_at is None:
+                    logger.warning(f"[FORECAST] Laufwerk von {path} voraussichtlich voll am "
+                                   f"{datetime.datetime.fromtimestamp(forecast.full_at):%d.%m.%Y %H:%M}.")
+            retention = forecast.recommended_hours or forecast.retention_hours
+            if retention is None:
+                ROOT_RETENTION_HOURS.remove(root=path)
+            else:
+                ROOT_RETENTION_HOURS.set(retention, root=path)
+            if forecast.recommended_hours and (old is None or old.recommended_hours != forecast.recommended_hours):
+                logger.info(f"[FORECAST] Aufbewahrung für {path} verkürzt: {forecast.retention_hours:g} h -> "
+                            f"{forecast.recommended_hours:g} h")
+
+    def retention_hours(self, img_path):
+        """
+        :param img_path: Pfad eines Images
+        :return: Verkürzte Aufbewahrung in Stunden für die Wurzel des Images oder None
+        """
+        root = root_for_path(self.roots_provider(), img_path)
+        with self.lock:
+            forecast = self.forecasts.get(root.path) if root else None
+        return forecast.recommended_hours if forecast else None
+
+    def snapshot(self):
+        """
+        :return: Liste der Prognosen als Dicts (für Status und Tray)
+        """
+        with self.lock:
+            return [forecast._asdict() for forecast in self.forecasts.values()]
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"[FORECAST ERROR] Prognose fehlgeschlagen: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def describe(forecast, now=None):
+    """
+    :param forecast: Prognose als Dict (aus snapshot bzw. dem Daemon-Status)
+    :param now: Unix-Zeit (Standard: jetzt)
+    :return: Kurzer Text für das Tray-Menü
+    """
+    name = os.path.basename(forecast['root'].rstrip(os.sep)) or forecast['root']
+    if forecast['full_at'] is None:
+        text = f"{name}: Platz reicht"
+    else:
+        days = max(0.0, forecast['full_at'] - (now or time.time())) / 86400
+        text = f"{name}: voll in ~{days:.0f} Tagen"
+    if forecast['recommended_hours']:
+        text += f", Aufbewahrung {forecast['recommended_hours']:g} h"
+    return text
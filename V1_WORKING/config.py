@@ -0,0 +1,277 @@
+# V0.1a/config.py
+"""
+Zentraler Zugriff auf settings.json.
+
+- Schema mit Typen und Standardwerten (SCHEMA)
+- Zwischenspeicher, der nur bei geänderter mtime neu gelesen wird
+- Atomares Schreiben (temporäre Datei + rename)
+- Speichern führt Änderungen mit dem aktuellen Dateiinhalt zusammen, unbekannte Schlüssel bleiben erhalten
+- Benachrichtigung bei Änderungen, auch wenn die Datei von außen bearbeitet wurde
+"""
+import os
+import json
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'settings.json')
+PISHRINK_SCRIPT = "/home/raphi/pythonScripts/auto_dd_shrinker/pishrink.sh"
+
+# Schlüssel -> (Typ, Standardwert, Beschreibung); None als Standard bedeutet "nicht gesetzt"
+SCHEMA = {
+    'backup_folders': (list, [], "Überwachte Backup-Verzeichnisse"),
+    'logging_enabled': (bool, False, "shrink.log im Backup-Ordner schreiben"),
+    'advanced_logging': (bool, False, "Erweitertes Log"),
+    'delete_backups': (bool, False, "Ältere Backups nach dem Shrink löschen"),
+    'delete_hours': (int, 168, "Aufbewahrungszeit der Backups in Stunden"),
+    'pishrink_options': (list, [], "PiShrink-Optionen für automatische Läufe, z.B. [\"-a\", \"-z\"]"),
+    'pishrink_script': (str, PISHRINK_SCRIPT, "Pfad zu pishrink.sh"),
+    'backup_roots': (list, [], "Backup-Verzeichnisse mit eigenem Muster, Optionen und Aufbewahrung (siehe backup_roots.py)"),
+    'shrink_workers': (int, 1, "Gleichzeitige Shrinks im Daemon (pro Backup-Verzeichnis)"),
+    'disk_workers': (int, 1, "Gleichzeitige Shrinks pro Laufwerk, gemeinsam für alle Verzeichnisse darauf"),
+    'phase_timeout_factor': (int, 4, "Zeitlimit einer Phase als Vielfaches der Dauer früherer Läufe (auf die Imagegröße umgerechnet)"),
+    'phase_timeout_min': (int, 1800, "Mindestzeitlimit einer Phase in Sekunden"),
+    'stall_timeout': (int, 900, "Job beenden, wenn so viele Sekunden weder Ausgabe noch I/O kommt (0: aus)"),
+    'shrink_windows': (list, [], "Zeitfenster für Shrinks, z.B. [\"22:00-06:00\"] (leer: jederzeit)"),
+    'defer_during_backup': (bool, True, "Shrinks zurückstellen, solange ein Backup läuft"),
+    'max_load_average': (float, None, "Shrinks zurückstellen, solange die Systemlast (1 min) darüber liegt"),
+    'max_disk_utilization': (int, None, "Shrinks zurückstellen, solange das Laufwerk stärker ausgelastet ist (Prozent)"),
+    'io_latency_ceiling_ms': (int, None, "Shrink bremsen, solange die mittlere Plattenlatenz darüber liegt (ms)"),
+    'min_free_space_mb': (int, 1024, "Speicherplatz, der nach Komprimierung bzw. Kopie mindestens frei bleibt (MiB)"),
+    'forecast_horizon_days': (int, 60, "Zeitraum der Platzprognose je Backup-Wurzel (Tage)"),
+    'auto_tighten_retention': (bool, False, "Aufbewahrung verkürzen, wenn die Platzprognose Platzmangel erwartet"),
+    'min_retention_hours': (int, 72, "Kürzeste Aufbewahrung, auf die automatisch verkürzt wird (Stunden)"),
+    'memory_budget_mb': (int, None, "Arbeitsspeicher für alle gleichzeitigen Shrinks zusammen (MiB, leer: nur MemAvailable)"),
+    'memory_reserve_mb': (int, 256, "Arbeitsspeicher, der für das übrige System frei bleibt (MiB)"),
+    'metrics_port': (int, None, "Port des Prometheus-Exports"),
+    'metrics_textfile': (str, None, "Datei für den node_exporter Textfile-Collector"),
+    'event_trace_file': (str, None, "Ereignisstrom in diese Datei aufzeichnen"),
+    'daemon_socket': (str, None, "Pfad zum Steuer-Socket des Daemons (leer: /run/auto_shrink bzw. Benutzerpfad)"),
+    'daemon_socket_mode': (str, '660', "Zugriffsrechte des Steuer-Sockets (oktal)"),
+}
+
+
+def coerce(key, value):
+    """
+    Prüft einen Wert gegen das Schema und wandelt ihn falls möglich um.
+
+    :param key: Schlüssel
+    :param value: Wert aus der Datei oder vom Aufrufer
+    :return: Umgewandelter Wert
+    :raises ValueError: wenn der Wert nicht zum Typ passt
+    """
+    if key not in SCHEMA or value is None:
+        return value
+    value_type = SCHEMA[key][0]
+    if value_type is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0'):
+            return value.lower() in ('true', '1')
+        raise ValueError(f"{key}: Wahrheitswert erwartet, erhalten {value!r}")
+    if value_type is int:
+        if isinstance(value, bool):
+            raise ValueError(f"{key}: Ganzzahl erwartet, erhalten {value!r}")
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key}: Ganzzahl erwartet, erhalten {value!r}")
+    if value_type is float:
+        if isinstance(value, bool):
+            raise ValueError(f"{key}: Zahl erwartet, erhalten {value!r}")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key}: Zahl erwartet, erhalten {value!r}")
+    if value_type is list:
+        if not isinstance(value, list):
+            raise ValueError(f"{key}: Liste erwartet, erhalten {value!r}")
+        return list(value)
+    if value_type is str:
+        if not isinstance(value, str):
+            raise ValueError(f"{key}: Text erwartet, erhalten {value!r}")
+        return value
+    return value
+
+
+class ConfigService:
+    """
+    Zwischengespeicherte, typisierte Einstellungen aus einer JSON-Datei.
+    """
+
+    def __init__(self, path=SETTINGS_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.raw = {}
+        self.stamp = None  # (mtime_ns, Größe) der zuletzt gelesenen Datei
+        self.listeners = []
+        self.watch_thread = None
+        self.stop_event = threading.Event()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_file(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("Einstellungsdatei enthält kein JSON-Objekt")
+        return data
+
+    def refresh(self):
+        """
+        Liest die Datei neu, falls sie sich seit dem letzten Lesen geändert hat.
+
+        :return: Menge der geänderten Schlüssel
+        """
+        with self.lock:
+            stamp = self._file_stamp()
+            if stamp == self.stamp:
+                return set()
+            try:
+                data = self._read_file()
+            except (OSError, ValueError) as e:
+                # Halb geschriebene oder fehlerhafte Datei: letzten gültigen Stand behalten
+                logger.error(f"[CONFIG ERROR] Einstellungen konnten nicht gelesen werden: {e}")
+                return set()
+            changed = {key for key in set(data) | set(self.raw) if data.get(key) != self.raw.get(key)}
+            self.raw = data
+            self.stamp = stamp
+        if changed and self.listeners:
+            self._notify(changed)
+        return changed
+
+    def get(self, key, default=None):
+        """
+        Liefert einen Wert, geprüft und mit Standardwert aus dem Schema.
+
+        :param key: Schlüssel
+        :param default: Standardwert für Schlüssel außerhalb des Schemas
+        :return: Wert
+        """
+        self.refresh()
+        return self._typed(key, default)
+
+    def _typed(self, key, default=None):
+        with self.lock:
+            value = self.raw.get(key)
+        if key not in SCHEMA:
+            return default if value is None else value
+        schema_default = SCHEMA[key][1]
+        if value is not None:
+            try:
+                return coerce(key, value)
+            except ValueError as e:
+                logger.error(f"[CONFIG ERROR] Ungültiger Wert, verwende Standard: {e}")
+        return list(schema_default) if isinstance(schema_default, list) else schema_default
+
+    def snapshot(self):
+        """
+        :return: Dict aller Einstellungen (Schema-Schlüssel mit Standardwerten, unbekannte Schlüssel unverändert)
+        """
+        self.refresh()
+        with self.lock:
+            keys = set(SCHEMA) | set(self.raw)
+        return {key: self._typed(key) for key in keys}
+
+    def update(self, **changes):
+        """
+        Speichert geänderte Werte. Der aktuelle Dateiinhalt wird neu gelesen und
+        zusammengeführt, damit Schlüssel anderer Schreiber erhalten bleiben.
+
+        :param changes: Zu setzende Werte (None entfernt den Schlüssel)
+        :raises ValueError: bei Werten, die nicht zum Schema passen
+        :raises OSError: wenn die Datei nicht geschrieben werden kann
+        """
+        checked = {key: coerce(key, value) for key, value in changes.items()}
+        with self.lock:
+            try:
+                data = self._read_file()
+            except ValueError as e:
+                logger.error(f"[CONFIG ERROR] Einstellungsdatei fehlerhaft, überschreibe mit letztem Stand: {e}")
+                data = dict(self.raw)
+            for key, value in checked.items():
+                if value is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+            self._write_file(data)
+        self.refresh()
+
+    def _write_file(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        logger.info(f"[CONFIG] Einstellungen gespeichert: {self.path}")
+
+    def add_listener(self, listener):
+        """
+        Registriert einen Callback listener(geänderte_schlüssel, config) für Änderungen.
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, changed):
+        logger.info(f"[CONFIG] Geänderte Einstellungen: {sorted(changed)}")
+        for listener in list(self.listeners):
+            try:
+                listener(changed, self)
+            except Exception as e:
+                logger.error(f"[CONFIG ERROR] Listener fehlgeschlagen: {e}")
+
+    def start_watching(self, interval=2.0):
+        """
+        Prüft die Datei periodisch auf Änderungen von außen (z.B. Editor oder andere Instanz).
+
+        :param interval: Prüfintervall in Sekunden
+        """
+        if self.watch_thread:
+            return self
+
+        def run():
+            while not self.stop_event.wait(interval):
+                self.refresh()
+
+        self.watch_thread = threading.Thread(target=run, daemon=True)
+        self.watch_thread.start()
+        return self
+
+    def stop_watching(self):
+        self.stop_event.set()
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_config(path=SETTINGS_FILE):
+    """
+    Liefert die gemeinsame ConfigService-Instanz für eine Einstellungsdatei.
+
+    :param path: Pfad zur Einstellungsdatei
+    :return: ConfigService
+    """
+    path = os.path.realpath(path)
+    with _services_lock:
+        if path not in _services:
+            _services[path] = ConfigService(path)
+        return _services[path]
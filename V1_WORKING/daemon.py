@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# V0.1a/daemon.py
+"""
+Headless-Daemon: Überwachung, Job-Warteschlange und Shrink-Worker ohne Qt.
+
+Die Tray-Anwendung (main.py) verbindet sich als optionaler Client über den
+Steuer-Socket (siehe daemon_client.py). Start unter systemd: auto_shrink.service.
+
+    sudo python3 daemon.py
+    sudo python3 daemon.py --no-wait-mount --socket /run/auto_shrink/auto_shrink.sock
+    python3 daemon.py --profile-startup   # Importzeiten und Zeit bis zur Bereitschaft ausgeben
+"""
+import os
+import sys
+import startup_profile  # Vor allen anderen Modulen, damit --profile-startup alle Importe misst
+startup_profile.install()
+import json
+import time
+import signal
+import argparse
+import threading
+import socketserver
+from log_handler import logger  # Zentralen Logger importieren
+from backup_monitor import MonitorSignals
+from job_queue import JobQueue
+from metrics import SpaceSampler
+from daemon_client import default_socket_path
+from backup_roots import root_for_path
+from mount_tracker import MountTracker
+from schedule_policy import DiskLoad, SchedulePolicy
+from space_budget import SpaceBudget
+from capacity_forecast import CapacityForecaster
+from job_registry import InstanceLock
+from config import SETTINGS_FILE, get_config
+from service import MOUNT_POINT, ObserverManager, wait_for_mount, start_metrics_export, clean_old_logs
+
+
+class Subscribers:
+    """
+    Verbundene Clients, an die Ereignisse verteilt werden.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams = []
+
+    def add(self, stream):
+        with self.lock:
+            self.streams.append(stream)
+
+    def remove(self, stream):
+        with self.lock:
+            if stream in self.streams:
+                self.streams.remove(stream)
+
+    def publish(self, message):
+        line = json.dumps(message) + "\n"
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            try:
+                stream.write(line)
+                stream.flush()
+            except (OSError, ValueError):
+                self.remove(stream)
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        for raw_line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(raw_line)
+                response = daemon.handle_request(request)
+            except (ValueError, AttributeError) as e:
+                response = {'ok': False, 'error': f"Ungültige Anfrage: {e}"}
+            self.send(response)
+            if response.get('ok') and request.get('cmd') == 'subscribe':
+                daemon.subscribers.add(self)
+                try:
+                    # Verbindung offen halten, bis der Client sie schließt
+                    for _ in self.rfile:
+                        pass
+                finally:
+                    daemon.subscribers.remove(self)
+                return
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode('utf-8'))
+        self.wfile.flush()
+
+    # Schnittstelle für Subscribers.publish
+    def write(self, line):
+        self.wfile.write(line.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon, mode=0o660):
+        self.daemon = daemon
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # Verwaister Socket eines früheren Laufs
+        super().__init__(socket_path, ControlRequestHandler)
+        os.chmod(socket_path, mode)
+
+
+class ShrinkDaemon:
+    """
+    Verbindet Observer, Job-Warteschlange und Steuer-Socket.
+    """
+
+    def __init__(self, settings_file, socket_path=None, workers=None, mount_points=()):
+        self.settings_file = settings_file
+        self.config = get_config(settings_file)
+        self.socket_path = socket_path or default_socket_path(self.config.snapshot())
+        self.socket_mode = int(self.config.get('daemon_socket_mode'), 8)
+        self.started = time.time()
+        self.signals = MonitorSignals()
+        self.subscribers = Subscribers()
+        self.space_sampler = SpaceSampler([])
+        self.observers = ObserverManager(self.signals, settings_file, self.space_sampler)
+        self.disk_load = DiskLoad()
+        self.forecaster = CapacityForecaster(lambda: self.observers.roots, self.config.snapshot, self.space_sampler)
+        # Jeder Job liest die aktuellen Einstellungen (zwischengespeichert, nur bei Änderung neu gelesen),
+        # jede Backup-Wurzel hat einen eigenen Worker-Pool
+        self.queue = JobQueue(self.signals, self.config.snapshot,
+                              workers=workers or self.config.get('shrink_workers'),
+                              roots_provider=lambda: self.observers.roots,
+                              disk_workers=self.config.get('disk_workers'),
+                              policy_provider=self.schedule_policy,
+                              space_budget=SpaceBudget(self.space_sampler),
+                              retention_provider=self.forecaster.retention_hours)
+        self.mounts = MountTracker(mount_points)
+        self.mounts.add_listener(self.on_mount_changed)
+        self.server = None
+
+        self.signals.new_image.connect(self.on_new_image)
+        self.signals.error_occurred.connect(lambda message: self.subscribers.publish(
+            {'event': 'error', 'message': message}))
+        self.signals.shrink_progress.connect(lambda img_path, event: self.subscribers.publish(
+            {'event': 'progress', 'img_path': img_path, 'progress': event._asdict()}))
+        self.queue.add_listener(lambda info: self.subscribers.publish({'event': 'job', 'job': info.to_dict()}))
+
+    @property
+    def backup_folders(self):
+        return self.observers.backup_folders
+
+    def schedule_policy(self):
+        # Zeitfenster und Grenzen werden bei jeder Prüfung aus den aktuellen Einstellungen gelesen
+        return SchedulePolicy.from_settings(self.config.snapshot(), self.disk_load, self.observers.backup_in_progress)
+
+    def on_new_image(self, img_path):
+        self.subscribers.publish({'event': 'new_image', 'img_path': img_path})
+        self.queue.submit(img_path)
+
+    def on_mount_changed(self, mount_point, mounted):
+        # Überwachung und Worker-Pools der Wurzeln auf diesem Laufwerk anhalten bzw. fortsetzen
+        if not mounted:
+            self.queue.pause(self.observers.set_mount_state(mount_point, mounted))
+        else:
+            self.queue.resume(self.observers.set_mount_state(mount_point, mounted))
+        self.subscribers.publish({'event': 'mount', 'mount_point': mount_point, 'mounted': mounted})
+
+    def is_allowed_image(self, img_path):
+        # Nur Images in Backup-Ordnern unterhalb der überwachten Verzeichnisse werden angenommen
+        img_path = os.path.realpath(img_path)
+        if not img_path.endswith('.img') or not os.path.isfile(img_path):
+            return False
+        folder = os.path.dirname(img_path)
+        root = root_for_path(self.observers.roots, img_path)
+        return root is not None and os.path.dirname(folder) == root.realpath \
+            and root.matches_folder(os.path.basename(folder))
+
+    def handle_request(self, request):
+        """
+        Beantwortet eine Anfrage eines Clients.
+
+        :param request: Dict mit 'cmd'
+        :return: Antwort-Dict
+        """
+        cmd = request.get('cmd')
+        if cmd == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        if cmd == 'status':
+            return {
+                'ok': True,
+                'pid': os.getpid(),
+                'uptime': time.time() - self.started,
+                'backup_folders': self.backup_folders,
+                'backup_roots': [root.to_dict() for root in self.observers.roots],
+                'free_bytes': {root: self.space_sampler.free_bytes(root) for root in self.backup_folders},
+                'mounts': {mount_point: self.mounts.is_mounted(mount_point) for mount_point in self.mounts.mount_points},
+                'jobs': self.queue.snapshot(),
+                'forecast': self.forecaster.snapshot(),
+            }
+        if cmd == 'submit':
+            img_path = request.get('img_path', '')
+            if not self.is_allowed_image(img_path):
+                return {'ok': False, 'error': f"Kein Image in einem überwachten Backup-Ordner: {img_path}"}
+            return {'ok': True, 'job': self.queue.submit(img_path).to_dict()}
+        if cmd in ('cancel', 'pause', 'resume'):
+            action = {'cancel': self.queue.cancel_job, 'pause': self.queue.pause_job,
+                      'resume': self.queue.resume_job}[cmd]
+            try:
+                return {'ok': True, 'job': action(int(request.get('job_id'))).to_dict()}
+            except (TypeError, KeyError, ValueError) as e:
+                return {'ok': False, 'error': str(e).strip("'")}
+        if cmd == 'subscribe':
+            return {'ok': True}
+        return {'ok': False, 'error': f"Unbekannter Befehl: {cmd}"}
+
+    def start(self):
+        self.space_sampler.start()
+        start_metrics_export(self.settings_file)
+        self.queue.start()
+        self.observers.start()
+        self.forecaster.start()
+        for mount_point in self.mounts.mount_points:
+            if not self.mounts.is_mounted(mount_point):
+                self.on_mount_changed(mount_point, False)
+        self.mounts.start()
+        if not self.backup_folders:
+            logger.warning("[DAEMON] Keine Backup-Verzeichnisse konfiguriert, Überwachung inaktiv.")
+        # Geänderte Einstellungen ohne Neustart übernehmen
+        self.config.add_listener(self.observers.on_config_changed)
+        self.config.start_watching()
+        threading.Thread(target=clean_old_logs, args=(self.backup_folders,), daemon=True).start()
+        self.server = ControlServer(self.socket_path, self, self.socket_mode)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"[DAEMON] Steuer-Socket bereit: {self.socket_path}")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        self.config.stop_watching()
+        self.mounts.stop()
+        self.observers.stop()
+        self.forecaster.stop()
+        self.space_sampler.stop()
+        logger.info("[DAEMON] Beendet.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-Shrink-Daemon ohne GUI")
+    parser.add_argument('--settings', default=SETTINGS_FILE, help="Pfad zur Einstellungsdatei")
+    parser.add_argument('--socket', default=None, help="Pfad zum Steuer-Socket")
+    parser.add_argument('--workers', type=int, default=None, help="Anzahl gleichzeitiger Shrinks")
+    parser.add_argument('--mount-point', action='append', default=None,
+                        help="Mount-Punkt der Backup-Platte, mehrfach möglich (Standard: %s)" % MOUNT_POINT)
+    parser.add_argument('--mount-timeout', type=int, default=None,
+                        help="Maximale Wartezeit auf den Mount-Punkt in Sekunden (Standard: unbegrenzt)")
+    parser.add_argument('--no-wait-mount', action='store_true', help="Nicht auf den Mount-Punkt warten")
+    args = parser.parse_args()
+    mount_points = args.mount_point or [MOUNT_POINT]
+
+    # Ein zweiter Daemon würde den Steuer-Socket des ersten ersetzen und dieselben Ordner überwachen
+    instance_lock = InstanceLock('daemon')
+    if not instance_lock.acquire():
+        logger.error(f"[DAEMON] Läuft bereits (PID {instance_lock.owner()}).")
+        return 1
+
+    if not args.no_wait_mount:
+        for mount_point in mount_points:
+            if not wait_for_mount(mount_point, timeout=args.mount_timeout):
+                return 1
+
+    daemon = ShrinkDaemon(args.settings, args.socket, args.workers, mount_points)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    daemon.start()
+    startup_profile.mark("Daemon bereit")
+    startup_profile.report()
+    stop_event.wait()
+    daemon.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
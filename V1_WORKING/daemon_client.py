@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# V0.1a/daemon_client.py
+"""
+Client für den Steuer-Socket des Daemons (daemon.py).
+
+Protokoll: JSON-Zeilen über einen Unix-Domain-Socket. Jede Anfrage ist ein Objekt
+mit 'cmd' (ping, status, submit, cancel, pause, resume, subscribe), jede Antwort ein Objekt mit 'ok'.
+Nach 'subscribe' sendet der Daemon fortlaufend Ereignisse mit dem Schlüssel 'event'
+(new_image, job, progress, error).
+
+Beispiel:
+    python3 daemon_client.py status
+    python3 daemon_client.py submit /media/raphi/hdd/backups/.../raspihaupt-dd-backup-....img
+    python3 daemon_client.py pause 3
+    python3 daemon_client.py resume 3
+    python3 daemon_client.py cancel 3
+    python3 daemon_client.py watch
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+
+SOCKET_NAME = 'auto_shrink.sock'
+SYSTEM_SOCKET = os.path.join('/run/auto_shrink', SOCKET_NAME)  # Daemon als Dienst (root, auto_shrink.service)
+
+
+def default_socket_path(settings=None):
+    """
+    Ermittelt den Pfad, unter dem der Daemon seinen Steuer-Socket öffnet.
+
+    :param settings: Einstellungen; 'daemon_socket' hat Vorrang
+    :return: Pfad zum Socket
+    """
+    if settings and settings.get('daemon_socket'):
+        return settings['daemon_socket']
+    if os.geteuid() == 0:
+        return SYSTEM_SOCKET
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.join('/tmp', f"auto_shrink-{os.getuid()}.sock")
+
+
+def socket_candidates(settings=None):
+    """
+    Pfade, unter denen ein Client den Daemon sucht: zuerst den System-Daemon, dann einen
+    im Benutzerkontext gestarteten.
+
+    :param settings: Einstellungen; 'daemon_socket' hat Vorrang
+    :return: Liste der Pfade
+    """
+    if settings and settings.get('daemon_socket'):
+        return [settings['daemon_socket']]
+    user_path = default_socket_path()
+    return [SYSTEM_SOCKET] if user_path == SYSTEM_SOCKET else [SYSTEM_SOCKET, user_path]
+
+
+class DaemonClient:
+    """
+    Verbindung zum Daemon für einzelne Anfragen und Ereignis-Abonnements.
+    """
+
+    def __init__(self, socket_path, timeout=5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    @classmethod
+    def locate(cls, settings=None, timeout=5.0):
+        """
+        :param settings: Einstellungen; 'daemon_socket' hat Vorrang
+        :param timeout: Zeitlimit pro Anfrage in Sekunden
+        :return: Client für den ersten erreichbaren Daemon (sonst für den ersten Kandidaten)
+        """
+        candidates = socket_candidates(settings)
+        for path in candidates:
+            client = cls(path, timeout)
+            if os.path.exists(path) and client.is_running():
+                return client
+        return cls(candidates[0], timeout)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def request(self, cmd, **params):
+        """
+        Sendet eine Anfrage und wartet auf die Antwort.
+
+        :param cmd: Befehl
+        :return: Antwort als Dict
+        :raises OSError: wenn der Daemon nicht erreichbar ist
+        """
+        with self.connect() as sock, sock.makefile('rw') as stream:
+            stream.write(json.dumps(dict(params, cmd=cmd)) + "\n")
+            stream.flush()
+            line = stream.readline()
+        if not line:
+            raise ConnectionError("Daemon hat die Verbindung ohne Antwort geschlossen.")
+        return json.loads(line)
+
+    def is_running(self):
+        try:
+            return self.request('ping').get('ok', False)
+        except (OSError, ValueError):
+            return False
+
+    def subscribe(self, on_event, on_disconnect=None):
+        """
+        Abonniert die Ereignisse des Daemons in einem eigenen Thread.
+
+        :param on_event: Callback für jedes Ereignis (Dict)
+        :param on_disconnect: Optionaler Callback, wenn die Verbindung endet
+        :return: Thread des Abonnements
+        """
+        sock = self.connect()
+        sock.settimeout(None)  # Ereignisse kommen unregelmäßig
+
+        def run():
+            try:
+                with sock, sock.makefile('rw') as stream:
+                    stream.write(json.dumps({'cmd': 'subscribe'}) + "\n")
+                    stream.flush()
+                    for line in stream:
+                        message = json.loads(line)
+                        if 'event' in message:
+                            on_event(message)
+            except (OSError, ValueError):
+                pass
+            if on_disconnect:
+                on_disconnect()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Steuer-Client für den Auto-Shrink-Daemon")
+    parser.add_argument('--socket', default=None, help="Pfad zum Steuer-Socket")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="Jobs und Zustand anzeigen")
+    submit_parser = subparsers.add_parser('submit', help="Image zum Shrinken einreihen")
+    submit_parser.add_argument('img_path')
+    for command, text in (('cancel', "Job abbrechen und aufräumen"), ('pause', "Laufenden Job anhalten"),
+                          ('resume', "Angehaltenen Job fortsetzen")):
+        job_parser = subparsers.add_parser(command, help=text)
+        job_parser.add_argument('job_id', type=int)
+    subparsers.add_parser('watch', help="Ereignisse fortlaufend ausgeben")
+    args = parser.parse_args()
+
+    client = DaemonClient(args.socket) if args.socket else DaemonClient.locate()
+    try:
+        if args.command == 'watch':
+            finished = threading.Event()
+            client.subscribe(lambda message: print(json.dumps(message), flush=True), finished.set)
+            finished.wait()
+            return 1
+        if args.command == 'submit':
+            response = client.request('submit', img_path=os.path.abspath(args.img_path))
+        elif args.command in ('cancel', 'pause', 'resume'):
+            response = client.request(args.command, job_id=args.job_id)
+        else:
+            response = client.request('status')
+    except OSError as e:
+        print(f"Daemon nicht erreichbar ({client.socket_path}): {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(response, indent=4))
+    return 0 if response.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# V0.1a/event_trace.py
+"""
+Aufzeichnen und Abspielen des watchdog-Ereignisstroms.
+
+Aufzeichnung (z.B. eine Nacht lang):
+    python3 event_trace.py record /media/raphi/hdd/backups/raspiHauptDD/raspihaupt nacht.trace.gz
+
+Abspielen direkt in den BackupEventHandler, ohne Dateisystem:
+    python3 event_trace.py replay nacht.trace.gz --speed 0          # so schnell wie möglich
+    python3 event_trace.py replay nacht.trace.gz --speed 1          # in Echtzeit
+    python3 event_trace.py replay nacht.trace.gz --handlers 2        # zwei laufende Instanzen nachstellen
+
+Format: gzip-komprimierte JSON-Zeilen. Die erste Zeile ist ein Kopf mit den
+überwachten Verzeichnissen, danach folgt pro Ereignis
+[Sekunden seit Start, Typ, Verzeichnis (0/1), Index des Verzeichnisses, relativer Pfad, relatives Ziel].
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import threading
+from watchdog.events import (FileSystemEventHandler, FileCreatedEvent, FileModifiedEvent, FileDeletedEvent,
+                             FileMovedEvent, FileClosedEvent, DirCreatedEvent, DirModifiedEvent,
+                             DirDeletedEvent, DirMovedEvent)
+from log_handler import logger  # Zentralen Logger importieren
+
+TRACE_VERSION = 1
+
+# Kurzcodes der Ereignistypen: (Datei-Klasse, Verzeichnis-Klasse)
+EVENT_TYPES = {
+    'c': ('created', FileCreatedEvent, DirCreatedEvent),
+    'm': ('modified', FileModifiedEvent, DirModifiedEvent),
+    'd': ('deleted', FileDeletedEvent, DirDeletedEvent),
+    'v': ('moved', FileMovedEvent, DirMovedEvent),
+    'x': ('closed', FileClosedEvent, FileClosedEvent),
+}
+TYPE_CODES = {name: code for code, (name, _, _) in EVENT_TYPES.items()}
+
+
+class TraceRecorder(FileSystemEventHandler):
+    """
+    Schreibt alle empfangenen Ereignisse kompakt in eine Trace-Datei.
+    """
+
+    def __init__(self, trace_path, roots, flush_interval=5.0):
+        super().__init__()
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.file = gzip.open(trace_path, 'wt')
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.flush_interval = flush_interval
+        self.last_flush = self.started
+        self.count = 0
+        header = {'version': TRACE_VERSION, 'roots': self.roots, 'started': time.time()}
+        self.file.write(json.dumps(header) + "\n")
+
+    def _split(self, path):
+        path = os.path.realpath(path)
+        for index, root in enumerate(self.roots):
+            if path == root or path.startswith(root + os.sep):
+                return index, os.path.relpath(path, root)
+        return -1, path
+
+    def on_any_event(self, event):
+        code = TYPE_CODES.get(event.event_type)
+        if code is None:
+            return
+        root_index, rel_path = self._split(event.src_path)
+        record = [round(time.monotonic() - self.started, 4), code, int(event.is_directory), root_index, rel_path]
+        if getattr(event, 'dest_path', ''):
+            record.append(self._split(event.dest_path)[1])
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.count += 1
+            now = time.monotonic()
+            if now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        logger.info(f"[TRACE] {self.count} Ereignisse aufgezeichnet.")
+
+
+def _complete_lines(f):
+    # Bricht die Anwendung ab, fehlt das gzip-Ende; bis zum letzten Flush ist die Datei lesbar
+    try:
+        for line in f:
+            if line.endswith("\n"):
+                yield line
+    except EOFError:
+        logger.warning("[TRACE] Trace-Datei unvollständig, lese bis zum letzten vollständigen Ereignis.")
+
+
+def read_trace(trace_path, root_map=None):
+    """
+    Liest eine Trace-Datei und erzeugt watchdog-Ereignisse.
+
+    :param trace_path: Pfad zur Trace-Datei
+    :param root_map: Optionale Liste neuer Verzeichnisse anstelle der aufgezeichneten
+    :return: Tupel (Kopf, Liste aus (Sekunden seit Start, Ereignis))
+    """
+    with gzip.open(trace_path, 'rt') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError(f"Nicht unterstützte Trace-Version: {header.get('version')}")
+        roots = root_map or header['roots']
+        events = []
+        for line in _complete_lines(f):
+            record = json.loads(line)
+            offset, code, is_dir, root_index, rel_path = record[:5]
+            base = roots[root_index] if root_index >= 0 else ''
+            src_path = os.path.join(base, rel_path) if base else rel_path
+            _, file_class, dir_class = EVENT_TYPES[code]
+            event_class = dir_class if is_dir else file_class
+            if code == 'v':
+                dest_path = os.path.join(base, record[5]) if base else record[5]
+                event = event_class(src_path, dest_path)
+            else:
+                event = event_class(src_path)
+            events.append((offset, event))
+    return header, events
+
+
+class DispatchCounter:
+    """
+    Ersetzt das Starten der Ordnerüberwachung und zählt nur, welche Ordner ausgelöst wurden.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dispatches = {}
+
+    def __call__(self, folder_path):
+        with self.lock:
+            self.dispatches[folder_path] = self.dispatches.get(folder_path, 0) + 1
+
+
+class NullSignals:
+    class Signal:
+        def __init__(self):
+            self.count = 0
+
+        def emit(self, *args):
+            self.count += 1
+
+    def __init__(self):
+        self.new_image = self.Signal()
+        self.error_occurred = self.Signal()
+        self.shrink_progress = self.Signal()
+
+
+def replay(events, handlers, speed=0.0):
+    """
+    Spielt Ereignisse in einen oder mehrere Handler ein.
+
+    :param events: Liste aus (Sekunden seit Start, Ereignis)
+    :param handlers: Liste von FileSystemEventHandler-Instanzen
+    :param speed: 0 = so schnell wie möglich, 1 = Echtzeit, 10 = zehnfach
+    :return: Laufzeit in Sekunden (nur Verarbeitung, ohne Wartezeiten bei speed > 0)
+    """
+    busy = 0.0
+    started = time.monotonic()
+    for offset, event in events:
+        if speed > 0:
+            delay = started + offset / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        before = time.perf_counter()
+        for handler in handlers:
+            handler.dispatch(event)
+        busy += time.perf_counter() - before
+    return busy
+
+
+def record_main(args):
+    from watchdog.observers import Observer
+    recorder = TraceRecorder(args.trace, args.roots)
+    observer = Observer()
+    for root in args.roots:
+        observer.schedule(recorder, root, recursive=True)
+    observer.start()
+    logger.info(f"[TRACE] Zeichne Ereignisse aus {args.roots} nach {args.trace} auf.")
+    try:
+        if args.duration:
+            time.sleep(args.duration)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    observer.stop()
+    observer.join()
+    recorder.close()
+    return 0
+
+
+def replay_main(args):
+    from backup_monitor import BackupEventHandler
+    from shrink_utils import BACKUP_PATTERN
+
+    header, events = read_trace(args.trace, args.root)
+    counter = DispatchCounter()
+    handlers = []
+    for _ in range(args.handlers):
+        handler = BackupEventHandler(NullSignals(), header['roots'], args.pattern or BACKUP_PATTERN)
+        if not args.real_dispatch:
+            # Ohne Dateisystem: keine Überwachungs-Threads starten, nur zählen
+            handler.start_monitoring_folder = counter
+        handlers.append(handler)
+
+    busy = replay(events, handlers, args.speed)
+    duplicates = {folder: count for folder, count in counter.dispatches.items() if count > 1}
+    result = {
+        'events': len(events),
+        'handlers': len(handlers),
+        'busy_seconds': busy,
+        'microseconds_per_event': busy / len(events) * 1e6 if events else None,
+        'folders_dispatched': len(counter.dispatches),
+        'duplicate_dispatches': duplicates,
+    }
+    print(json.dumps(result, indent=4))
+    return 1 if duplicates else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="watchdog-Ereignisse aufzeichnen und abspielen")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="Ereignisse aufzeichnen")
+    record_parser.add_argument('roots', nargs='+', help="Zu überwachende Verzeichnisse, zuletzt die Trace-Datei")
+    record_parser.add_argument('--duration', type=float, default=None, help="Aufzeichnungsdauer in Sekunden")
+
+    replay_parser = subparsers.add_parser('replay', help="Trace in den BackupEventHandler einspielen")
+    replay_parser.add_argument('trace', help="Trace-Datei")
+    replay_parser.add_argument('--speed', type=float, default=0.0, help="0 = so schnell wie möglich, 1 = Echtzeit")
+    replay_parser.add_argument('--handlers', type=int, default=1, help="Anzahl paralleler Handler (Instanzen)")
+    replay_parser.add_argument('--root', nargs='+', default=None, help="Aufgezeichnete Verzeichnisse ersetzen")
+    replay_parser.add_argument('--pattern', default=None, help="Muster der Backup-Ordner")
+    replay_parser.add_argument('--real-dispatch', action='store_true',
+                               help="Überwachungs-Threads wirklich starten (benötigt das Dateisystem)")
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        if len(args.roots) < 2:
+            parser.error("record benötigt mindestens ein Verzeichnis und die Trace-Datei")
+        args.roots, args.trace = args.roots[:-1], args.roots[-1]
+        return record_main(args)
+    return replay_main(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# V0.1a/folder_tracker.py
+"""
+Zustände der erkannten Backup-Ordner eines BackupEventHandlers.
+
+Ein Ordner durchläuft:
+
+    WATCHING         Backup läuft, raspiBackup.log fehlt noch
+    WAITING_FOR_LOG  raspiBackup.log ist da, kurz warten, bis es vollständig geschrieben ist
+    QUEUED           Keine .img-Datei gefunden (oder Fehler), erneute Prüfung mit Backoff eingeplant
+    DONE             Images an den Shrink übergeben (new_image)
+    FAILED           Alle Versuche erfolglos bzw. Backup abgebrochen (kein raspiBackup.log)
+
+Ein einziger Thread prüft alle fälligen Ordner, statt eines Threads pro Ordner. Abgeschlossene
+Einträge (DONE, FAILED) werden nach TTL_SECONDS bzw. ab MAX_ENTRIES entfernt, der Speicherbedarf
+bleibt damit auch nach Monaten konstant. Ein neues Ereignis für einen FAILED-Ordner (z.B. eine
+später geschriebene .img-Datei) startet die Überwachung erneut.
+
+Die TTL muss mindestens so lang sein wie die Aufbewahrung ('delete_hours', siehe configure), sonst
+würde ein späteres Ereignis in einem alten, bereits geshrinkten Ordner ihn erneut melden. Ordner, die
+nicht mehr existieren oder deren Änderungszeit älter als die TTL ist, werden gar nicht erst aufgenommen.
+"""
+import os
+import time
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+from metrics import QUEUE_DEPTH
+
+WATCHING = 'watching'
+WAITING_FOR_LOG = 'waiting_for_log'
+QUEUED = 'queued'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATES = (WATCHING, WAITING_FOR_LOG, QUEUED)
+
+LOG_NAME = 'raspiBackup.log'
+POLL_SECONDS = 5  # Prüfintervall, solange das Backup läuft
+SETTLE_SECONDS = 10  # Wartezeit, bis raspiBackup.log vollständig geschrieben ist
+RETRY_DELAYS = (30, 60, 120, 300, 600)  # Backoff zwischen erneuten Suchen nach .img-Dateien
+WATCH_TIMEOUT = 86400  # Ohne Ereignis und ohne raspiBackup.log gilt ein Backup danach als abgebrochen
+TTL_SECONDS = 7 * 86400  # Abgeschlossene Einträge so lange als Duplikatschutz behalten
+MAX_ENTRIES = 1000  # Obergrenze der Einträge; die ältesten abgeschlossenen werden zuerst entfernt
+
+
+class TrackedFolder:
+    __slots__ = ('path', 'state', 'attempts', 'next_check', 'last_activity')
+
+    def __init__(self, path, now):
+        self.path = path
+        self.state = WATCHING
+        self.attempts = 0
+        self.next_check = now
+        self.last_activity = now
+
+
+class FolderTracker:
+    """
+    Verwaltet die Backup-Ordner eines Handlers und meldet fertige Images.
+    """
+
+    def __init__(self, on_ready, on_failed=None, poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS,
+                 retry_delays=RETRY_DELAYS, watch_timeout=WATCH_TIMEOUT, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        """
+        :param on_ready: Callback(Ordner, Liste der Image-Pfade), im Thread des Trackers
+        :param on_failed: Callback(Fehlermeldung), wenn alle Versuche erfolglos waren
+        :param poll_seconds: Prüfintervall, solange raspiBackup.log fehlt
+        :param settle_seconds: Wartezeit nach dem Erscheinen von raspiBackup.log
+        :param retry_delays: Sekunden bis zum jeweils nächsten Versuch
+        :param watch_timeout: Sekunden ohne Aktivität, nach denen ein laufendes Backup als abgebrochen gilt
+        :param ttl: Sekunden, die abgeschlossene Einträge erhalten bleiben
+        :param max_entries: Obergrenze der Einträge
+        """
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.retry_delays = tuple(retry_delays)
+        self.watch_timeout = watch_timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.condition = threading.Condition()
+        self.entries = {}  # Ordner -> TrackedFolder (Einfügereihenfolge = Alter)
+        self.thread = None
+
+    def configure(self, ttl):
+        """
+        Übernimmt geänderte Einstellungen (z.B. eine längere Aufbewahrung).
+
+        :param ttl: Sekunden, die abgeschlossene Einträge erhalten bleiben
+        """
+        with self.condition:
+            self.ttl = ttl
+
+    def __len__(self):
+        with self.condition:
+            return len(self.entries)
+
+    def state(self, path):
+        with self.condition:
+            entry = self.entries.get(path)
+            return entry.state if entry else None
+
+    def folders(self, *states):
+        """
+        :return: Ordner in den angegebenen Zuständen
+        """
+        with self.condition:
+            return [entry.path for entry in self.entries.values() if entry.state in states]
+
+    def arm(self, path):
+        """
+        Nimmt einen Ordner in die Überwachung auf (bzw. wieder auf, falls er FAILED ist).
+
+        :param path: Backup-Ordner
+        :return: False für Duplikate (Ordner wird bereits überwacht oder ist erledigt) sowie für
+                 gelöschte und veraltete Ordner
+        """
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except OSError:
+            logger.debug(f"[TRACKER] Ordner existiert nicht mehr, ignoriert: {path}")
+            return False
+        now = time.monotonic()
+        with self.condition:
+            if age > self.ttl:
+                # Ereignis in einem alten Backup (z.B. Aufbewahrung), nicht erneut shrinken
+                logger.debug(f"[TRACKER] Ordner älter als {self.ttl} s, ignoriert: {path}")
+                return False
+            entry = self.entries.get(path)
+            if entry is not None:
+                entry.last_activity = now
+                if entry.state != FAILED:
+                    return False
+                logger.info(f"[TRACKER] Neues Ereignis, überwache erneut: {path}")
+                del self.entries[path]
+            self.evict(now)
+            self.entries[path] = TrackedFolder(path, now)
+            QUEUE_DEPTH.inc()
+            self.condition.notify_all()
+            return True
+
+    def touch(self, path):
+        """
+        Vermerkt Aktivität in einem überwachten Ordner (verlängert WATCH_TIMEOUT).
+
+        :return: True, wenn der Ordner bekannt ist
+        """
+        with self.condition:
+            entry = self.entries.get(path)
+            if entry is not None:
+                entry.last_activity = time.monotonic()
+            return entry is not None
+
+    def evict(self, now):
+        # Aufruf mit gehaltener Condition
+        expired = [path for path, entry in self.entries.items()
+                   if entry.state not in ACTIVE_STATES and now - entry.last_activity > self.ttl]
+        for path in expired:
+            del self.entries[path]
+        if len(self.entries) >= self.max_entries:
+            finished = [path for path, entry in self.entries.items() if entry.state not in ACTIVE_STATES]
+            for path in finished[:len(self.entries) - self.max_entries + 1]:
+                del self.entries[path]
+
+    def finish(self, entry, state):
+        # Aufruf mit gehaltener Condition
+        entry.state = state
+        entry.last_activity = time.monotonic()  # TTL zählt ab dem Abschluss
+        QUEUE_DEPTH.dec()
+
+    def start(self):
+        """
+        Startet den Prüf-Thread, falls er noch nicht läuft.
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+        return self
+
+    def run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                due = [entry for entry in self.entries.values()
+                       if entry.state in ACTIVE_STATES and entry.next_check <= now]
+                if not due:
+                    pending = [entry.next_check for entry in self.entries.values() if entry.state in ACTIVE_STATES]
+                    self.condition.wait(min(pending) - now if pending else None)
+                    continue
+            for entry in due:
+                try:
+                    self.check(entry)
+                except Exception as e:
+                    logger.error(f"[TRACKER ERROR] Prüfung von {entry.path} fehlgeschlagen: {e}")
+
+    def check(self, entry):
+        now = time.monotonic()
+        if entry.state == WATCHING:
+            if os.path.exists(os.path.join(entry.path, LOG_NAME)):
+                logger.info(f"[FOUND] {LOG_NAME} gefunden: {os.path.join(entry.path, LOG_NAME)}")
+                with self.condition:
+                    entry.state = WAITING_FOR_LOG
+                    entry.next_check = now + self.settle_seconds
+            elif now - entry.last_activity > self.watch_timeout:
+                logger.warning(f"[WARNING] Kein {LOG_NAME} nach {self.watch_timeout} s ohne Aktivität, "
+                               f"Backup vermutlich abgebrochen: {entry.path}")
+                with self.condition:
+                    self.finish(entry, FAILED)
+            else:
+                with self.condition:
+                    entry.next_check = now + self.poll_seconds
+            return
+
+        # WAITING_FOR_LOG bzw. erneuter Versuch (QUEUED): Images suchen
+        try:
+            images = sorted(os.path.join(entry.path, name) for name in os.listdir(entry.path) if name.endswith('.img'))
+            problem = None if images else "Keine .img-Datei im Ordner gefunden"
+        except OSError as e:
+            images, problem = [], f"Ordner nicht lesbar ({e})"
+        if images:
+            with self.condition:
+                self.finish(entry, DONE)
+            self.on_ready(entry.path, images)
+            return
+        with self.condition:
+            entry.attempts += 1
+            if entry.attempts <= len(self.retry_delays):
+                delay = self.retry_delays[entry.attempts - 1]
+                entry.state = QUEUED
+                entry.next_check = now + delay
+                logger.warning(f"[WARNING] {problem}: {entry.path}, neuer Versuch in {delay} s "
+                               f"({entry.attempts}/{len(self.retry_delays)})")
+                return
+            self.finish(entry, FAILED)
+        message = f"{problem} nach {entry.attempts} Versuchen, Backup wird nicht geshrinkt: {entry.path}"
+        logger.error(f"[ERROR] {message}")
+        if self.on_failed:
+            self.on_failed(message)
@@ -1,15 +1,22 @@
 # V0.1a/gui.py
 import os
 import re
-import json
-import shutil
+import shlex
 import datetime
-import subprocess
 import threading
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.QtCore import QUrl, pyqtSignal, Qt
 from PyQt5.QtGui import QDesktopServices
 from log_handler import logger  # Zentralen Logger importieren
+from progress_parser import PHASE_LABELS, format_progress
+from shrink_history import ShrinkHistory, SPAN_PHASES, image_size
+from shrink_job import ShrinkJob, build_command
+from config import get_config
+from schedule_policy import DiskLoad, SchedulePolicy
+from space_budget import SpaceBudget, pishrink_arguments, space_needed
+from memory_budget import MemoryBudget
+from backup_roots import load_roots, root_for_path
+from shrink_utils import BACKUP_PATTERN
 
 # PiShrink-Optionen mit Beschreibungen
 DEFAULT_OPTIONS = {
@@ -23,24 +30,47 @@ DEFAULT_OPTIONS = {
 
 class OutputDialog(QtWidgets.QDialog):
     append_text_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(object)
+    job_finished_signal = pyqtSignal()
 
-    def __init__(self, shrink_log_path):
+    def __init__(self, shrink_log_path, job=None, on_cancel=None):
         super().__init__()
+        self.job = job  # ShrinkJob für Anhalten und Abbrechen
+        self.on_cancel = on_cancel  # Weckt z.B. das Warten auf Arbeitsspeicher
         self.setWindowTitle("Ausgabe des Shrink-Skripts")
         self.resize(800, 600)
         self.layout = QtWidgets.QVBoxLayout()
 
+        # Phase und Fortschrittsbalken
+        self.phase_label = QtWidgets.QLabel(PHASE_LABELS['start'])
+        self.layout.addWidget(self.phase_label)
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setRange(0, 0)  # Unbestimmt, bis ein Prozentwert bekannt ist
+        self.layout.addWidget(self.progress_bar)
+
         # Textbereich für die Ausgabe
         self.output_text = QtWidgets.QPlainTextEdit()
         self.output_text.setReadOnly(True)
+        self.output_text.setMaximumBlockCount(5000)  # Ausgabe begrenzen, ältere Zeilen verwerfen
         self.layout.addWidget(self.output_text)
 
         # Buttons
         buttons_layout = QtWidgets.QHBoxLayout()
         self.view_shrink_log_button = QtWidgets.QPushButton("Shrink-Log anzeigen")
         self.view_shrink_log_button.clicked.connect(lambda: self.open_shrink_log(shrink_log_path))
+        self.view_shrink_log_button.setEnabled(shrink_log_path is not None)
         buttons_layout.addWidget(self.view_shrink_log_button)
 
+        self.pause_button = QtWidgets.QPushButton("Anhalten")
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.pause_button.setEnabled(job is not None)
+        buttons_layout.addWidget(self.pause_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Abbrechen")
+        self.cancel_button.clicked.connect(self.cancel_job)
+        self.cancel_button.setEnabled(job is not None)
+        buttons_layout.addWidget(self.cancel_button)
+
         self.close_button = QtWidgets.QPushButton("Schließen")
         self.close_button.clicked.connect(self.close)
         buttons_layout.addWidget(self.close_button)
@@ -51,18 +81,56 @@ class OutputDialog(QtWidgets.QDialog):
 
         # Signal-Verbindungen
         self.append_text_signal.connect(self.output_text.appendPlainText)
+        self.progress_signal.connect(self.apply_progress)
+        self.job_finished_signal.connect(self.job_finished)
 
-        # Timer zum automatischen Schließen nach 5 Minuten (300 Sekunden)
+        # Timer zum automatischen Schließen 5 Minuten (300 Sekunden) nach dem Ende des Jobs;
+        # solange er läuft, bleiben Anhalten und Abbrechen erreichbar
         self.remaining_time = 300  # Sekunden
-        self.update_close_button()
         self.auto_close_timer = QtCore.QTimer(self)
         self.auto_close_timer.setInterval(1000)  # 1 Sekunde
         self.auto_close_timer.timeout.connect(self.update_timer)
-        self.auto_close_timer.start()
+        if job is None:
+            self.job_finished()
 
     def append_output(self, text):
         self.append_text_signal.emit(text)
 
+    def update_progress(self, event):
+        # Threadsicher: wird aus dem Leser-Thread aufgerufen
+        self.progress_signal.emit(event)
+
+    def apply_progress(self, event):
+        self.phase_label.setText(format_progress(event))
+        if event.percent is None:
+            self.progress_bar.setRange(0, 0)
+        else:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(int(event.percent))
+
+    def toggle_pause(self):
+        if self.job.paused:
+            if self.job.resume():
+                self.pause_button.setText("Anhalten")
+        elif self.job.pause():
+            self.pause_button.setText("Fortsetzen")
+
+    def cancel_job(self):
+        reply = QtWidgets.QMessageBox.question(self, "Abbrechen",
+                                               "Shrink abbrechen? Loop-Device und temporäre Mounts werden freigegeben.")
+        if reply == QtWidgets.QMessageBox.Yes:
+            self.job.cancel()
+            if self.on_cancel:
+                self.on_cancel()
+            self.job_finished()
+
+    def job_finished(self):
+        self.pause_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        if not self.auto_close_timer.isActive():
+            self.update_close_button()
+            self.auto_close_timer.start()
+
     def update_close_button(self):
         minutes = self.remaining_time // 60
         seconds = self.remaining_time % 60
@@ -342,12 +410,99 @@ class LogViewer(QtWidgets.QDialog):
                 QtWidgets.QMessageBox.warning(self, "Fehler", f"Fehler beim Löschen der Shrink-Logs: {e}")
                 logger.error(f"[LOGVIEWER ERROR] Fehler beim Löschen der Shrink-Logs: {e}")
 
+class HistoryDialog(QtWidgets.QDialog):
+    def __init__(self, history=None):
+        super().__init__()
+        self.setWindowTitle("Shrink-Verlauf")
+        self.resize(1200, 500)
+        self.history = history or ShrinkHistory()
+        self.layout = QtWidgets.QVBoxLayout()
+
+        # Tabelle: ein Job pro Zeile, eine Spalte pro Phase
+        self.columns = ["Start", "Image", "Exit-Code", "Vorher (GB)", "Nachher (GB)"] + \
+                       [PHASE_LABELS[phase] for phase in SPAN_PHASES]
+        self.history_table = QtWidgets.QTableWidget()
+        self.history_table.setColumnCount(len(self.columns))
+        self.history_table.setHorizontalHeaderLabels(self.columns)
+        self.history_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.history_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.layout.addWidget(self.history_table)
+
+        # Buttons
+        buttons_layout = QtWidgets.QHBoxLayout()
+        self.refresh_button = QtWidgets.QPushButton('Aktualisieren')
+        self.refresh_button.clicked.connect(self.load_history)
+        buttons_layout.addWidget(self.refresh_button)
+
+        self.export_csv_button = QtWidgets.QPushButton('Als CSV exportieren')
+        self.export_csv_button.clicked.connect(lambda: self.export_history("CSV"))
+        buttons_layout.addWidget(self.export_csv_button)
+
+        self.export_jsonl_button = QtWidgets.QPushButton('Als JSONL exportieren')
+        self.export_jsonl_button.clicked.connect(lambda: self.export_history("JSONL"))
+        buttons_layout.addWidget(self.export_jsonl_button)
+
+        self.close_button = QtWidgets.QPushButton('Schließen')
+        self.close_button.clicked.connect(self.close)
+        buttons_layout.addWidget(self.close_button)
+
+        self.layout.addLayout(buttons_layout)
+        self.setLayout(self.layout)
+        self.load_history()
+
+    def load_history(self):
+        try:
+            jobs = self.history.recent_jobs()
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(self, "Fehler", f"Fehler beim Laden des Verlaufs: {e}")
+            logger.error(f"[HISTORY ERROR] Fehler beim Laden des Verlaufs: {e}")
+            return
+        self.history_table.setRowCount(0)
+        for job in jobs:
+            row_position = self.history_table.rowCount()
+            self.history_table.insertRow(row_position)
+            started = datetime.datetime.fromtimestamp(job['started']).strftime('%Y-%m-%d %H:%M:%S')
+            values = [started, os.path.basename(job['img_path']),
+                      "" if job['exit_code'] is None else str(job['exit_code']),
+                      self.format_gb(job['bytes_before']), self.format_gb(job['bytes_after'])]
+            for phase in SPAN_PHASES:
+                duration = job['phases'].get(phase)
+                values.append("" if duration is None else self.format_duration(duration))
+            for column, value in enumerate(values):
+                self.history_table.setItem(row_position, column, QtWidgets.QTableWidgetItem(value))
+        self.history_table.resizeColumnsToContents()
+        logger.debug(f"[HISTORY] {len(jobs)} Jobs geladen.")
+
+    @staticmethod
+    def format_gb(size):
+        return "" if size is None else f"{size / 2**30:.2f}"
+
+    @staticmethod
+    def format_duration(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        return f"{minutes:d}:{seconds:02d}"
+
+    def export_history(self, file_format):
+        file_filter = "CSV Files (*.csv)" if file_format == "CSV" else "JSON Lines (*.jsonl)"
+        file_path, _ = QtWidgets.QFileDialog.getSaveFileName(self, f"Verlauf als {file_format} exportieren", "", file_filter)
+        if file_path:
+            try:
+                if file_format == "CSV":
+                    count = self.history.export_csv(file_path)
+                else:
+                    count = self.history.export_jsonl(file_path)
+                QtWidgets.QMessageBox.information(self, "Erfolg", f"{count} Einträge exportiert.")
+            except Exception as e:
+                QtWidgets.QMessageBox.warning(self, "Fehler", f"Fehler beim Exportieren des Verlaufs: {e}")
+                logger.error(f"[HISTORY ERROR] Fehler beim Exportieren nach {file_path}: {e}")
+
 class SettingsDialog(QtWidgets.QDialog):
     def __init__(self, settings_file):
         super().__init__()
         self.setWindowTitle('Einstellungen')
         self.setFixedSize(400, 200)
         self.settings_file = settings_file
+        self.config = get_config(settings_file)
         layout = QtWidgets.QVBoxLayout()
 
         # Ältere Backups löschen
@@ -390,8 +545,8 @@ class SettingsDialog(QtWidgets.QDialog):
             'delete_hours': self.hours_input.value()
         }
         try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(settings, f, indent=4)
+            # Nur die eigenen Schlüssel zusammenführen, andere Einstellungen bleiben erhalten
+            self.config.update(**settings)
             QtWidgets.QMessageBox.information(self, 'Einstellungen', 'Einstellungen gespeichert.')
             logger.info("[SETTINGS] Einstellungen gespeichert.")
         except Exception as e:
@@ -401,8 +556,7 @@ class SettingsDialog(QtWidgets.QDialog):
     def load_settings(self):
         if os.path.exists(self.settings_file):
             try:
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
+                settings = self.config.snapshot()
                 self.logging_switch.setChecked(settings.get('logging_enabled', False))
                 self.advanced_logging_checkbox.setChecked(settings.get('advanced_logging', False))
                 self.delete_backups_switch.setChecked(settings.get('delete_backups', False))
@@ -412,12 +566,26 @@ class SettingsDialog(QtWidgets.QDialog):
                 logger.error(f"[ERROR] Einstellungen konnten nicht geladen werden: {e}")
 
 class ShrinkGUI(QtWidgets.QWidget):
-    def __init__(self, img_path, settings_file):
+    def __init__(self, img_path, settings_file, signals=None, space_budget=None, memory_budget=None):
         super().__init__()
         self.img_path = img_path
         self.settings_file = settings_file
+        self.config = get_config(settings_file)
+        self.signals = signals
+        # Eigene Wurzel des Images (Muster, Optionen und Aufbewahrung), sonst die globalen Einstellungen
+        self.root = root_for_path(load_roots(self.config.snapshot()), img_path)
+        # Gemeinsam mit den anderen Dialogen, damit parallele Shrinks ihren Platzbedarf gegenseitig sehen
+        self.space_budget = space_budget or SpaceBudget(None, self.config.get('min_free_space_mb'))
+        # Gemeinsam mit den anderen Dialogen, damit parallele Shrinks nicht je 'xz -T0' starten
+        self.memory_budget = memory_budget or MemoryBudget()
         self.timer = QtCore.QTimer(self)
         self.time_left = 60  # Sekunden bis zum automatischen Start
+        self.disk_load = DiskLoad()
+        try:
+            # Erste Messung der Laufwerksauslastung, beim automatischen Start liegt dann ein Mittelwert vor
+            self.disk_load.utilization(self.img_path, block=False)
+        except OSError:
+            pass
         self.init_ui()
 
     def init_ui(self):
@@ -502,51 +670,57 @@ class ShrinkGUI(QtWidgets.QWidget):
         self.timer.timeout.connect(self.update_timer)
         self.timer.start(1000)  # Jede Sekunde
 
-        # Initiale Aktualisierung des Speicherplatzes
-        self.update_space_label()
-
         # Initiale Aktualisierung des Befehls
         self.update_command()
 
+        # Initiale Aktualisierung des Speicherplatzes (Bedarf hängt vom Befehl ab)
+        self.update_space_label()
+
+    def selected_options(self):
+        return [opt for opt, cb in self.option_checks.items() if cb.isChecked()]
+
     def update_command(self):
-        # Stellen Sie sicher, dass PISHRINK_SCRIPT korrekt definiert ist
-        PISHRINK_SCRIPT = "/home/raphi/pythonScripts/auto_dd_shrinker/pishrink.sh"
-        if not os.path.exists(PISHRINK_SCRIPT):
-            logger.error(f"PiShrink-Skript nicht gefunden: {PISHRINK_SCRIPT}")
-            QtWidgets.QMessageBox.critical(self, "Fehler", f"PiShrink-Skript nicht gefunden:\n{PISHRINK_SCRIPT}")
+        pishrink_script = self.config.get('pishrink_script')
+        if not os.path.exists(pishrink_script):
+            logger.error(f"PiShrink-Skript nicht gefunden: {pishrink_script}")
+            QtWidgets.QMessageBox.critical(self, "Fehler", f"PiShrink-Skript nicht gefunden:\n{pishrink_script}")
             self.run_button.setEnabled(False)
             return
         else:
             self.run_button.setEnabled(True)
-        options = ' '.join([opt for opt, cb in self.option_checks.items() if cb.isChecked()])
-        command = f'sudo bash "{PISHRINK_SCRIPT}" {options} "{self.img_path}"'
-        self.command_edit.setText(command)
+        self.command_edit.setText(build_command(self.img_path, self.selected_options(), pishrink_script))
 
     def save_settings(self):
         settings = {
             'logging_enabled': self.logging_switch.isChecked(),
             'advanced_logging': self.advanced_logging_checkbox.isChecked(),
             'delete_backups': self.delete_backups_switch.isChecked(),
-            'delete_hours': self.hours_input.value()
+            'delete_hours': self.hours_input.value(),
+            'pishrink_options': self.selected_options()
         }
         try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(settings, f, indent=4)
+            # Nur die eigenen Schlüssel zusammenführen, andere Einstellungen bleiben erhalten
+            self.config.update(**settings)
             QtWidgets.QMessageBox.information(self, 'Einstellungen', 'Einstellungen gespeichert.')
             logger.info("[SETTINGS] Einstellungen gespeichert.")
         except Exception as e:
             QtWidgets.QMessageBox.warning(self, 'Fehler', f'Einstellungen konnten nicht gespeichert werden: {e}')
             logger.error(f"[ERROR] Einstellungen konnten nicht gespeichert werden: {e}")
 
+    def job_settings(self):
+        settings = self.config.snapshot()
+        return self.root.job_settings(settings) if self.root else settings
+
     def load_settings(self):
         if os.path.exists(self.settings_file):
             try:
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
+                settings = self.job_settings()
                 self.logging_switch.setChecked(settings.get('logging_enabled', False))
                 self.advanced_logging_checkbox.setChecked(settings.get('advanced_logging', False))
                 self.delete_backups_switch.setChecked(settings.get('delete_backups', False))
                 self.hours_input.setValue(settings.get('delete_hours', 168))
+                for opt, checkbox in self.option_checks.items():
+                    checkbox.setChecked(opt in settings.get('pishrink_options', []))
             except Exception as e:
                 QtWidgets.QMessageBox.warning(self, 'Fehler', f'Einstellungen konnten nicht geladen werden: {e}')
                 logger.error(f"[ERROR] Einstellungen konnten nicht geladen werden: {e}")
@@ -554,19 +728,47 @@ class ShrinkGUI(QtWidgets.QWidget):
 
     def update_timer(self):
         self.time_left -= 1
-        self.timer_label.setText(f"Automatischer Start in {self.time_left} Sekunden")
-        if self.time_left <= 0:
-            self.run_command()
+        if self.time_left % 5 == 0:
+            self.update_space_label()
+        if self.time_left > 0:
+            self.timer_label.setText(f"Automatischer Start in {self.time_left} Sekunden")
+            return
+        # Nach dem Countdown alle 30 Sekunden prüfen, ob Zeitfenster und Auslastung den Start erlauben
+        if self.time_left % 30 == 0:
+            policy = SchedulePolicy.from_settings(self.config.snapshot(), self.disk_load)
+            reason = policy.defer_reason(self.img_path, block=False) or self.space_reason()
+            if reason is None:
+                self.run_command()
+            else:
+                self.timer_label.setText(f"Automatischer Start zurückgestellt: {reason}")
+                logger.info(f"[SCHEDULE] Automatischer Start zurückgestellt ({reason}): {self.img_path}")
+
+    def space_needed(self):
+        # Bedarf aus dem (evtl. bearbeiteten) Befehl, einschließlich einer Kopie als zweites Argument
+        try:
+            options, positional = pishrink_arguments(shlex.split(self.command_edit.text()))
+        except ValueError:
+            options, positional = self.selected_options(), []
+        return space_needed(self.img_path, options, positional[1] if len(positional) > 1 else None)
+
+    def space_reason(self):
+        """
+        :return: Grund, warum der Speicherplatz für Komprimierung bzw. Kopie nicht reicht, oder None
+        """
+        return self.space_budget.defer_reason(self.space_needed())
 
     def update_space_label(self):
         try:
-            # Hier setzen Sie den Pfad zu einer Datei oder einem Verzeichnis, um den Speicherplatz abzurufen
-            # Beispiel: Verwenden Sie das Backup-Verzeichnis
-            statvfs = os.statvfs(os.path.dirname(self.img_path))
-            free = statvfs.f_bavail * statvfs.f_frsize
+            free = self.space_budget.free_bytes(os.path.dirname(self.img_path))
+            if free is None:
+                raise OSError("kein Messwert")
             free_gb = free / (2**30)  # In GB umwandeln
-            self.space_label.setText(f"Freier Speicherplatz: {free_gb:.2f} GB")
-            logger.debug(f"[SPACE] Freier Speicherplatz: {free_gb:.2f} GB")
+            needed_gb = sum(self.space_needed().values()) / 2**30
+            text = f"Freier Speicherplatz: {free_gb:.2f} GB"
+            if needed_gb:
+                text += f" (benötigt bis zu {needed_gb:.2f} GB)"
+            self.space_label.setText(text)
+            logger.debug(f"[SPACE] {text}")
         except Exception as e:
             self.space_label.setText("Speicherplatz: N/A")
             logger.error(f"[ERROR] Konnte Speicherplatz nicht abrufen: {e}")
@@ -576,47 +778,79 @@ class ShrinkGUI(QtWidgets.QWidget):
         if not command:
             QtWidgets.QMessageBox.warning(self, "Warnung", "Kein Befehl zum Ausführen vorhanden.")
             return
+        needed = self.space_needed()
+        reason = self.space_reason()
+        if reason and QtWidgets.QMessageBox.question(
+                self, "Speicherplatz", f"Der Shrink könnte unterwegs abbrechen: {reason}.\nTrotzdem starten?",
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No) != QtWidgets.QMessageBox.Yes:
+            return
         logger.info(f"[SHRINK] Ausführen des Befehls: {command}")
         
-        # Shrink-Log-Pfad für den OutputDialog
+        # Shrink-Log-Pfad für den OutputDialog (None: Button zum Anzeigen deaktiviert)
         shrink_log_path = os.path.join(os.path.dirname(self.img_path), "shrink.log") if self.logging_switch.isChecked() else None
 
-        # Shrink-Log-Dialog erstellen, falls Logging aktiviert ist
-        if shrink_log_path:
-            self.output_dialog = OutputDialog(shrink_log_path)
-            self.output_dialog.show()
-            logger.debug("OutputDialog für Shrink-Prozess erstellt.")
-        else:
-            self.output_dialog = None
+        settings = dict(self.job_settings(),
+                        logging_enabled=self.logging_switch.isChecked(),
+                        delete_backups=self.delete_backups_switch.isChecked(),
+                        delete_hours=self.hours_input.value())
+        job = ShrinkJob(self.img_path, settings, command=command, on_line=self.handle_output_line,
+                        on_progress=self.handle_progress, on_error=self.show_error_dialog,
+                        backup_pattern=self.root.pattern if self.root else BACKUP_PATTERN)
+
+        # Ausgabe-Dialog immer erstellen, er enthält Anhalten und Abbrechen
+        self.output_dialog = OutputDialog(shrink_log_path, job, on_cancel=self.wake_budgets)
+        self.output_dialog.show()
+        logger.debug("OutputDialog für Shrink-Prozess erstellt.")
 
         # Starten des Shrink-Prozesses in einem separaten Thread
-        threading.Thread(target=self.run_process, args=(command, shrink_log_path), daemon=True).start()
+        threading.Thread(target=self.run_process, args=(job, needed, bool(reason)), daemon=True).start()
 
         self.timer.stop()
         self.close()  # GUI schließen, Programm läuft weiter
 
-    def run_process(self, command, shrink_log_path):
-        try:
-            logger.info(f"[SHRINK] Startet Shrink-Prozess: {command}")
-            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-            for line in process.stdout:
-                line = line.strip()
-                print(line)
-                if self.output_dialog:
-                    self.output_dialog.append_output(line)
-                logger.info(f"[SHRINK OUTPUT] {line}")
-            process.wait()
-            if self.output_dialog:
-                self.output_dialog.append_output("\nBefehl abgeschlossen.")
-            logger.info(f"[SHRINK] Shrink-Prozess abgeschlossen: {command}")
-            self.post_process()
-        except Exception as e:
-            error_message = f"Fehler beim Ausführen des Befehls: {e}"
-            print(f"[ERROR] {error_message}")
-            if self.output_dialog:
-                self.output_dialog.append_output(f"[ERROR] {error_message}")
-            logger.error(f"[ERROR] {error_message}")
-            self.show_error_dialog(error_message)
+    def run_process(self, job, needed, force=False):
+        """
+        Wie die Warteschlange des Daemons: Speicherplatz und Arbeitsspeicher für die gesamte Laufzeit
+        reservieren und die Komprimierung auf die eingeplanten Threads begrenzen.
+
+        :param job: ShrinkJob
+        :param needed: Platzbedarf aus space_needed
+        :param force: Platz ohne Warten reservieren (Start trotz Platzmangel bestätigt)
+        """
+        self.space_budget.configure(job.setting('min_free_space_mb'))
+        self.memory_budget.configure(job.settings.get('memory_budget_mb'), job.settings.get('memory_reserve_mb', 256))
+        options, _ = pishrink_arguments(job.argv)
+        cancelled = lambda: job.cancel_requested
+        with self.space_budget.admit(self.img_path, needed, on_wait=self.handle_wait, cancelled=cancelled, force=force), \
+                self.memory_budget.admit(self.img_path, options, image_size(self.img_path), on_wait=self.handle_wait,
+                                         cancelled=cancelled) as threads:
+            if not job.cancel_requested:
+                job.limit_compression(threads)
+                job.run()
+        if self.output_dialog:
+            self.output_dialog.append_output("\nBefehl abgebrochen." if job.cancel_requested else "\nBefehl abgeschlossen.")
+            self.output_dialog.job_finished_signal.emit()
+
+    def wake_budgets(self):
+        # Nach einem Abbruch nicht bis zur nächsten Prüfung auf Platz bzw. Arbeitsspeicher warten
+        self.space_budget.wake()
+        self.memory_budget.wake()
+
+    def handle_wait(self, reason):
+        if reason and self.output_dialog:
+            self.output_dialog.append_output(f"Start zurückgestellt: {reason}")
+
+    def handle_output_line(self, line):
+        print(line)
+        if self.output_dialog:
+            self.output_dialog.append_output(line)
+
+    def handle_progress(self, event):
+        logger.debug(f"[PROGRESS] {format_progress(event)}")
+        if self.output_dialog:
+            self.output_dialog.update_progress(event)
+        if self.signals:
+            self.signals.shrink_progress.emit(self.img_path, event)
 
     def show_error_dialog(self, error_message):
         self.error_dialog = QtWidgets.QMessageBox()
@@ -627,56 +861,3 @@ class ShrinkGUI(QtWidgets.QWidget):
         self.error_dialog.setStandardButtons(QtWidgets.QMessageBox.Ok)
         self.error_dialog.show()  # Fenster bleibt offen
         logger.error(f"[ERROR] {error_message}")
-
-    def post_process(self):
-        # Löschen alter Backups, falls aktiviert
-        if self.delete_backups_switch.isChecked():
-            hours = self.hours_input.value()
-            logger.info(f"[DELETE] Lösche Backups älter als {hours} Stunden")
-            self.delete_old_backups(hours)
-        else:
-            logger.info("[DELETE] Löschfunktion nicht aktiviert.")
-
-    def delete_old_backups(self, hours):
-        backup_dir = os.path.dirname(os.path.dirname(self.img_path))
-        logger.debug(f"[DELETE] Backup-Verzeichnis: {backup_dir}")
-        cutoff_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
-        backups_found = False  # Flag, um zu überprüfen, ob Backups gefunden wurden
-        try:
-            for item in os.listdir(backup_dir):
-                item_path = os.path.join(backup_dir, item)
-                if os.path.isdir(item_path):
-                    folder_name = os.path.basename(item_path)
-                    logger.debug(f"[DELETE] Überprüfe Ordner: {folder_name}")
-                    if item_path == os.path.dirname(self.img_path):
-                        logger.debug(f"[DELETE] Überspringe aktuelles Backup: {item_path}")
-                        continue  # Überspringen des aktuellen Backups
-                    match = re.match(r"raspihaupt-dd-backup-(\d{8})-(\d{6})", folder_name)
-                    if match:
-                        date_str = match.group(1)  # YYYYMMDD
-                        time_str = match.group(2)  # HHMMSS
-                        folder_datetime_str = date_str + time_str  # 'YYYYMMDDHHMMSS'
-                        try:
-                            folder_datetime = datetime.datetime.strptime(folder_datetime_str, '%Y%m%d%H%M%S')
-                            logger.debug(f"[DELETE] Ordnerzeit: {folder_datetime}, Grenzzeit: {cutoff_time}")
-                            if folder_datetime < cutoff_time:
-                                backups_found = True
-                                try:
-                                    shutil.rmtree(item_path)
-                                    logger.info(f"[DELETE] Altes Backup gelöscht: {item_path}")
-                                except Exception as e:
-                                    error_message = f"Konnte {item_path} nicht löschen: {e}"
-                                    logger.error(f"[ERROR] {error_message}")
-                                    self.show_error_dialog(error_message)
-                        except ValueError as ve:
-                            logger.error(f"[ERROR] Ungültiges Datum/Uhrzeit im Ordnernamen {folder_name}: {ve}")
-                    else:
-                        logger.debug(f"[DELETE] Ordner {folder_name} entspricht nicht dem Muster und wird übersprungen.")
-            if not backups_found:
-                logger.info("[DELETE] Keine alten Backups zum Löschen gefunden.")
-            else:
-                logger.info("[DELETE] Löschvorgang abgeschlossen.")
-        except Exception as e:
-            error_message = f"Fehler beim Löschen alter Backups: {e}"
-            logger.error(f"[ERROR] {error_message}")
-            self.show_error_dialog(error_message)
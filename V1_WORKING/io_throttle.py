@@ -0,0 +1,145 @@
+# V0.1a/io_throttle.py
+"""
+Adaptive I/O-Drosselung eines laufenden Shrinks anhand der Plattenlatenz.
+
+Die mittlere Wartezeit pro I/O-Anfrage (wie 'await' bei iostat) wird aus /proc/diskstats
+des Laufwerks mit dem Image gemessen. Liegt sie über der Obergrenze, wird pishrink.sh
+stufenweise gebremst, fällt sie deutlich darunter, wieder gelockert:
+
+    Stufe 0: Standardpriorität (best-effort 4)
+    Stufe 1: ionice best-effort, niedrigste Priorität
+    Stufe 2: ionice idle (nur wirksam mit BFQ/CFQ)
+    Stufe 3-5: zusätzlich 25/50/75 % jedes Intervalls angehalten (SIGSTOP/SIGCONT)
+
+Beispiel in settings.json:
+
+    "io_latency_ceiling_ms": 50
+"""
+import asyncio
+from log_handler import logger  # Zentralen Logger importieren
+from schedule_policy import DISKSTATS, device_of, read_diskstats
+from shrink_cleanup import run_privileged
+from async_runner import process_tree
+
+THROTTLE = 'io_throttle'  # Auslöser für AsyncProcess.pause()
+INTERVAL = 5  # Sekunden pro Messung
+RELAX_RATIO = 0.5  # Lockern, wenn die Latenz unter diesem Anteil der Obergrenze liegt ...
+RELAX_SAMPLES = 3  # ... und zwar so viele Messungen in Folge
+
+# Stufe -> (ionice-Klasse, Priorität, angehaltener Anteil des Intervalls)
+LEVELS = [
+    (2, 4, 0.0),
+    (2, 7, 0.0),
+    (3, None, 0.0),
+    (3, None, 0.25),
+    (3, None, 0.5),
+    (3, None, 0.75),
+]
+
+
+def await_ms(previous, current):
+    """
+    :param previous: Zähler aus read_diskstats
+    :param current: Spätere Zähler desselben Geräts
+    :return: Mittlere Dauer pro abgeschlossener Anfrage in Millisekunden (0 ohne I/O)
+    """
+    requests = (current[0] - previous[0]) + (current[4] - previous[4])
+    if requests <= 0:
+        return 0.0
+    return ((current[3] - previous[3]) + (current[7] - previous[7])) / requests
+
+
+def set_ionice(pid, io_class, priority):
+    """
+    Setzt die I/O-Priorität eines Prozesses und aller Nachkommen (pishrink.sh läuft als root, daher über sudo).
+    Nicht über die Prozessgruppe: mit 'use_pty' läuft pishrink.sh in einer eigenen Sitzung.
+
+    :param pid: Wurzel des Prozessbaums; später gestartete Kindprozesse (z.B. xz) erben die Priorität
+    :return: True bei Erfolg
+    """
+    pids = [str(child) for child, _ in process_tree(pid)]
+    if not pids:
+        return False
+    argv = ['ionice', '-c', str(io_class)]
+    if priority is not None:
+        argv += ['-n', str(priority)]
+    return run_privileged(argv + ['-p'] + pids)
+
+
+class IoThrottle:
+    """
+    Regler, der neben einem AsyncProcess in der Ereignisschleife läuft.
+    """
+
+    def __init__(self, path, ceiling_ms, interval=INTERVAL, diskstats=DISKSTATS):
+        """
+        :param path: Image; gemessen wird das Laufwerk, auf dem es liegt
+        :param ceiling_ms: Obergrenze der mittleren Latenz in Millisekunden
+        :param interval: Sekunden pro Messung
+        :param diskstats: Pfad zu /proc/diskstats
+        """
+        self.path = path
+        self.ceiling_ms = ceiling_ms
+        self.interval = interval
+        self.diskstats = diskstats
+        self.level = 0
+        self.calm_samples = 0
+
+    def next_level(self, latency):
+        if latency > self.ceiling_ms:
+            self.calm_samples = 0
+            return min(self.level + 1, len(LEVELS) - 1)
+        if latency < self.ceiling_ms * RELAX_RATIO:
+            self.calm_samples += 1
+            if self.calm_samples >= RELAX_SAMPLES:
+                self.calm_samples = 0
+                return max(self.level - 1, 0)
+        else:
+            self.calm_samples = 0
+        return self.level
+
+    async def run(self, process):
+        """
+        Regelt den Prozess, bis er endet oder der Task abgebrochen wird.
+
+        :param process: AsyncProcess mit gestartetem Prozess
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            device = device_of(self.path)
+            previous = read_diskstats(device, self.diskstats)
+        except OSError as e:
+            previous = None
+            logger.warning(f"[THROTTLE] Laufwerk von {self.path} nicht messbar: {e}")
+        if previous is None:
+            logger.info(f"[THROTTLE] Kein Blockgerät in {self.diskstats} für {self.path}, keine Drosselung.")
+            await asyncio.Event().wait()  # Bis zum Ende des Prozesses nichts tun
+        try:
+            while True:
+                stop_fraction = LEVELS[self.level][2]
+                if stop_fraction and await process.pause(THROTTLE):
+                    try:
+                        await asyncio.sleep(self.interval * stop_fraction)
+                    finally:
+                        await process.resume(THROTTLE)
+                    await asyncio.sleep(self.interval * (1 - stop_fraction))
+                else:
+                    await asyncio.sleep(self.interval)
+                current = read_diskstats(device, self.diskstats)
+                latency = await_ms(previous, current)
+                previous = current
+                level = self.next_level(latency)
+                if level != self.level:
+                    logger.info(f"[THROTTLE] Latenz {latency:.1f} ms (Grenze {self.ceiling_ms} ms), "
+                                f"Stufe {self.level} -> {level}: {self.path}")
+                    await self.apply(loop, process, level)
+        except (OSError, TypeError) as e:
+            # Gerät verschwunden o.ä.: Drosselung beenden, der Shrink läuft weiter
+            logger.error(f"[THROTTLE ERROR] Drosselung beendet: {e}")
+            await asyncio.Event().wait()
+
+    async def apply(self, loop, process, level):
+        io_class, priority, _ = LEVELS[level]
+        if LEVELS[self.level][:2] != (io_class, priority):
+            await loop.run_in_executor(None, set_ionice, process.process.pid, io_class, priority)
+        self.level = level
@@ -0,0 +1,406 @@
+# V0.1a/job_queue.py
+import os
+import time
+import queue
+import threading
+import itertools
+from log_handler import logger  # Zentralen Logger importieren
+from shrink_job import ShrinkJob
+from shrink_history import image_size
+from memory_budget import MemoryBudget
+from space_budget import SpaceBudget, space_needed
+from job_registry import get_registry
+from shrink_utils import BACKUP_PATTERN, delete_old_backups
+from backup_roots import DeviceLimiter, root_for_path
+
+# Zustände eines Jobs in der Warteschlange
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'  # Duplikat: Image wird bzw. wurde bereits anderswo geshrinkt
+ACTIVE_STATES = (QUEUED, RUNNING, PAUSED)
+SCHEDULE_RECHECK = 60  # Sekunden zwischen zwei Prüfungen eines zurückgestellten Jobs
+
+
+class JobInfo:
+    """
+    Zustand eines Jobs, wie er an Clients gemeldet wird.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, img_path, root=None):
+        self.id = next(self._ids)
+        self.img_path = img_path
+        self.root = root  # BackupRoot oder None
+        self.state = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.returncode = None
+        self.progress = None  # Letztes ProgressEvent
+        self.cancel_requested = False
+        self.job = None  # Laufender ShrinkJob
+        self.deferred = None  # Grund, aus dem der Job auf sein Zeitfenster wartet bzw. übersprungen wurde
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'img_path': self.img_path,
+            'root': self.root.path if self.root else None,
+            'state': self.state,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'returncode': self.returncode,
+            'deferred': self.deferred,
+            'progress': self.progress._asdict() if self.progress else None,
+        }
+
+
+class JobQueue:
+    """
+    Warteschlange für Shrink-Jobs mit einem Worker-Pool pro Backup-Wurzel.
+
+    Ein Image wird nur einmal eingereiht, solange es wartet oder läuft. Wurzeln auf
+    derselben Platte teilen sich zusätzlich ein Budget gleichzeitiger Shrinks.
+    """
+
+    def __init__(self, signals, settings_provider, workers=1, history_size=50, roots_provider=None, disk_workers=1,
+                 policy_provider=None, memory_budget=None, space_budget=None, retention_provider=None):
+        """
+        :param signals: MonitorSignals bzw. WorkerSignals für Fortschritt und Fehler
+        :param settings_provider: Funktion ohne Parameter, die die aktuellen Einstellungen liefert
+        :param workers: Gleichzeitige Shrinks pro Wurzel, sofern die Wurzel nichts anderes festlegt
+        :param history_size: Anzahl abgeschlossener Jobs, die für den Status behalten werden
+        :param roots_provider: Funktion ohne Parameter, die die aktuellen BackupRoots liefert
+        :param disk_workers: Gleichzeitige Shrinks pro Laufwerk über alle Wurzeln
+        :param policy_provider: Funktion ohne Parameter, die die aktuelle SchedulePolicy liefert (oder None)
+        :param memory_budget: Gemeinsames MemoryBudget (Standard: eigenes, aus den Einstellungen konfiguriert)
+        :param space_budget: SpaceBudget, z.B. mit dem gemeinsamen SpaceSampler (Standard: eigenes mit statvfs)
+        :param retention_provider: Funktion(img_path), die eine verkürzte Aufbewahrung in Stunden liefert
+                                   (z.B. CapacityForecaster.retention_hours) oder None
+        """
+        self.signals = signals
+        self.settings_provider = settings_provider
+        self.workers = workers
+        self.history_size = history_size
+        self.roots_provider = roots_provider or (lambda: [])
+        self.disk_limiter = DeviceLimiter(disk_workers)
+        self.policy_provider = policy_provider or (lambda: None)
+        self.memory_budget = memory_budget or MemoryBudget()
+        self.space_budget = space_budget or SpaceBudget()
+        self.retention_provider = retention_provider or (lambda img_path: None)
+        self.lock = threading.Lock()
+        self.resumed = threading.Condition(self.lock)
+        self.paused = set()  # Pfade pausierter Wurzeln (z.B. Laufwerk ausgehängt)
+        self.pools = {}  # Wurzelpfad (None für Images außerhalb aller Wurzeln) -> Queue, Threads, Worker-Anzahl
+        self.jobs = []
+        self.listeners = []
+        self.started = False
+
+    def add_listener(self, listener):
+        """
+        Registriert eine Funktion, die bei jeder Zustandsänderung mit JobInfo aufgerufen wird.
+        """
+        self.listeners.append(listener)
+
+    def notify(self, info):
+        for listener in list(self.listeners):
+            try:
+                listener(info)
+            except Exception as e:
+                logger.error(f"[QUEUE ERROR] Listener fehlgeschlagen: {e}")
+
+    def start(self):
+        with self.lock:
+            self.started = True
+            for key in list(self.pools):
+                self.ensure_pool(key, 0)
+        return self
+
+    def ensure_pool(self, key, workers):
+        """
+        Legt den Pool einer Wurzel an bzw. vergrößert ihn. Aufruf nur mit gehaltenem Lock.
+
+        :param key: Wurzelpfad oder None
+        :param workers: Gewünschte Anzahl Worker-Threads
+        :return: Queue des Pools
+        """
+        pool = self.pools.setdefault(key, {'pending': queue.Queue(), 'threads': [], 'workers': 1})
+        # Pools wachsen nur; weniger Worker werden erst nach einem Neustart wirksam
+        pool['workers'] = max(pool['workers'], workers)
+        if self.started:
+            for index in range(len(pool['threads']), pool['workers']):
+                name = f"shrink-worker-{os.path.basename(key or 'default')}-{index}"
+                thread = threading.Thread(target=self.worker, args=(pool['pending'],), name=name, daemon=True)
+                thread.start()
+                pool['threads'].append(thread)
+        return pool['pending']
+
+    def submit(self, img_path):
+        """
+        Reiht ein Image zum Shrinken ein.
+
+        :param img_path: Pfad zum Image
+        :return: JobInfo des neuen oder bereits vorhandenen Jobs (SKIPPED, wenn ein anderer Prozess
+                 das Image bereits geshrinkt hat bzw. gerade shrinkt)
+        """
+        img_path = os.path.realpath(img_path)
+        root = root_for_path(self.roots_provider(), img_path)
+        skipped = get_registry().check(img_path)
+        with self.lock:
+            for info in self.jobs:
+                if info.img_path == img_path and info.state in ACTIVE_STATES:
+                    logger.info(f"[QUEUE] Bereits eingereiht: {img_path}")
+                    return info
+            info = JobInfo(img_path, root)
+            self.jobs.append(info)
+            self.prune()
+            if skipped:
+                info.state = SKIPPED
+                info.deferred = skipped
+                info.finished = time.time()
+            else:
+                pending = self.ensure_pool(root.path if root else None,
+                                           (root.workers if root else None) or self.workers)
+        if skipped:
+            logger.info(f"[QUEUE] Übersprungen, {img_path} {skipped}.")
+            self.notify(info)
+            return info
+        logger.info(f"[QUEUE] Job {info.id} eingereiht ({root.path if root else 'ohne Wurzel'}): {img_path}")
+        pending.put(info)
+        self.notify(info)
+        return info
+
+    def prune(self):
+        finished = [info for info in self.jobs if info.state not in ACTIVE_STATES]
+        for info in finished[:max(0, len(finished) - self.history_size)]:
+            self.jobs.remove(info)
+
+    def pause(self, roots):
+        """
+        Hält die Pools der angegebenen Wurzeln an. Laufende Jobs werden nicht abgebrochen,
+        eingereihte Jobs warten bis resume().
+
+        :param roots: Liste von BackupRoot
+        """
+        with self.lock:
+            self.paused.update(root.path for root in roots)
+        if roots:
+            logger.info(f"[QUEUE] Pausiert: {[root.path for root in roots]}")
+
+    def resume(self, roots):
+        with self.lock:
+            self.paused.difference_update(root.path for root in roots)
+            self.resumed.notify_all()
+        if roots:
+            logger.info(f"[QUEUE] Fortgesetzt: {[root.path for root in roots]}")
+
+    def find(self, job_id):
+        with self.lock:
+            for info in self.jobs:
+                if info.id == job_id:
+                    return info
+        raise KeyError(f"Unbekannter Job: {job_id}")
+
+    def cancel_job(self, job_id):
+        """
+        Bricht einen Job ab. Eingereihte Jobs werden übersprungen, laufende beendet;
+        Loop-Devices und temporäre Mounts von pishrink.sh werden danach freigegeben.
+
+        :param job_id: ID des Jobs
+        :return: JobInfo
+        :raises KeyError: bei unbekannter ID
+        :raises ValueError: wenn der Job bereits beendet ist
+        """
+        info = self.find(job_id)
+        with self.lock:
+            if info.state not in ACTIVE_STATES:
+                raise ValueError(f"Job {job_id} ist bereits beendet ({info.state}).")
+            info.cancel_requested = True
+            job = info.job
+            self.resumed.notify_all()  # Zurückgestellte Jobs sofort beenden
+        self.memory_budget.wake()
+        self.space_budget.wake()
+        logger.info(f"[QUEUE] Job {job_id} wird abgebrochen: {info.img_path}")
+        if job:
+            job.cancel()
+        return info
+
+    def pause_job(self, job_id):
+        """
+        Hält einen laufenden Job an (SIGSTOP), z.B. damit ein gleichzeitiges Backup die volle
+        Bandbreite der Platte erhält. Der Shrink-Platz des Laufwerks bleibt belegt.
+
+        :param job_id: ID des Jobs
+        :return: JobInfo
+        :raises KeyError: bei unbekannter ID
+        :raises ValueError: wenn der Job nicht läuft
+        """
+        return self.set_paused(self.find(job_id), True)
+
+    def resume_job(self, job_id):
+        """
+        Setzt einen angehaltenen Job fort (SIGCONT). Parameter wie pause_job.
+        """
+        return self.set_paused(self.find(job_id), False)
+
+    def set_paused(self, info, paused):
+        expected = RUNNING if paused else PAUSED
+        with self.lock:
+            job = info.job  # finish setzt info.job auf None
+            if info.state != expected or job is None:
+                raise ValueError(f"Job {info.id} ist nicht {'laufend' if paused else 'angehalten'} ({info.state}).")
+        # Signale ohne Sperre senden, sie warten auf die Ereignisschleife
+        if not (job.pause() if paused else job.resume()):
+            raise ValueError(f"Job {info.id} konnte nicht {'angehalten' if paused else 'fortgesetzt'} werden.")
+        with self.lock:
+            # Zwischenzeitlich beendet oder abgebrochen: CANCELLED bzw. DONE nicht überschreiben
+            if info.state != expected or info.job is not job:
+                raise ValueError(f"Job {info.id} wurde währenddessen beendet ({info.state}).")
+            info.state = PAUSED if paused else RUNNING
+        self.notify(info)
+        return info
+
+    def snapshot(self):
+        """
+        :return: Liste der Jobs als Dicts (älteste zuerst)
+        """
+        with self.lock:
+            return [info.to_dict() for info in self.jobs]
+
+    def worker(self, pending):
+        while True:
+            info = pending.get()
+            try:
+                if info.root:
+                    with self.resumed:
+                        # Abgebrochene Jobs nicht erst nach dem Wiedereinhängen beenden (cancel_job weckt)
+                        self.resumed.wait_for(lambda: info.root.path not in self.paused or info.cancel_requested)
+                self.run_job(info)
+            finally:
+                pending.task_done()
+
+    def wait_for_schedule(self, info):
+        """
+        Wartet, bis die SchedulePolicy den Start erlaubt (Zeitfenster, kein Backup, Last).
+
+        :return: False, wenn der Job währenddessen abgebrochen wurde
+        """
+        while not info.cancel_requested:
+            if self.schedule_reason(info) is None:
+                return True
+            with self.resumed:
+                self.resumed.wait(SCHEDULE_RECHECK)
+        return False
+
+    def schedule_reason(self, info):
+        """
+        Prüft die SchedulePolicy einmal und vermerkt den Grund am Job.
+
+        :return: Grund für das Zurückstellen oder None
+        """
+        try:
+            policy = self.policy_provider()
+            reason = policy.defer_reason(info.img_path) if policy else None
+        except Exception as e:
+            # Eine fehlerhafte Richtlinie darf die Warteschlange nicht dauerhaft anhalten
+            logger.error(f"[SCHEDULE ERROR] Zeitplanung fehlgeschlagen, Job startet: {e}")
+            reason = None
+        if reason != info.deferred:
+            info.deferred = reason
+            if reason:
+                logger.info(f"[SCHEDULE] Job {info.id} zurückgestellt ({reason}): {info.img_path}")
+            self.notify(info)
+        return reason
+
+    def run_job(self, info):
+        while True:
+            if info.cancel_requested or not self.wait_for_schedule(info):
+                self.finish(info, -1)
+                return
+            settings = self.settings_provider()
+            backup_pattern = BACKUP_PATTERN
+            if info.root:
+                settings = info.root.job_settings(settings)
+                backup_pattern = info.root.pattern
+            retention = self.retention_provider(info.img_path)
+            if retention is not None and settings.get('delete_backups', False) \
+                    and retention < settings.get('delete_hours', 168):
+                logger.info(f"[QUEUE] Job {info.id}: Aufbewahrung laut Platzprognose {retention:g} statt "
+                            f"{settings.get('delete_hours', 168)} Stunden.")
+                settings = dict(settings, delete_hours=retention)
+            try:
+                disk_slot = self.disk_limiter.semaphore(info.img_path)
+            except OSError as e:
+                self.finish(info, -1)
+                self.signals.error_occurred.emit(f"Image nicht mehr vorhanden: {info.img_path} ({e})")
+                return
+            options = settings.get('pishrink_options', [])
+            self.memory_budget.configure(settings.get('memory_budget_mb'), settings.get('memory_reserve_mb', 256))
+            self.space_budget.configure(settings.get('min_free_space_mb', 1024))
+
+            def on_wait(reason):
+                if reason != info.deferred:
+                    info.deferred = reason
+                    self.notify(info)
+
+            def make_room():
+                # Bei Platzmangel die Aufbewahrung schon vor dem Shrink anwenden (nur wenn aktiviert)
+                if not settings.get('delete_backups', False):
+                    return False
+                return delete_old_backups(info.img_path, settings.get('delete_hours', 168),
+                                          on_error=self.signals.error_occurred.emit, backup_pattern=backup_pattern) > 0
+
+            # Der Job bleibt 'queued', bis das Laufwerk einen Shrink-Platz sowie genug Speicherplatz
+            # und Arbeitsspeicher frei hat
+            with disk_slot, \
+                    self.space_budget.admit(info.id, space_needed(info.img_path, options), on_wait=on_wait,
+                                            cancelled=lambda: info.cancel_requested, make_room=make_room), \
+                    self.memory_budget.admit(info.id, options, image_size(info.img_path), on_wait=on_wait,
+                                             cancelled=lambda: info.cancel_requested) as threads:
+                # Die Zulassungen können Stunden dauern: Zeitfenster, Backups und Auslastung erneut prüfen,
+                # sonst startet der Job z.B. außerhalb von 'shrink_windows'; Plätze freigeben und weiter warten
+                if not info.cancel_requested and self.schedule_reason(info) is not None:
+                    continue
+
+                def on_progress(event):
+                    info.progress = event
+                    self.signals.shrink_progress.emit(info.img_path, event)
+
+                job = ShrinkJob(info.img_path, settings, on_progress=on_progress,
+                                on_error=self.signals.error_occurred.emit, backup_pattern=backup_pattern,
+                                compress_threads=threads)
+                with self.lock:
+                    if info.cancel_requested:
+                        job = None
+                    else:
+                        info.job = job
+                        info.state = RUNNING
+                        info.started = time.time()
+                if job is None:
+                    self.finish(info, -1)
+                    return
+                self.notify(info)
+                returncode = job.run()
+            self.finish(info, returncode, job.skipped)
+            return
+
+    def finish(self, info, returncode, skipped=None):
+        with self.lock:  # Gegen set_paused, das den Zustand nach dem Signal prüft
+            info.returncode = returncode
+            info.finished = time.time()
+            info.job = None
+            if info.cancel_requested:
+                info.state = CANCELLED
+            elif skipped:
+                info.state = SKIPPED
+                info.deferred = skipped
+            else:
+                info.state = DONE if info.returncode == 0 else FAILED
+        logger.info(f"[QUEUE] Job {info.id} beendet ({info.state}): {info.img_path}")
+        self.notify(info)
@@ -0,0 +1,277 @@
+# V0.1a/job_registry.py
+"""
+Systemweite Registrierung laufender Shrinks und Sperre gegen doppelt gestartete Anwendungen.
+
+Ein Backup-Ordner kann mehrere Auslöser liefern (on_created und raspiBackup.log), und es können
+mehrere Prozesse laufen (Tray, Daemon, autoshrink.py). Bevor pishrink.sh startet, beansprucht
+der Job deshalb die aktuelle Version des Images in einer gemeinsamen SQLite-Datenbank:
+
+- Schlüssel ist der Fingerabdruck (Gerät, Inode, Größe, Änderungszeit) des Images
+- Läuft für dasselbe Image bereits ein Job eines lebenden Prozesses, wird abgelehnt
+- Wurde genau diese Version schon erfolgreich geshrinkt (vorher oder nachher), ebenfalls
+- Einträge abgestürzter Prozesse und fehlgeschlagene Jobs können neu beansprucht werden
+
+Der Daemon läuft als root, Tray und autoshrink.py als Benutzer. Die Datenbank liegt deshalb im
+gemeinsamen Zustandsverzeichnis des Dienstes (StateDirectory, Gruppe raphi, setgid) und wird mit
+Modus 0660 angelegt; ohne installierten Dienst neben dem Skript. Ist die Datenbank nicht nutzbar,
+startet kein Job (Fehler im Log), sonst könnten Daemon und Benutzerprozess dasselbe Image shrinken.
+"""
+import os
+import time
+import fcntl
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from log_handler import logger  # Zentralen Logger importieren
+
+# Gemeinsames Zustandsverzeichnis von Daemon und Benutzerprozessen (StateDirectory in auto_shrink.service)
+STATE_DIR = '/var/lib/auto_shrink'
+REGISTRY_FILE = os.path.join(STATE_DIR if os.path.isdir(STATE_DIR) else os.path.dirname(os.path.realpath(__file__)),
+                             'job_registry.db')
+REGISTRY_MODE = 0o660  # SQLite übernimmt den Modus für Journal- und WAL-Dateien
+LOCK_DIR = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+KEEP_SECONDS = 30 * 86400  # Abgeschlossene Einträge so lange aufbewahren
+
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+UNREGISTERED = 0  # Claim-ID, wenn das Image fehlt (pishrink.sh meldet den Fehler)
+UNAVAILABLE = "wird nicht gestartet, Registrierung nicht nutzbar"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS claims (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    claimed REAL NOT NULL,
+    finished REAL,
+    final_size INTEGER,
+    final_mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS claims_inode ON claims(dev, ino);
+"""
+
+ImageVersion = namedtuple('ImageVersion', ['path', 'dev', 'ino', 'size', 'mtime_ns'])
+
+
+def fingerprint(img_path):
+    """
+    :param img_path: Pfad zum Image
+    :return: ImageVersion oder None, wenn das Image nicht (mehr) existiert
+    """
+    path = os.path.realpath(img_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return ImageVersion(path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def create_shared(path, mode=REGISTRY_MODE):
+    """
+    Legt die Datenbank für alle Benutzer der Gruppe schreibbar an (unabhängig von der umask).
+
+    :param path: Pfad zur Datenbank
+    :param mode: Dateimodus
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, mode)
+    except FileExistsError:
+        return
+    try:
+        os.fchmod(fd, mode)
+    finally:
+        os.close(fd)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Prozess eines anderen Benutzers (z.B. Daemon als root)
+    return True
+
+
+class JobRegistry:
+    """
+    Gemeinsame Registrierung aller Shrinks über Prozessgrenzen hinweg.
+    """
+
+    def __init__(self, db_path=REGISTRY_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.ready = False
+
+    @contextmanager
+    def _transaction(self, write=True):
+        # BEGIN IMMEDIATE sperrt die Datenbank für andere Schreiber, Prüfen und Eintragen sind damit atomar;
+        # reine Prüfungen lesen mit BEGIN und brauchen keine Schreibsperre
+        if not self.ready:
+            create_shared(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            if not self.ready:
+                conn.executescript(SCHEMA)
+                self.ready = True
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _conflict(self, conn, version, repair=True):
+        """
+        :param repair: Verwaiste Claims abgestürzter Prozesse als FAILED markieren (nur in Schreib-Transaktionen)
+        :return: Grund, warum die Version nicht beansprucht werden darf, oder None
+        """
+        rows = conn.execute("SELECT * FROM claims WHERE dev = ? AND ino = ? AND path = ? ORDER BY id DESC",
+                            (version.dev, version.ino, version.path)).fetchall()
+        for row in rows:
+            if row['state'] == CLAIMED:
+                if pid_alive(row['pid']):
+                    return f"wird bereits von Prozess {row['pid']} geshrinkt"
+                # Prozess abgestürzt oder beendet, ohne freizugeben
+                if repair:
+                    conn.execute("UPDATE claims SET state = ?, finished = ? WHERE id = ?",
+                                 (FAILED, time.time(), row['id']))
+            elif row['state'] == DONE and ((row['size'], row['mtime_ns']) == (version.size, version.mtime_ns) or
+                                           (row['final_size'], row['final_mtime_ns']) == (version.size, version.mtime_ns)):
+                return "wurde bereits geshrinkt"
+        return None
+
+    def check(self, img_path):
+        """
+        Prüft ohne Eintrag, ob ein Auslöser für das Image ein Duplikat ist.
+
+        :param img_path: Pfad zum Image
+        :return: Grund, warum kein Shrink nötig ist, oder None
+        """
+        version = fingerprint(img_path)
+        if version is None:
+            return None
+        try:
+            with self.lock, self._transaction(write=False) as conn:
+                return self._conflict(conn, version, repair=False)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"[REGISTRY ERROR] Registrierung nicht lesbar ({self.db_path}): {e}")
+            return UNAVAILABLE
+
+    def claim(self, img_path):
+        """
+        Beansprucht die aktuelle Version eines Images für diesen Prozess.
+
+        :param img_path: Pfad zum Image
+        :return: (Claim-ID, None) bei Erfolg, (None, Grund) für ein Duplikat oder eine nicht nutzbare Datenbank
+        """
+        version = fingerprint(img_path)
+        if version is None:
+            return UNREGISTERED, None  # Fehlt das Image, meldet pishrink.sh den Fehler
+        try:
+            with self.lock, self._transaction() as conn:
+                reason = self._conflict(conn, version)
+                if reason:
+                    return None, reason
+                conn.execute("DELETE FROM claims WHERE state != ? AND finished < ?", (CLAIMED, time.time() - KEEP_SECONDS))
+                cursor = conn.execute(
+                    "INSERT INTO claims (path, dev, ino, size, mtime_ns, state, pid, claimed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", tuple(version) + (CLAIMED, os.getpid(), time.time()))
+                return cursor.lastrowid, None
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"[REGISTRY ERROR] Registrierung nicht möglich ({self.db_path}), Job startet nicht: {e}")
+            return None, UNAVAILABLE
+
+    def release(self, claim_id, img_path, success):
+        """
+        Gibt einen Claim frei und merkt sich bei Erfolg die geshrinkte Version.
+
+        :param claim_id: ID aus claim
+        :param img_path: Pfad zum Image
+        :param success: True, wenn der Shrink erfolgreich war
+        """
+        if claim_id == UNREGISTERED:
+            return
+        version = fingerprint(img_path)
+        try:
+            with self.lock, self._transaction() as conn:
+                conn.execute("UPDATE claims SET state = ?, finished = ?, final_size = ?, final_mtime_ns = ? "
+                             "WHERE id = ?", (DONE if success else FAILED, time.time(),
+                                              version.size if version else None,
+                                              version.mtime_ns if version else None, claim_id))
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"[REGISTRY ERROR] Claim {claim_id} konnte nicht freigegeben werden: {e}")
+
+
+class InstanceLock:
+    """
+    Sperre gegen eine zweite Instanz derselben Anwendung (flock, endet automatisch mit dem Prozess).
+    """
+
+    def __init__(self, name, lock_dir=LOCK_DIR):
+        """
+        :param name: Name der Anwendung, z.B. 'tray' oder 'daemon'
+        :param lock_dir: Verzeichnis der Sperrdatei
+        """
+        self.path = os.path.join(lock_dir, f'auto_shrink_{name}.lock')
+        self.file = None
+
+    def acquire(self):
+        """
+        :return: True, wenn keine andere Instanz läuft
+        """
+        lock_file = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self.file = lock_file
+        return True
+
+    def owner(self):
+        """
+        :return: PID der Instanz, die die Sperre hält, oder None
+        """
+        try:
+            with open(self.path, 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(db_path=REGISTRY_FILE):
+    """
+    Liefert die gemeinsame JobRegistry-Instanz für eine Datenbank.
+
+    :param db_path: Pfad zur Datenbank
+    :return: JobRegistry
+    """
+    with _registries_lock:
+        if db_path not in _registries:
+            _registries[db_path] = JobRegistry(db_path)
+        return _registries[db_path]
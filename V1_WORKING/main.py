@@ -1,49 +1,54 @@
 import sys
 import os
-import json
+import startup_profile  # Vor allen anderen Modulen, damit --profile-startup alle Importe misst
+startup_profile.install()
 import threading
-import datetime
-import time
 from PyQt5 import QtWidgets, QtGui
 from PyQt5.QtWidgets import QFileDialog
 from log_handler import logger  # Zentralen Logger importieren
-from backup_monitor import BackupEventHandler, WorkerSignals
-from gui import ShrinkGUI, LogViewer, SettingsDialog
-from watchdog.observers import Observer
-
-def wait_for_mount(mount_point, timeout=60, interval=2):
-    """
-    Warte, bis der angegebene Mount-Punkt gemountet ist.
-
-    :param mount_point: Pfad zum Mount-Punkt (z.B. /media/raphi/hdd/)
-    :param timeout: Maximale Wartezeit in Sekunden
-    :param interval: Überprüfungsintervall in Sekunden
-    :return: True, wenn gemountet; False sonst
-    """
-    start_time = datetime.datetime.now()
-    while not os.path.ismount(mount_point):
-        elapsed = (datetime.datetime.now() - start_time).seconds
-        if elapsed >= timeout:
-            logger.error(f"Timeout: Mount-Punkt {mount_point} nicht gefunden nach {timeout} Sekunden.")
-            return False
-        logger.info(f"Mount-Punkt {mount_point} nicht gefunden. Warte weitere {interval} Sekunden...")
-        time.sleep(interval)
-    logger.info(f"Mount-Punkt {mount_point} ist gemountet.")
-    return True
+from qt_signals import WorkerSignals
+from progress_parser import ProgressEvent, format_progress
+from metrics import SpaceSampler
+from space_budget import SpaceBudget
+from memory_budget import MemoryBudget
+from daemon_client import DaemonClient
+from config import get_config
+from mount_tracker import MountTracker
+from capacity_forecast import CapacityForecaster, describe as describe_forecast
+from job_registry import InstanceLock, get_registry
+from service import (MOUNT_POINT, ObserverManager, load_settings, load_backup_folders, save_backup_folders,
+                     wait_for_mount, start_metrics_export, clean_old_logs)
 
 def main():
     """
     Hauptfunktion der Anwendung.
+
+    Läuft der Daemon (daemon.py), verbindet sich die Tray-Anwendung nur als Client.
+    Mit --standalone überwacht und shrinkt sie wie bisher selbst.
     """
+    # Pfade definieren
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    settings_file = os.path.join(script_dir, 'settings.json')
+    icon_path = os.path.join(script_dir, 'icon.png')
+
+    # Nur eine Tray-Anwendung pro Benutzer, sonst öffnet jedes neue Backup mehrere Dialoge
+    instance_lock = InstanceLock('tray')
+    if not instance_lock.acquire():
+        logger.warning(f"[MAIN] Tray-Anwendung läuft bereits (PID {instance_lock.owner()}), beende.")
+        sys.exit(0)
+
+    # System-Daemon (root) zuerst, dann ein im Benutzerkontext gestarteter
+    client = DaemonClient.locate(load_settings(settings_file))
+    if '--standalone' not in sys.argv and client.is_running():
+        sys.exit(run_attached(client, settings_file, icon_path))
+
     # Pfad zum Mount-Punkt
-    mount_point = "/media/raphi/hdd/"
-    # Maximale Wartezeit in Sekunden
-    mount_timeout = 60
-    # Warteintervall in Sekunden
-    mount_interval = 2
+    mount_point = MOUNT_POINT
+    # Maximale Wartezeit in Sekunden (None: warten, bis die USB-Platte angelaufen ist)
+    mount_timeout = None
 
     # Warten, bis der Mount-Punkt verfügbar ist
-    if not wait_for_mount(mount_point, timeout=mount_timeout, interval=mount_interval):
+    if not wait_for_mount(mount_point, timeout=mount_timeout):
         # Mount-Punkt nicht verfügbar, zeigen eine Fehlermeldung und beenden
         print(f"Mount-Punkt {mount_point} nicht verfügbar nach {mount_timeout} Sekunden.")
         sys.exit(1)
@@ -54,10 +59,6 @@ def main():
 
     logger.debug("PyQt-Anwendung gestartet.")
 
-    # Pfade definieren
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    settings_file = os.path.join(script_dir, 'settings.json')
-    icon_path = os.path.join(script_dir, 'icon.png')
     logger.debug(f"Script-Verzeichnis: {script_dir}")
     logger.debug(f"Einstellungsdatei: {settings_file}")
     logger.debug(f"Icon-Pfad: {icon_path}")
@@ -107,22 +108,37 @@ def main():
     # Liste zur Aufbewahrung der Referenzen auf offene Dialoge
     dialogs = []
 
+    # Zentrale Speicherplatz-Messung und gemeinsame Reservierungen aller Shrink-Dialoge,
+    # vor den Signalen, die sie verwenden
+    space_sampler = SpaceSampler(backup_folders).start()
+    space_budget = SpaceBudget(space_sampler, get_config(settings_file).get('min_free_space_mb'))
+    memory_budget = MemoryBudget()
+
     # Signale
     signals = WorkerSignals()
-    signals.new_image.connect(lambda img_path: open_shrink_gui(app, img_path, settings_file, dialogs))
+    signals.new_image.connect(lambda img_path: open_shrink_gui(app, img_path, settings_file, dialogs, signals,
+                                                               space_budget, memory_budget))
     signals.error_occurred.connect(lambda error: show_error(app, error, dialogs))
 
     # Tray-Icon erstellen und anzeigen
     tray_icon = create_tray_icon(app, settings_file, backup_folders, icon_path, dialogs)
+    signals.shrink_progress.connect(lambda img_path, event: update_tray_progress(tray_icon, img_path, event))
 
     # Backup Event Handler und Observer
-    backup_pattern = r"raspihaupt-dd-backup-(\d{8})-(\d{6})"
-    event_handler = BackupEventHandler(signals, backup_folders, backup_pattern)
-    observer = Observer()
-    for folder in backup_folders:
-        observer.schedule(event_handler, folder, recursive=True)
-    observer.start()
-    logger.info(f"[MAIN] Starten der Überwachung der Ordner: {backup_folders}")
+    observers = ObserverManager(signals, settings_file, space_sampler=space_sampler).start()
+    forecaster = CapacityForecaster(lambda: observers.roots, get_config(settings_file).snapshot, space_sampler).start()
+    add_forecast_menu(tray_icon, forecaster.snapshot)
+    start_metrics_export(settings_file)
+
+    # Überwachung pausieren, solange die Backup-Platte ausgehängt ist
+    mount_tracker = MountTracker([mount_point])
+    mount_tracker.add_listener(observers.set_mount_state)
+    mount_tracker.start()
+
+    # Geänderte Backup-Verzeichnisse ohne Neustart übernehmen
+    config = get_config(settings_file)
+    config.add_listener(observers.on_config_changed)
+    config.start_watching()
 
     # Starten des Log-Reinigungsprozesses
     threading.Thread(target=clean_old_logs, args=(backup_folders,), daemon=True).start()
@@ -133,9 +149,115 @@ def main():
     logger.debug("System-Tray-Icon angezeigt.")
 
     # Starten des Event-Loops
+    startup_profile.mark("Tray angezeigt")
+    startup_profile.report()
     logger.debug("Anwendung in den Event-Loop gestartet.")
     sys.exit(app.exec_())
 
+def run_attached(client, settings_file, icon_path):
+    """
+    Startet die Tray-Anwendung als Client des Daemons: keine eigene Überwachung,
+    Fortschritt und Fehler kommen über den Steuer-Socket.
+
+    :param client: DaemonClient
+    :param settings_file: Pfad zur Einstellungsdatei
+    :param icon_path: Pfad zum Icon
+    :return: Rückgabewert des Event-Loops
+    """
+    app = QtWidgets.QApplication(sys.argv)
+    app.setQuitOnLastWindowClosed(False)
+    logger.info(f"[MAIN] Daemon gefunden, verbinde über {client.socket_path}")
+
+    backup_folders = client.request('status').get('backup_folders', [])
+    dialogs = []
+    signals = WorkerSignals()
+    tray_icon = create_tray_icon(app, settings_file, backup_folders, icon_path, dialogs)
+    signals.new_image.connect(lambda img_path: tray_icon.showMessage(
+        "Auto DD Shrinker", f"Neues Backup wird geshrinkt:\n{os.path.basename(img_path)}"))
+    signals.error_occurred.connect(lambda error: show_error(app, error, dialogs))
+    signals.shrink_progress.connect(lambda img_path, event: update_tray_progress(tray_icon, img_path, event))
+
+    def on_event(message):
+        # Läuft im Thread des Abonnements, Qt-Signale übergeben an den GUI-Thread
+        if message['event'] == 'progress':
+            signals.shrink_progress.emit(message['img_path'], ProgressEvent(**message['progress']))
+        elif message['event'] == 'new_image':
+            signals.new_image.emit(message['img_path'])
+        elif message['event'] == 'error':
+            signals.error_occurred.emit(message['message'])
+
+    client.subscribe(on_event, lambda: signals.error_occurred.emit("Verbindung zum Daemon verloren."))
+    add_job_menu(tray_icon, client, signals)
+    add_forecast_menu(tray_icon, lambda: client.request('status').get('forecast', []))
+    tray_icon.show()
+    startup_profile.mark("Tray angezeigt (Client)")
+    startup_profile.report()
+    return app.exec_()
+
+def add_job_menu(tray_icon, client, signals):
+    """
+    Ergänzt das Tray-Menü um die aktiven Jobs des Daemons mit Anhalten, Fortsetzen und Abbrechen.
+    Die Liste wird bei jedem Öffnen des Menüs neu abgefragt.
+
+    :param tray_icon: QSystemTrayIcon-Instanz
+    :param client: DaemonClient
+    :param signals: WorkerSignals für Fehlermeldungen
+    """
+    tray_menu = tray_icon.contextMenu()
+    jobs_menu = QtWidgets.QMenu("Laufende Jobs", tray_menu)
+    tray_menu.insertMenu(tray_menu.actions()[0], jobs_menu)
+
+    def send(cmd, job_id):
+        try:
+            response = client.request(cmd, job_id=job_id)
+        except OSError as e:
+            response = {'ok': False, 'error': f"Daemon nicht erreichbar: {e}"}
+        if not response.get('ok'):
+            signals.error_occurred.emit(response.get('error', f"{cmd} fehlgeschlagen"))
+
+    def refresh():
+        jobs_menu.clear()
+        try:
+            jobs = client.request('status').get('jobs', [])
+        except OSError:
+            jobs = []
+        jobs = [job for job in jobs if job['state'] in ('queued', 'running', 'paused')]
+        if not jobs:
+            jobs_menu.addAction("Keine aktiven Jobs").setEnabled(False)
+        for job in jobs:
+            job_menu = jobs_menu.addMenu(f"{os.path.basename(job['img_path'])} ({job.get('deferred') or job['state']})")
+            if job['state'] == 'running':
+                job_menu.addAction("Anhalten").triggered.connect(lambda _, job_id=job['id']: send('pause', job_id))
+            elif job['state'] == 'paused':
+                job_menu.addAction("Fortsetzen").triggered.connect(lambda _, job_id=job['id']: send('resume', job_id))
+            job_menu.addAction("Abbrechen").triggered.connect(lambda _, job_id=job['id']: send('cancel', job_id))
+
+    jobs_menu.aboutToShow.connect(refresh)
+
+def add_forecast_menu(tray_icon, forecast_provider):
+    """
+    Ergänzt das Tray-Menü um die Platzprognose je Backup-Wurzel (siehe capacity_forecast.py).
+
+    :param tray_icon: QSystemTrayIcon-Instanz
+    :param forecast_provider: Funktion ohne Parameter, die die Prognosen als Dicts liefert
+    """
+    tray_menu = tray_icon.contextMenu()
+    forecast_menu = QtWidgets.QMenu("Platzprognose", tray_menu)
+    tray_menu.insertMenu(tray_menu.actions()[0], forecast_menu)
+
+    def refresh():
+        forecast_menu.clear()
+        try:
+            forecasts = forecast_provider()
+        except OSError:
+            forecasts = []
+        if not forecasts:
+            forecast_menu.addAction("Noch keine Prognose").setEnabled(False)
+        for forecast in forecasts:
+            forecast_menu.addAction(describe_forecast(forecast)).setEnabled(False)
+
+    forecast_menu.aboutToShow.connect(refresh)
+
 def create_tray_icon(app, settings_file, backup_folders, icon_path, dialogs):
     """
     Erstellen und konfigurieren des System-Tray-Icons.
@@ -164,6 +286,9 @@ def create_tray_icon(app, settings_file, backup_folders, icon_path, dialogs):
         show_logs_action = tray_menu.addAction("Logs anzeigen")
         show_logs_action.triggered.connect(lambda: open_log_viewer(app, backup_folders, dialogs))
 
+        show_history_action = tray_menu.addAction("Shrink-Verlauf anzeigen")
+        show_history_action.triggered.connect(lambda: open_history(app, dialogs))
+
         open_settings_action = tray_menu.addAction("Einstellungen öffnen")
         open_settings_action.triggered.connect(lambda: open_settings(app, settings_file, dialogs))
 
@@ -180,7 +305,7 @@ def create_tray_icon(app, settings_file, backup_folders, icon_path, dialogs):
         QtWidgets.QMessageBox.critical(None, "Fehler", f"Tray-Icon konnte nicht erstellt werden:\n{e}")
         sys.exit(1)
 
-def open_shrink_gui(app, img_path, settings_file, dialogs):
+def open_shrink_gui(app, img_path, settings_file, dialogs, signals=None, space_budget=None, memory_budget=None):
     """
     Öffnet das ShrinkGUI-Fenster.
 
@@ -188,12 +313,37 @@ def open_shrink_gui(app, img_path, settings_file, dialogs):
     :param img_path: Pfad zum Image
     :param settings_file: Pfad zur Einstellungsdatei
     :param dialogs: Liste zur Aufbewahrung der Referenzen auf Dialoge
+    :param signals: WorkerSignals für Fortschrittsmeldungen
+    :param space_budget: Gemeinsames SpaceBudget aller Shrink-Dialoge
+    :param memory_budget: Gemeinsames MemoryBudget aller Shrink-Dialoge
     """
-    gui = ShrinkGUI(img_path, settings_file)
+    # Doppelte Auslöser (on_created und raspiBackup.log) bzw. ein anderer Prozess: kein zweiter Dialog
+    if any(getattr(dialog, 'img_path', None) == img_path and dialog.isVisible() for dialog in dialogs):
+        logger.info(f"[MAIN] Dialog für {img_path} ist bereits geöffnet.")
+        return
+    reason = get_registry().check(img_path)
+    if reason:
+        logger.info(f"[MAIN] Übersprungen, {img_path} {reason}.")
+        return
+    from gui import ShrinkGUI  # Dialoge erst bei Bedarf laden
+    gui = ShrinkGUI(img_path, settings_file, signals, space_budget, memory_budget)
     gui.show()
     dialogs.append(gui)  # Halten Sie eine Referenz
     logger.debug("[MAIN] ShrinkGUI erstellt und angezeigt.")
 
+def update_tray_progress(tray_icon, img_path, event):
+    """
+    Zeigt den Fortschritt des laufenden Shrink-Prozesses im Tooltip des Tray-Icons.
+
+    :param tray_icon: QSystemTrayIcon-Instanz
+    :param img_path: Pfad zum Image
+    :param event: ProgressEvent
+    """
+    if event.phase == 'done':
+        tray_icon.setToolTip("Auto DD Shrinker")
+    else:
+        tray_icon.setToolTip(f"Auto DD Shrinker\n{os.path.basename(img_path)}: {format_progress(event)}")
+
 def open_log_viewer(app, backup_folders, dialogs):
     """
     Öffnet das LogViewer-Fenster.
@@ -202,6 +352,7 @@ def open_log_viewer(app, backup_folders, dialogs):
     :param backup_folders: Liste der Backup-Verzeichnisse
     :param dialogs: Liste zur Aufbewahrung der Referenzen auf Dialoge
     """
+    from gui import LogViewer  # Dialoge erst bei Bedarf laden
     main_log_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'autodds_monitor.log')
     # Standardwert für Tage zum Löschen von Logs, z.B. 7 Tage
     delete_days = 7
@@ -210,6 +361,19 @@ def open_log_viewer(app, backup_folders, dialogs):
     dialogs.append(log_viewer)  # Halten Sie eine Referenz
     logger.debug("[TRAY] Log Viewer geöffnet.")
 
+def open_history(app, dialogs):
+    """
+    Öffnet das Fenster mit dem Shrink-Verlauf.
+
+    :param app: QApplication-Instanz
+    :param dialogs: Liste zur Aufbewahrung der Referenzen auf Dialoge
+    """
+    from gui import HistoryDialog  # Dialoge erst bei Bedarf laden
+    history_dialog = HistoryDialog()
+    history_dialog.show()
+    dialogs.append(history_dialog)  # Halten Sie eine Referenz
+    logger.debug("[TRAY] Shrink-Verlauf geöffnet.")
+
 def open_settings(app, settings_file, dialogs):
     """
     Öffnet das SettingsDialog-Fenster.
@@ -218,6 +382,7 @@ def open_settings(app, settings_file, dialogs):
     :param settings_file: Pfad zur Einstellungsdatei
     :param dialogs: Liste zur Aufbewahrung der Referenzen auf Dialoge
     """
+    from gui import SettingsDialog  # Dialoge erst bei Bedarf laden
     settings_dialog = SettingsDialog(settings_file)
     settings_dialog.show()
     dialogs.append(settings_dialog)  # Halten Sie eine Referenz
@@ -240,65 +405,5 @@ def show_error(app, error_message, dialogs):
     msg_box.exec_()
     logger.error(f"[ERROR] {error_message}")
 
-def clean_old_logs(backup_folders):
-    """
-    Löscht alte Log-Dateien, die älter als 60 Tage sind.
-
-    :param backup_folders: Liste der Backup-Verzeichnisse
-    """
-    main_log_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'autodds_monitor.log')
-    cutoff_time = datetime.datetime.now() - datetime.timedelta(days=60)
-    # Lösche Hauptprozess-Logs älter als 2 Monate (60 Tage)
-    if os.path.exists(main_log_filename):
-        try:
-            modification_time = datetime.datetime.fromtimestamp(os.path.getmtime(main_log_filename))
-            if modification_time < cutoff_time:
-                os.remove(main_log_filename)
-                logger.info(f"[CLEAN] Alte Haupt-Log-Datei gelöscht: {main_log_filename}")
-        except Exception as e:
-            logger.error(f"[ERROR] Konnte alte Haupt-Log-Datei nicht löschen: {e}")
-
-    # Lösche Shrink-Logs älter als 2 Monate
-    for folder in backup_folders:
-        for root, dirs, files in os.walk(folder):
-            for file in files:
-                if file == "shrink.log":
-                    shrink_log_path = os.path.join(root, file)
-                    try:
-                        modification_time = datetime.datetime.fromtimestamp(os.path.getmtime(shrink_log_path))
-                        if modification_time < cutoff_time:
-                            os.remove(shrink_log_path)
-                            logger.info(f"[CLEAN] Alte Shrink-Log-Datei gelöscht: {shrink_log_path}")
-                    except Exception as e:
-                        logger.error(f"[ERROR] Konnte alte Shrink-Log-Datei nicht löschen: {e}")
-
-def load_backup_folders(settings_file):
-    """
-    Lädt die Backup-Verzeichnisse aus der Einstellungsdatei.
-
-    :param settings_file: Pfad zur Einstellungsdatei
-    :return: Liste der Backup-Verzeichnisse
-    """
-    if os.path.exists(settings_file):
-        with open(settings_file, 'r') as f:
-            settings = json.load(f)
-            return settings.get('backup_folders', [])
-    return []
-
-def save_backup_folders(settings_file, backup_folders):
-    """
-    Speichert die Backup-Verzeichnisse in der Einstellungsdatei.
-
-    :param settings_file: Pfad zur Einstellungsdatei
-    :param backup_folders: Liste der Backup-Verzeichnisse
-    """
-    settings = {}
-    if os.path.exists(settings_file):
-        with open(settings_file, 'r') as f:
-            settings = json.load(f)
-    settings['backup_folders'] = backup_folders
-    with open(settings_file, 'w') as f:
-        json.dump(settings, f, indent=4)
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,183 @@
+# V0.1a/memory_budget.py
+"""
+Speicherabhängige Zulassung gleichzeitiger Shrinks.
+
+Der größte Speicherbedarf eines Shrinks entsteht bei der Komprimierung: 'xz -T0' (pishrink -Z -a)
+startet einen Thread pro Kern, jeder braucht bei Stufe 6 rund 166 MiB. Vor dem Start wird der
+Bedarf aus Codec, Stufe und Thread-Anzahl geschätzt und gegen das Budget geprüft:
+
+- Budget: 'memory_budget_mb' (falls gesetzt), höchstens MemAvailable aus /proc/meminfo
+  abzüglich 'memory_reserve_mb'
+- Passt xz nicht mit allen Kernen, wird die Thread-Anzahl gesenkt (PISHRINK_XZ=-T<n>)
+- Passt auch ein Thread nicht, wartet der Job, bis andere Jobs Speicher freigeben
+
+Beispiel in settings.json (4-GB-Pi):
+
+    "memory_budget_mb": 2500,
+    "memory_reserve_mb": 512
+"""
+import os
+import threading
+from contextlib import contextmanager
+from log_handler import logger  # Zentralen Logger importieren
+
+MEMINFO = '/proc/meminfo'
+XZ_LEVEL = 6  # Standardstufe von xz, pishrink.sh setzt keine eigene
+# Speicherbedarf von xz in MiB je Stufe 0-9 (xz -vv): ein Thread bzw. je Thread im Multithread-Modus
+XZ_SINGLE_MIB = [5, 9, 17, 32, 48, 94, 94, 186, 370, 674]
+XZ_THREAD_MIB = [6, 18, 35, 68, 84, 166, 166, 330, 658, 1250]
+GZIP_MIB = 2  # gzip bzw. pro pigz-Thread
+FSCK_BASE_MIB = 64  # e2fsck/resize2fs: Grundbedarf ...
+FSCK_PER_GIB_MIB = 2  # ... plus Bitmaps je GiB Image
+RECHECK_SECONDS = 30  # Wartende Jobs prüfen spätestens so oft neu (MemAvailable ändert sich)
+
+
+def read_mem_available(meminfo=MEMINFO):
+    """
+    :param meminfo: Pfad zu /proc/meminfo
+    :return: MemAvailable in MiB oder None
+    """
+    try:
+        with open(meminfo, 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def compression_of(options):
+    """
+    :param options: PiShrink-Optionen
+    :return: (Codec oder None, parallel)
+    """
+    codec = None
+    for option in options:
+        if option == '-z':
+            codec = 'gzip'
+        elif option == '-Z':
+            codec = 'xz'
+    return codec, '-a' in options
+
+
+def estimate_mib(codec, threads=1, level=XZ_LEVEL, img_size=None):
+    """
+    Schätzt den Spitzenbedarf eines Shrinks (größte Phase).
+
+    :param codec: 'xz', 'gzip' oder None
+    :param threads: Kompressions-Threads (1: sequentiell)
+    :param level: Kompressionsstufe von xz
+    :param img_size: Imagegröße in Bytes (für e2fsck/resize2fs)
+    :return: MiB
+    """
+    fsck = FSCK_BASE_MIB + FSCK_PER_GIB_MIB * (img_size or 0) // 2**30
+    if codec == 'xz':
+        compress = XZ_SINGLE_MIB[level] if threads <= 1 else XZ_THREAD_MIB[level] * threads
+    elif codec == 'gzip':
+        compress = GZIP_MIB * max(1, threads)
+    else:
+        compress = 0
+    return max(fsck, compress)
+
+
+class MemoryBudget:
+    """
+    Vergibt Speicher an gleichzeitig laufende Shrinks.
+    """
+
+    def __init__(self, budget_mib=None, reserve_mib=256, cpus=None, meminfo=MEMINFO):
+        """
+        :param budget_mib: Obergrenze für alle Shrinks zusammen (None: nur MemAvailable)
+        :param reserve_mib: Speicher, der für das übrige System frei bleibt
+        :param cpus: Kerne für 'xz -T0' (Standard: os.cpu_count())
+        :param meminfo: Pfad zu /proc/meminfo
+        """
+        self.budget_mib = budget_mib
+        self.reserve_mib = reserve_mib
+        self.cpus = cpus or os.cpu_count() or 1
+        self.meminfo = meminfo
+        self.condition = threading.Condition()
+        self.reserved = {}  # Schlüssel -> reservierte MiB
+
+    def configure(self, budget_mib, reserve_mib):
+        """
+        Übernimmt geänderte Einstellungen ('memory_budget_mb', 'memory_reserve_mb').
+        """
+        with self.condition:
+            self.budget_mib = budget_mib
+            self.reserve_mib = reserve_mib
+            self.condition.notify_all()
+
+    def wake(self):
+        # Wartende Jobs neu prüfen lassen (z.B. nach einem Abbruch)
+        with self.condition:
+            self.condition.notify_all()
+
+    def free_mib(self):
+        # Aufruf mit gehaltener Condition
+        limits = []
+        reserved = sum(self.reserved.values())
+        if self.budget_mib is not None:
+            limits.append(self.budget_mib - reserved)
+        available = read_mem_available(self.meminfo)
+        if available is not None:
+            # Laufende Jobs erreichen ihre Spitze (Komprimierung) meist erst später, daher ihre Reservierung
+            # zusätzlich abziehen, auch wenn sie damit teilweise doppelt zählt
+            limits.append(available - self.reserve_mib - reserved)
+        return min(limits) if limits else None
+
+    def plan(self, options, img_size=None):
+        """
+        Wählt die größte Thread-Anzahl, die ins freie Budget passt. Aufruf mit gehaltener Condition.
+
+        :return: (Threads oder None für unverändert, MiB) oder None, wenn nichts passt
+        """
+        codec, parallel = compression_of(options)
+        threads = self.cpus if parallel else 1
+        free = self.free_mib()
+        while True:
+            needed = estimate_mib(codec, threads, img_size=img_size)
+            if free is None or needed <= free:
+                return (threads if parallel else None), needed
+            if threads <= 1:
+                return None
+            threads -= 1
+
+    @contextmanager
+    def admit(self, key, options, img_size=None, on_wait=None, cancelled=None):
+        """
+        Reserviert Speicher für einen Shrink und gibt ihn danach wieder frei.
+        Läuft kein anderer Shrink, wird immer zugelassen (sonst würde der Job ewig warten).
+
+        :param key: Eindeutiger Schlüssel des Jobs
+        :param options: PiShrink-Optionen
+        :param img_size: Imagegröße in Bytes
+        :param on_wait: Callback(Grund) beim Warten, Callback(None) beim Start
+        :param cancelled: Funktion ohne Parameter; True bricht das Warten ab
+        :return: Kompressions-Threads (None: Optionen von pishrink.sh unverändert lassen)
+        """
+        with self.condition:
+            while True:
+                planned = self.plan(options, img_size)
+                if planned is None and not self.reserved:
+                    codec, parallel = compression_of(options)
+                    planned = (1 if parallel else None), estimate_mib(codec, 1, img_size=img_size)
+                    logger.warning(f"[MEMORY] Zu wenig Arbeitsspeicher, {key} startet trotzdem mit einem Thread.")
+                if planned is not None or (cancelled and cancelled()):
+                    break
+                if on_wait:
+                    on_wait(f"wartet auf Arbeitsspeicher ({self.free_mib()} MiB frei)")
+                self.condition.wait(RECHECK_SECONDS)
+            threads, needed = planned or (None, 0)
+            self.reserved[key] = needed
+        if on_wait:
+            on_wait(None)
+        if threads is not None and threads < self.cpus:
+            logger.info(f"[MEMORY] {key}: Komprimierung mit {threads} statt {self.cpus} Threads ({needed} MiB).")
+        try:
+            yield threads
+        finally:
+            with self.condition:
+                self.reserved.pop(key, None)
+                self.condition.notify_all()
@@ -0,0 +1,321 @@
+# V0.1a/metrics.py
+import os
+import time
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+
+# Standard-Buckets für Phasendauern in Sekunden (1 s bis 4 h)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    escaped = []
+    for name, value in items:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels):
+        with self.lock:
+            self.values.pop(_label_key(labels), None)
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, state['counts']):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Sammelt alle Metriken und gibt sie im Prometheus-Textformat aus.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Registriert eine Funktion, die vor jeder Ausgabe Gauges aktualisiert.
+
+        :param collector: Funktion ohne Parameter
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """
+        Erzeugt die Ausgabe im Prometheus-Textformat.
+
+        :return: Text der Metriken
+        """
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"[METRICS ERROR] Collector fehlgeschlagen: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+EVENTS_RECEIVED = REGISTRY.register(Counter(
+    'autoshrink_events_received_total', 'Vom BackupEventHandler empfangene Dateisystem-Ereignisse.'))
+EVENTS_DROPPED = REGISTRY.register(Counter(
+    'autoshrink_events_dropped_total', 'Verworfene Dateisystem-Ereignisse nach Grund.'))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'autoshrink_queue_depth', 'Backup-Ordner, die auf raspiBackup.log bzw. ihren Shrink warten.'))
+ACTIVE_JOBS = REGISTRY.register(Gauge(
+    'autoshrink_active_jobs', 'Aktuell laufende Shrink-Prozesse.'))
+JOBS_FINISHED = REGISTRY.register(Counter(
+    'autoshrink_jobs_finished_total', 'Abgeschlossene Shrink-Jobs nach Ergebnis.'))
+JOBS_KILLED = REGISTRY.register(Counter(
+    'autoshrink_jobs_killed_total', 'Wegen Zeitlimit oder Stillstand beendete Shrink-Jobs nach Grund.'))
+PHASE_DURATION = REGISTRY.register(Histogram(
+    'autoshrink_phase_duration_seconds', 'Dauer der Shrink-Phasen in Sekunden.'))
+BYTES_SAVED = REGISTRY.register(Counter(
+    'autoshrink_bytes_saved_total', 'Durch Shrinken und Komprimieren eingesparte Bytes.'))
+ROOT_FREE_BYTES = REGISTRY.register(Gauge(
+    'autoshrink_backup_root_free_bytes', 'Freier Speicherplatz je Backup-Verzeichnis.'))
+ROOT_TOTAL_BYTES = REGISTRY.register(Gauge(
+    'autoshrink_backup_root_size_bytes', 'Gesamtgröße des Dateisystems je Backup-Verzeichnis.'))
+ROOT_FULL_SECONDS = REGISTRY.register(Gauge(
+    'autoshrink_backup_root_full_in_seconds', 'Prognostizierte Zeit, bis das Laufwerk der Backup-Wurzel voll ist.'))
+ROOT_RETENTION_HOURS = REGISTRY.register(Gauge(
+    'autoshrink_backup_root_retention_hours', 'Wirksame Aufbewahrung je Backup-Wurzel (ggf. durch die Prognose verkürzt).'))
+BACKUPS_DELETED = REGISTRY.register(Counter(
+    'autoshrink_backups_deleted_total', 'Gelöschte alte Backup-Ordner.'))
+DELETED_BYTES = REGISTRY.register(Counter(
+    'autoshrink_deleted_bytes_total', 'Durch das Löschen alter Backups freigegebene Bytes.'))
+DELETE_SECONDS = REGISTRY.register(Counter(
+    'autoshrink_delete_seconds_total', 'Für das Löschen alter Backups aufgewendete Zeit in Sekunden.'))
+
+
+class SpaceSampler:
+    """
+    Ermittelt zentral und periodisch den freien Speicherplatz aller Backup-Verzeichnisse.
+
+    Alle Verbraucher (Metriken, Dialoge) lesen den zuletzt gemessenen Wert,
+    statt selbst statvfs aufzurufen.
+    """
+
+    def __init__(self, roots, interval=30):
+        self.roots = list(roots)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.samples = {}  # Verzeichnis -> (frei, gesamt, Zeitpunkt)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def set_roots(self, roots):
+        """
+        Ersetzt die gemessenen Verzeichnisse (z.B. nach geänderten Einstellungen).
+        """
+        with self.lock:
+            for root in set(self.roots) - set(roots):
+                self.samples.pop(root, None)
+                ROOT_FREE_BYTES.remove(root=root)
+                ROOT_TOTAL_BYTES.remove(root=root)
+            self.roots = list(roots)
+        self.sample()
+
+    def sample(self):
+        with self.lock:
+            roots = list(self.roots)
+        for root in roots:
+            try:
+                statvfs = os.statvfs(root)
+            except OSError as e:
+                logger.debug(f"[SPACE] Speicherplatz für {root} nicht verfügbar: {e}")
+                with self.lock:
+                    self.samples.pop(root, None)
+                ROOT_FREE_BYTES.remove(root=root)
+                ROOT_TOTAL_BYTES.remove(root=root)
+                continue
+            free = statvfs.f_bavail * statvfs.f_frsize
+            total = statvfs.f_blocks * statvfs.f_frsize
+            with self.lock:
+                self.samples[root] = (free, total, time.time())
+            ROOT_FREE_BYTES.set(free, root=root)
+            ROOT_TOTAL_BYTES.set(total, root=root)
+
+    def free_bytes(self, path):
+        """
+        Liefert den zuletzt gemessenen freien Speicherplatz für einen Pfad.
+
+        :param path: Backup-Verzeichnis oder ein Pfad darunter
+        :return: Freie Bytes oder None, wenn kein Messwert vorliegt
+        """
+        path = os.path.realpath(path)
+        with self.lock:
+            matches = [root for root in self.samples
+                       if path == os.path.realpath(root) or path.startswith(os.path.realpath(root) + os.sep)]
+            if not matches:
+                return None
+            return self.samples[max(matches, key=len)][0]
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """
+    Startet einen HTTP-Server, der die Metriken unter /metrics ausliefert.
+
+    :param port: TCP-Port
+    :param host: Adresse, an die gebunden wird (Standard: nur lokal)
+    :return: ThreadingHTTPServer-Instanz
+    """
+    # http.server erst laden, wenn der Export aktiviert ist (spart Startzeit)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"[METRICS] {self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"[METRICS] Metriken erreichbar unter http://{host}:{port}/metrics")
+    return server
+
+
+def write_textfile(file_path):
+    """
+    Schreibt die Metriken atomar für den node_exporter Textfile-Collector.
+
+    :param file_path: Zieldatei (Endung .prom)
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, file_path)
+
+
+def start_textfile_writer(file_path, interval=15):
+    """
+    Schreibt die Metriken periodisch in eine Datei.
+
+    :param file_path: Zieldatei (Endung .prom)
+    :param interval: Schreibintervall in Sekunden
+    :return: Thread des Schreibers
+    """
+    def run():
+        while True:
+            try:
+                write_textfile(file_path)
+            except OSError as e:
+                logger.error(f"[METRICS ERROR] Konnte Metrikdatei {file_path} nicht schreiben: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    logger.info(f"[METRICS] Metriken werden alle {interval} Sekunden nach {file_path} geschrieben.")
+    return thread
@@ -0,0 +1,158 @@
+# V0.1a/mount_tracker.py
+"""
+Ereignisbasierte Erkennung von Mount-Punkten.
+
+Der Kernel meldet jede Änderung der Mount-Tabelle über poll() auf
+/proc/self/mountinfo (POLLPRI/POLLERR), dadurch ist kein periodisches
+os.path.ismount nötig. Ohne /proc (z.B. in Containern) wird ersatzweise
+alle paar Sekunden geprüft.
+"""
+import os
+import re
+import select
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+
+MOUNTINFO = '/proc/self/mountinfo'
+
+
+def _unescape(field):
+    # Leerzeichen, Tabs usw. sind in mountinfo oktal maskiert (z.B. \040)
+    return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), field)
+
+
+def parse_mountinfo(text):
+    """
+    :param text: Inhalt von /proc/self/mountinfo
+    :return: Menge der Mount-Punkte
+    """
+    mount_points = set()
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) > 4:
+            mount_points.add(_unescape(fields[4]))
+    return mount_points
+
+
+def parse_mount_sources(text):
+    """
+    :param text: Inhalt von /proc/self/mountinfo
+    :return: Liste von (Quelle, Mount-Punkt), z.B. ('/dev/loop0', '/tmp/tmp.abc123')
+    """
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        # Nach dem Trenner '-' folgen Dateisystemtyp und Quelle
+        if '-' in fields[4:]:
+            separator = fields.index('-', 4)
+            if len(fields) > separator + 2:
+                mounts.append((_unescape(fields[separator + 2]), _unescape(fields[4])))
+    return mounts
+
+
+class MountTracker:
+    """
+    Verfolgt, ob die angegebenen Mount-Punkte eingehängt sind, und meldet Änderungen.
+    """
+
+    def __init__(self, mount_points, mountinfo=MOUNTINFO, fallback_interval=5):
+        """
+        :param mount_points: Zu verfolgende Mount-Punkte
+        :param mountinfo: Pfad zur Mount-Tabelle
+        :param fallback_interval: Prüfintervall in Sekunden, falls mountinfo nicht verfügbar ist
+        """
+        self.mount_points = [os.path.normpath(mount_point) for mount_point in mount_points]
+        self.mountinfo = mountinfo
+        self.fallback_interval = fallback_interval
+        self.condition = threading.Condition()
+        self.mounted = {}
+        self.listeners = []
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.wake_read, self.wake_write = os.pipe()
+        self.update(self.read_mount_points())
+
+    def read_mount_points(self, stream=None):
+        if stream is not None:
+            stream.seek(0)
+            return parse_mountinfo(stream.read())
+        try:
+            with open(self.mountinfo, 'r') as f:
+                return parse_mountinfo(f.read())
+        except OSError:
+            return {mount_point for mount_point in self.mount_points if os.path.ismount(mount_point)}
+
+    def add_listener(self, listener):
+        """
+        Registriert einen Callback listener(mount_point, eingehängt) für Änderungen.
+        Der Callback läuft im Thread des Trackers.
+        """
+        self.listeners.append(listener)
+
+    def is_mounted(self, mount_point):
+        with self.condition:
+            return self.mounted.get(os.path.normpath(mount_point), False)
+
+    def wait_mounted(self, mount_point, timeout=None):
+        """
+        Wartet, bis der Mount-Punkt eingehängt ist (Tracker muss gestartet sein).
+
+        :param mount_point: Mount-Punkt
+        :param timeout: Maximale Wartezeit in Sekunden (None: unbegrenzt)
+        :return: True, wenn eingehängt
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.mounted.get(os.path.normpath(mount_point)), timeout)
+
+    def update(self, current):
+        changes = []
+        with self.condition:
+            for mount_point in self.mount_points:
+                mounted = mount_point in current
+                if self.mounted.get(mount_point) is not None and self.mounted[mount_point] != mounted:
+                    changes.append((mount_point, mounted))
+                self.mounted[mount_point] = mounted
+            self.condition.notify_all()
+        for mount_point, mounted in changes:
+            logger.info(f"[MOUNT] {mount_point} {'eingehängt' if mounted else 'ausgehängt'}")
+            for listener in list(self.listeners):
+                try:
+                    listener(mount_point, mounted)
+                except Exception as e:
+                    logger.error(f"[MOUNT ERROR] Listener fehlgeschlagen: {e}")
+
+    def run(self):
+        try:
+            stream = open(self.mountinfo, 'r')
+        except OSError as e:
+            logger.warning(f"[MOUNT] {self.mountinfo} nicht verfügbar, prüfe alle {self.fallback_interval} s: {e}")
+            while not self.stop_event.wait(self.fallback_interval):
+                self.update(self.read_mount_points())
+            return
+        with stream:
+            poller = select.poll()
+            poller.register(stream.fileno(), select.POLLPRI | select.POLLERR)
+            poller.register(self.wake_read, select.POLLIN)
+            # Stand zwischen Konstruktor und Registrierung nachholen
+            self.update(self.read_mount_points(stream))
+            while not self.stop_event.is_set():
+                events = poller.poll()
+                if any(fd == self.wake_read for fd, _ in events):
+                    break
+                self.update(self.read_mount_points(stream))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="mount-tracker", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        os.write(self.wake_write, b'x')
+        if self.thread:
+            self.thread.join(timeout=5)
+        os.close(self.wake_read)
+        os.close(self.wake_write)
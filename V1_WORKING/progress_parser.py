@@ -0,0 +1,312 @@
+# V0.1a/progress_parser.py
+import re
+import time
+import codecs
+from collections import namedtuple
+
+# Typisiertes Fortschrittsereignis eines Shrink-Prozesses
+# phase:       Schlüssel der aktuellen Phase (siehe PHASE_LABELS)
+# percent:     Fortschritt innerhalb der Phase in Prozent oder None
+# bytes_done:  Bereits verarbeitete Bytes oder None
+# bytes_total: Gesamtgröße in Bytes oder None
+# eta:         Geschätzte Restzeit der Phase in Sekunden oder None
+# message:     Kurzer Text zur Anzeige
+ProgressEvent = namedtuple('ProgressEvent', ['phase', 'percent', 'bytes_done', 'bytes_total', 'eta', 'message'])
+
+# Anzeigenamen der Phasen in Ablaufreihenfolge
+PHASE_LABELS = {
+    'start': 'Start',
+    'copy': 'Image kopieren',
+    'read': 'Partition einlesen',
+    'fsck': 'Dateisystemprüfung',
+    'minsize': 'Mindestgröße ermitteln',
+    'resize': 'Dateisystem verkleinern',
+    'truncate': 'Image kürzen',
+    'compress': 'Komprimieren',
+    'postprocess': 'Nachbearbeitung',
+    'done': 'Abgeschlossen',
+}
+
+# pishrink.sh: info() gibt "<skript>: <text> ..." aus
+INFO_PATTERN = re.compile(r'^\S+\.sh: (.*?)(?: \.\.\.)?$')
+# Zuordnung der pishrink-Meldungen zu Phasen
+INFO_PHASES = [
+    (re.compile(r'^Copying '), 'copy'),
+    (re.compile(r'^Gathering data'), 'read'),
+    (re.compile(r'^(Checking filesystem|Filesystem error detected|Trying to recover)'), 'fsck'),
+    (re.compile(r'^Shrinking filesystem'), 'resize'),
+    (re.compile(r'^Shrinking image'), 'truncate'),
+    (re.compile(r'^Using \S+ on the shrunk image'), 'compress'),
+    (re.compile(r'^Shrunk '), 'done'),
+]
+# Abschlusszeile von e2fsck -p, danach folgt resize2fs -P
+E2FSCK_SUMMARY_PATTERN = re.compile(r'\d+/\d+ files .*\d+/\d+ blocks')
+# resize2fs -p: "Begin pass 2 (max = 12345)"
+RESIZE_PASS_PATTERN = re.compile(r'^Begin pass (\d+) \(max = (\d+)\)')
+# resize2fs -p zeichnet einen 40 Zeichen breiten Balken aus '-' und überschreibt ihn mit 'X'
+RESIZE_BAR_WIDTH = 40
+RESIZE_BAR_PATTERN = re.compile(r'^(.*?)\s*-{%d}' % RESIZE_BAR_WIDTH)
+# xz -v: "  12.3 %   120 MiB / 1,000 MiB = 0.120   10 MiB/s   0:12   1 min 30 s"
+XZ_PROGRESS_PATTERN = re.compile(
+    r'^\s*(\d+(?:[.,]\d+)?) %\s+([\d.,]+ \w?i?B) / ([\d.,]+ \w?i?B)\s*=\s*[\d.,-]+\s+[\d.,]+ \w?i?B/s\s+[\d:]+\s*(.*)$')
+# gzip -v: "image.img:	 85.3% -- replaced with image.img.gz"
+GZIP_RESULT_PATTERN = re.compile(r'^(.*):\s+(-?\d+(?:\.\d+)?)% -- (?:replaced with|created) (.*)$')
+
+SIZE_UNITS = {'B': 1, 'KiB': 2**10, 'MiB': 2**20, 'GiB': 2**30, 'TiB': 2**40,
+              'KB': 10**3, 'MB': 10**6, 'GB': 10**9, 'TB': 10**12}
+
+
+def parse_size(text):
+    """
+    Wandelt eine Größenangabe wie "1,000 MiB" in Bytes um.
+
+    :param text: Größenangabe mit Einheit
+    :return: Anzahl Bytes oder None
+    """
+    try:
+        number, unit = text.split()
+        return int(float(number.replace(',', '')) * SIZE_UNITS[unit])
+    except (ValueError, KeyError):
+        return None
+
+
+def parse_remaining(text):
+    """
+    Wandelt die Restzeit von xz ("1 min 30 s", "2 h 5 min", "0:45") in Sekunden um.
+
+    :param text: Restzeit-Text
+    :return: Sekunden oder None
+    """
+    text = text.strip()
+    if not text:
+        return None
+    if re.match(r'^[\d:]+$', text):
+        seconds = 0
+        for part in text.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    factors = {'s': 1, 'min': 60, 'h': 3600, 'd': 86400}
+    seconds = 0
+    found = False
+    for value, unit in re.findall(r'(\d+)\s*(s|min|h|d)\b', text):
+        seconds += int(value) * factors[unit]
+        found = True
+    return seconds if found else None
+
+
+class ProgressParser:
+    """
+    Zerlegt den rohen Ausgabestrom von pishrink.sh in Textzeilen und ProgressEvents.
+
+    Zeilen, die mit '\\r' enden (Fortschrittsanzeigen), werden nicht als Text
+    weitergereicht, sondern nur als Fortschritt ausgewertet.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.phase = 'start'
+        self.phase_started = clock()
+        self.resize_pass = None
+        self.resize_pass_started = None
+        self.last_bar_filled = None
+        self.buffer = ''
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def feed(self, data):
+        """
+        Verarbeitet einen Block Ausgabe (bytes oder str).
+
+        :param data: Ausgabeblock
+        :return: Tupel (Liste der vollständigen Textzeilen, Liste der ProgressEvents)
+        """
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        self.buffer += data
+        lines = []
+        events = []
+        while True:
+            match = re.search(r'[\r\n]', self.buffer)
+            if not match:
+                break
+            segment = self.buffer[:match.start()]
+            terminator = match.group()
+            self.buffer = self.buffer[match.end():]
+            event = self._parse_segment(segment)
+            if event:
+                events.append(event)
+            if terminator == '\n':
+                line = self._clean(segment)
+                if line:
+                    lines.append(line)
+        # Unvollständige Zeile: resize2fs-Balken wächst ohne Zeilenende
+        event = self._parse_bar(self.buffer)
+        if event:
+            events.append(event)
+        return lines, events
+
+    def flush(self):
+        """
+        Gibt den restlichen Puffer als letzte Zeile zurück.
+
+        :return: Tupel (Liste der Textzeilen, Liste der ProgressEvents)
+        """
+        lines, events = self.feed(self._decoder.decode(b'', final=True))
+        if self.buffer:
+            event = self._parse_segment(self.buffer)
+            if event:
+                events.append(event)
+            line = self._clean(self.buffer)
+            if line:
+                lines.append(line)
+            self.buffer = ''
+        return lines, events
+
+    def _clean(self, segment):
+        # Rücktaste und Fortschrittsbalken aus der Textzeile entfernen
+        if '\b' in segment:
+            segment = re.sub(r'-*\x08+', '', segment)
+        return segment.rstrip()
+
+    def _set_phase(self, phase, message):
+        self.phase = phase
+        self.phase_started = self.clock()
+        self.resize_pass = None
+        self.last_bar_filled = None
+        return ProgressEvent(phase, None, None, None, None, message)
+
+    def _parse_segment(self, segment):
+        text = segment.strip()
+        if not text:
+            return None
+
+        match = INFO_PATTERN.match(text)
+        if match:
+            message = match.group(1)
+            for pattern, phase in INFO_PHASES:
+                if pattern.match(message):
+                    percent = 100.0 if phase == 'done' else None
+                    event = self._set_phase(phase, message)
+                    return event._replace(percent=percent)
+            return ProgressEvent(self.phase, None, None, None, None, message)
+
+        if self.phase == 'fsck' and E2FSCK_SUMMARY_PATTERN.search(text):
+            return self._set_phase('minsize', PHASE_LABELS['minsize'])
+
+        match = RESIZE_PASS_PATTERN.match(text)
+        if match:
+            self.resize_pass = int(match.group(1))
+            self.resize_pass_started = self.clock()
+            self.last_bar_filled = None
+            return ProgressEvent('resize', 0.0, None, None, None, f"Durchlauf {self.resize_pass}")
+
+        event = self._parse_bar(segment)
+        if event:
+            return event
+
+        match = XZ_PROGRESS_PATTERN.match(text)
+        if match:
+            percent = float(match.group(1).replace(',', '.'))
+            return ProgressEvent('compress', percent, parse_size(match.group(3)), None,
+                                 parse_remaining(match.group(4)), text)
+
+        match = GZIP_RESULT_PATTERN.match(text)
+        if match:
+            return ProgressEvent('compress', 100.0, None, None, 0, f"Komprimiert: {match.group(3)}")
+        return None
+
+    def _parse_bar(self, segment):
+        if self.resize_pass is None or '-' * RESIZE_BAR_WIDTH not in segment:
+            return None
+        match = RESIZE_BAR_PATTERN.match(segment)
+        if not match:
+            return None
+        rest = segment[match.end():]
+        filled = min(rest.count('X'), RESIZE_BAR_WIDTH)
+        if filled == self.last_bar_filled:
+            return None
+        self.last_bar_filled = filled
+        percent = filled * 100.0 / RESIZE_BAR_WIDTH
+        eta = None
+        if 0 < percent < 100:
+            elapsed = self.clock() - self.resize_pass_started
+            eta = elapsed * (100.0 - percent) / percent
+        label = match.group(1).strip() or f"Durchlauf {self.resize_pass}"
+        return ProgressEvent('resize', percent, None, None, eta, label)
+
+
+class ProgressThrottle:
+    """
+    Begrenzt die Anzahl der Fortschrittsaktualisierungen für GUI und Tray.
+
+    Phasenwechsel werden immer durchgelassen, Prozentänderungen höchstens
+    alle min_interval Sekunden.
+    """
+
+    def __init__(self, min_interval=0.5, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.clock = clock
+        self.last_event = None
+        self.last_time = 0.0
+
+    def accept(self, event):
+        """
+        Prüft, ob ein ProgressEvent weitergereicht werden soll.
+
+        :param event: ProgressEvent
+        :return: True, wenn das Ereignis angezeigt werden soll
+        """
+        now = self.clock()
+        last = self.last_event
+        if last is None or event.phase != last.phase or event.percent == 100.0 \
+                or now - self.last_time >= self.min_interval:
+            self.last_event = event
+            self.last_time = now
+            return True
+        return False
+
+
+def format_progress(event):
+    """
+    Formatiert ein ProgressEvent als kurze Textzeile (z.B. für den Tray-Tooltip).
+
+    :param event: ProgressEvent
+    :return: Anzeigetext
+    """
+    text = PHASE_LABELS.get(event.phase, event.phase)
+    if event.percent is not None:
+        text += f" {event.percent:.0f}%"
+    if event.eta:
+        minutes, seconds = divmod(int(event.eta), 60)
+        text += f" (noch {minutes:d}:{seconds:02d})"
+    return text
+
+
+def read_process_output(stream, parser, on_line, on_progress, throttle=None, chunk_size=65536):
+    """
+    Liest den Ausgabestrom eines Prozesses blockweise und verteilt Zeilen und Fortschritt.
+
+    :param stream: Binärer Ausgabestrom (z.B. process.stdout)
+    :param parser: ProgressParser-Instanz
+    :param on_line: Callback für jede vollständige Textzeile
+    :param on_progress: Callback für gedrosselte ProgressEvents
+    :param throttle: Optionale ProgressThrottle-Instanz
+    :param chunk_size: Blockgröße beim Lesen
+    """
+    throttle = throttle or ProgressThrottle()
+    read = getattr(stream, 'read1', stream.read)
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        lines, events = parser.feed(data)
+        for line in lines:
+            on_line(line)
+        for event in events:
+            if throttle.accept(event):
+                on_progress(event)
+    lines, events = parser.flush()
+    for line in lines:
+        on_line(line)
+    for event in events:
+        if throttle.accept(event):
+            on_progress(event)
@@ -0,0 +1,7 @@
+# V0.1a/qt_signals.py
+from PyQt5.QtCore import pyqtSignal, QObject
+
+class WorkerSignals(QObject):
+    new_image = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+    shrink_progress = pyqtSignal(str, object)  # Image-Pfad, ProgressEvent
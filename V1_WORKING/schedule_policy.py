@@ -0,0 +1,222 @@
+# V0.1a/schedule_policy.py
+"""
+Zeitplanung für Shrinks: erlaubte Zeitfenster und Regeln, wann ein Shrink zurückgestellt wird.
+
+Beispiel in settings.json:
+
+    "shrink_windows": ["22:00-06:00", "12:00-13:00"],
+    "defer_during_backup": true,
+    "max_load_average": 2.5,
+    "max_disk_utilization": 60
+
+Ein Shrink (einschließlich der Komprimierung, die pishrink.sh im selben Lauf ausführt) startet
+nur innerhalb eines Fensters, wenn kein Backup läuft und Systemlast sowie Auslastung des
+Laufwerks (aus /proc/diskstats) unter den Grenzen liegen. Sonst wartet er in der Warteschlange
+und startet von selbst, sobald alle Regeln erfüllt sind.
+"""
+import os
+import re
+import time
+import datetime
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+
+DISKSTATS = '/proc/diskstats'
+SYS_DEV_BLOCK = '/sys/dev/block'
+PROC = '/proc'
+BACKUP_PROCESS = 'raspiBackup'  # Prozessname (comm) von raspiBackup.sh
+MIN_SAMPLE_INTERVAL = 1.0  # Sekunden zwischen zwei Messungen der Laufwerksauslastung
+
+
+def parse_window(text):
+    """
+    :param text: Zeitfenster 'HH:MM-HH:MM', darf über Mitternacht gehen (z.B. '22:00-06:00')
+    :return: (Beginn, Ende) in Minuten seit Mitternacht
+    :raises ValueError: bei ungültiger Angabe
+    """
+    match = re.fullmatch(r'\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*', str(text))
+    if not match:
+        raise ValueError(f"Ungültiges Zeitfenster: {text!r} (z.B. '22:00-06:00')")
+    start_h, start_m, end_h, end_m = (int(group) for group in match.groups())
+    if start_h > 24 or end_h > 24 or start_m > 59 or end_m > 59:
+        raise ValueError(f"Ungültige Uhrzeit im Zeitfenster: {text!r}")
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+
+def in_windows(windows, now=None):
+    """
+    :param windows: Liste von (Beginn, Ende) in Minuten; leer bedeutet jederzeit
+    :param now: datetime (Standard: jetzt)
+    :return: True, wenn der Zeitpunkt in einem Fenster liegt
+    """
+    if not windows:
+        return True
+    now = now or datetime.datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return True
+        elif minute >= start or minute < end:
+            return True
+    return False
+
+
+def device_of(path):
+    """
+    :param path: Datei oder Verzeichnis
+    :return: (major, minor) des Blockgeräts, auf dem der Pfad liegt
+    """
+    st_dev = os.stat(path).st_dev
+    return os.major(st_dev), os.minor(st_dev)
+
+
+def disk_of(path, sys_dev_block=SYS_DEV_BLOCK):
+    """
+    :param path: Datei oder Verzeichnis
+    :param sys_dev_block: Pfad zu /sys/dev/block
+    :return: (major, minor) der physischen Platte; bei einer Partition das übergeordnete Gerät,
+             ohne sysfs-Eintrag (z.B. tmpfs, NFS) das Gerät aus device_of
+    """
+    device = device_of(path)
+    entry = os.path.realpath(os.path.join(sys_dev_block, f"{device[0]}:{device[1]}"))
+    if not os.path.exists(os.path.join(entry, 'partition')):
+        return device
+    try:
+        with open(os.path.join(os.path.dirname(entry), 'dev'), 'r') as f:
+            major, minor = f.read().strip().split(':')
+        return int(major), int(minor)
+    except (OSError, ValueError):
+        return device
+
+
+def read_diskstats(device, diskstats=DISKSTATS):
+    """
+    :param device: (major, minor)
+    :param diskstats: Pfad zu /proc/diskstats
+    :return: Zähler des Geräts ab 'reads completed' als Liste von int, oder None
+    """
+    with open(diskstats, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) > 13 and (int(fields[0]), int(fields[1])) == device:
+                return [int(field) for field in fields[3:]]
+    return None
+
+
+def backup_process_running(proc=PROC):
+    """
+    :param proc: Pfad zu /proc
+    :return: True, wenn ein raspiBackup-Prozess läuft
+    """
+    for pid in os.listdir(proc):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, pid, 'comm'), 'r') as f:
+                if f.read().startswith(BACKUP_PROCESS):
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+class DiskLoad:
+    """
+    Auslastung von Laufwerken aus /proc/diskstats (Anteil der Zeit mit laufendem I/O).
+    Die Auslastung wird zwischen zwei Aufrufen für dasselbe Laufwerk gemittelt.
+    """
+
+    def __init__(self, diskstats=DISKSTATS):
+        self.diskstats = diskstats
+        self.lock = threading.Lock()
+        self.samples = {}  # (major, minor) -> (io_ticks in ms, Zeitpunkt)
+
+    def read_ticks(self, device):
+        stats = read_diskstats(device, self.diskstats)
+        return stats[9] if stats else None  # Millisekunden mit laufendem I/O
+
+    def utilization(self, path, block=True):
+        """
+        :param path: Datei oder Verzeichnis auf dem Laufwerk
+        :param block: Ohne frühere Messung MIN_SAMPLE_INTERVAL Sekunden messen (sonst None liefern)
+        :return: Auslastung in Prozent oder None (z.B. kein Blockgerät)
+        """
+        device = device_of(path)
+        with self.lock:
+            previous = self.samples.get(device)
+            current = (self.read_ticks(device), time.monotonic())
+            if current[0] is None:
+                return None
+            if previous is None or current[1] - previous[1] < MIN_SAMPLE_INTERVAL:
+                if not block:
+                    self.samples.setdefault(device, current)
+                    return None
+                previous = current
+                time.sleep(MIN_SAMPLE_INTERVAL)
+                current = (self.read_ticks(device), time.monotonic())
+            self.samples[device] = current
+        return min(100.0, 100.0 * (current[0] - previous[0]) / ((current[1] - previous[1]) * 1000))
+
+
+class SchedulePolicy:
+    """
+    Entscheidet, ob ein Shrink jetzt starten darf.
+    """
+
+    def __init__(self, windows=(), defer_during_backup=True, max_load_average=None, max_disk_utilization=None,
+                 disk_load=None, backup_in_progress=None):
+        """
+        :param windows: Zeitfenster als Strings 'HH:MM-HH:MM' (leer: jederzeit)
+        :param defer_during_backup: Zurückstellen, solange ein Backup läuft
+        :param max_load_average: Grenze für die Systemlast der letzten Minute
+        :param max_disk_utilization: Grenze für die Auslastung des Laufwerks in Prozent
+        :param disk_load: Gemeinsame DiskLoad-Instanz (hält die vorherigen Messungen)
+        :param backup_in_progress: Optionale Funktion ohne Parameter, z.B. wartende Backup-Ordner der Observer
+        :raises ValueError: bei ungültigen Zeitfenstern
+        """
+        self.windows = [parse_window(window) for window in windows]
+        self.defer_during_backup = defer_during_backup
+        self.max_load_average = max_load_average
+        self.max_disk_utilization = max_disk_utilization
+        self.disk_load = disk_load or DiskLoad()
+        self.backup_in_progress = backup_in_progress
+
+    @classmethod
+    def from_settings(cls, settings, disk_load=None, backup_in_progress=None):
+        windows = []
+        for window in settings.get('shrink_windows') or []:
+            try:
+                parse_window(window)
+                windows.append(window)
+            except ValueError as e:
+                logger.error(f"[CONFIG ERROR] Zeitfenster übersprungen: {e}")
+        return cls(windows, settings.get('defer_during_backup', True), settings.get('max_load_average'),
+                   settings.get('max_disk_utilization'), disk_load, backup_in_progress)
+
+    def defer_reason(self, path, now=None, block=True):
+        """
+        :param path: Image, dessen Laufwerk geprüft wird
+        :param now: datetime für die Zeitfenster (Standard: jetzt)
+        :param block: Laufwerksauslastung notfalls kurz messen (siehe DiskLoad.utilization)
+        :return: Grund für das Zurückstellen oder None, wenn der Shrink starten darf
+        """
+        if not in_windows(self.windows, now):
+            return "außerhalb der Zeitfenster"
+        if self.defer_during_backup:
+            if (self.backup_in_progress and self.backup_in_progress()) or backup_process_running():
+                return "Backup läuft"
+        if self.max_load_average is not None:
+            load = os.getloadavg()[0]
+            if load > self.max_load_average:
+                return f"Systemlast {load:.2f} > {self.max_load_average:g}"
+        if self.max_disk_utilization is not None:
+            try:
+                utilization = self.disk_load.utilization(path, block)
+            except OSError as e:
+                logger.warning(f"[SCHEDULE] Laufwerksauslastung nicht messbar für {path}: {e}")
+                utilization = None
+            if utilization is not None and utilization > self.max_disk_utilization:
+                return f"Laufwerk zu {utilization:.0f} % ausgelastet"
+        return None
+
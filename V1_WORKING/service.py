@@ -0,0 +1,319 @@
+# V0.1a/service.py
+"""
+Qt-freie Bausteine für den Start der Überwachung, gemeinsam genutzt von
+Tray-Anwendung (main.py) und Daemon (daemon.py).
+"""
+import os
+import time
+import datetime
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+from metrics import start_http_server, start_textfile_writer
+from config import get_config
+from backup_roots import load_roots
+from mount_tracker import MountTracker
+from folder_tracker import TTL_SECONDS
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+MAIN_LOG_FILE = os.path.join(SCRIPT_DIR, 'autodds_monitor.log')
+MOUNT_POINT = "/media/raphi/hdd/"
+BACKUP_IDLE_SECONDS = 600  # Ohne Änderung seit so vielen Sekunden gilt ein Backup nicht mehr als laufend
+
+
+def load_settings(settings_file):
+    """
+    Lädt die Einstellungsdatei.
+
+    :param settings_file: Pfad zur Einstellungsdatei
+    :return: Dict der Einstellungen (mit Standardwerten, zwischengespeichert)
+    """
+    return get_config(settings_file).snapshot()
+
+
+class ObserverManager:
+    """
+    Hält den Observer und startet ihn neu, wenn sich 'backup_folders' oder 'backup_roots'
+    in den Einstellungen ändern.
+
+    Jede Backup-Wurzel erhält einen eigenen BackupEventHandler mit ihrem Ordnermuster.
+    Die Handler bleiben beim Neustart erhalten, damit bereits erkannte Ordner
+    nicht erneut gemeldet werden.
+
+    Wurzeln auf einem ausgehängten Laufwerk werden pausiert (siehe set_mount_state).
+    """
+
+    def __init__(self, signals, settings_file, space_sampler=None):
+        self.signals = signals
+        self.settings_file = settings_file
+        self.space_sampler = space_sampler
+        self.lock = threading.Lock()
+        self.observer = None
+        self.recorder = None
+        self.roots = []
+        self.event_handlers = {}  # (Pfad, Muster) -> BackupEventHandler
+        self.offline = {}  # Ausgehängter Mount-Punkt -> Zeitpunkt des Aushängens
+        self.tracker_ttl = TTL_SECONDS  # Siehe configure_trackers
+
+    @property
+    def backup_folders(self):
+        return [root.path for root in self.roots]
+
+    def is_offline(self, root):
+        return any(os.path.commonpath([root.realpath, mount_point]) == mount_point for mount_point in self.offline)
+
+    def backup_in_progress(self):
+        """
+        :return: True, wenn in einem überwachten Verzeichnis ein Backup-Ordner noch geschrieben wird
+        """
+        # Abgebrochene Backups bekommen nie ein raspiBackup.log, daher zählen nur kürzlich geänderte Ordner
+        cutoff = time.time() - BACKUP_IDLE_SECONDS
+        for handler in list(self.event_handlers.values()):
+            for folder in list(handler.waiting_folders):
+                try:
+                    with os.scandir(folder) as entries:
+                        if any(entry.stat().st_mtime >= cutoff for entry in entries):
+                            return True
+                except OSError:
+                    continue
+        return False
+
+    def event_handler(self, root):
+        # watchdog erst laden, wenn tatsächlich überwacht wird (nicht im Client-Modus)
+        from backup_monitor import BackupEventHandler
+        key = (root.realpath, root.pattern)
+        if key not in self.event_handlers:
+            self.event_handlers[key] = BackupEventHandler(self.signals, root.path, root.pattern)
+            self.event_handlers[key].tracker.configure(self.tracker_ttl)
+        return self.event_handlers[key]
+
+    def configure_trackers(self, settings):
+        """
+        Hält erledigte Backup-Ordner mindestens so lange wie die längste Aufbewahrung als Duplikate fest,
+        damit spätere Ereignisse in noch vorhandenen Ordnern keinen zweiten Shrink auslösen.
+
+        :param settings: Globale Einstellungen
+        """
+        hours = [settings.get('delete_hours') or 0]
+        hours += [root.job_settings(settings).get('delete_hours') or 0 for root in self.roots]
+        self.tracker_ttl = max(TTL_SECONDS, max(hours) * 3600)
+        for handler in list(self.event_handlers.values()):
+            handler.tracker.configure(self.tracker_ttl)
+
+    def start(self, roots=None):
+        """
+        Startet die Überwachung (bzw. startet sie neu).
+
+        :param roots: Liste von BackupRoot (Standard: aus den Einstellungen)
+        """
+        from watchdog.observers import Observer
+        settings = load_settings(self.settings_file)
+        if roots is None:
+            roots = load_roots(settings)
+        with self.lock:
+            self._stop_observer()
+            self.roots = list(roots)
+            self.configure_trackers(settings)
+            if self.space_sampler:
+                self.space_sampler.set_roots(self.backup_folders)
+            observer = Observer()
+            watched = []
+            for root in self.roots:
+                if self.is_offline(root):
+                    logger.info(f"[MAIN] Laufwerk ausgehängt, Überwachung pausiert: {root.path}")
+                elif os.path.isdir(root.path):
+                    observer.schedule(self.event_handler(root), root.path, recursive=True)
+                    watched.append(root.path)
+                else:
+                    logger.error(f"[MAIN] Backup-Verzeichnis nicht gefunden: {root.path}")
+            if self.recorder is None:
+                self.recorder = start_event_trace(self.settings_file, observer, watched)
+            else:
+                # Aufzeichnung fortsetzen statt die Trace-Datei neu anzulegen
+                for folder in watched:
+                    observer.schedule(self.recorder, folder, recursive=True)
+            observer.start()
+            self.observer = observer
+        logger.info(f"[MAIN] Starten der Überwachung der Ordner: {self.backup_folders}")
+        return self
+
+    def on_config_changed(self, changed, config):
+        if 'delete_hours' in changed:
+            with self.lock:
+                self.configure_trackers(config.snapshot())
+        if changed & {'backup_folders', 'backup_roots'}:
+            roots = load_roots(config.snapshot())
+            if roots != self.roots:
+                logger.info(f"[CONFIG] Backup-Verzeichnisse geändert, Überwachung wird neu gestartet: "
+                            f"{[root.path for root in roots]}")
+                self.start(roots)
+
+    def set_mount_state(self, mount_point, mounted):
+        """
+        Pausiert die Wurzeln unterhalb eines ausgehängten Mount-Punkts bzw. nimmt sie
+        nach dem Einhängen wieder auf und holt die verpassten Backup-Ordner nach.
+        Als Listener für MountTracker geeignet.
+
+        :param mount_point: Mount-Punkt
+        :param mounted: True, wenn eingehängt
+        :return: Liste der betroffenen BackupRoots
+        """
+        mount_point = os.path.realpath(mount_point)
+        with self.lock:
+            if mounted == (mount_point not in self.offline):
+                return []
+            paused_at = self.offline.pop(mount_point, None) if mounted else None
+            if not mounted:
+                self.offline[mount_point] = time.time()
+            affected = [root for root in self.roots
+                        if os.path.commonpath([root.realpath, mount_point]) == mount_point]
+        self.start(self.roots)
+        if mounted and paused_at is not None:
+            self.catch_up(affected, paused_at)
+        return affected
+
+    def catch_up(self, roots, since):
+        """
+        Meldet Backup-Ordner, die seit 'since' geändert wurden, als wären sie vom Observer erkannt worden.
+
+        :param roots: Liste von BackupRoot
+        :param since: Zeitpunkt (Epoche), ab dem Ordner nachgeholt werden
+        """
+        for root in roots:
+            handler = self.event_handler(root)
+            try:
+                with os.scandir(root.path) as entries:
+                    folders = [entry.path for entry in entries if entry.is_dir() and root.matches_folder(entry.name)
+                               and entry.stat().st_mtime >= since]
+            except OSError as e:
+                logger.error(f"[MAIN] Nachholen in {root.path} fehlgeschlagen: {e}")
+                continue
+            for folder in folders:
+                if handler.tracker.arm(folder):
+                    logger.info(f"[MAIN] Backup-Ordner während der Pause entstanden, wird nachgeholt: {folder}")
+                    handler.start_monitoring_folder(folder)
+
+    def _stop_observer(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def stop(self):
+        with self.lock:
+            self._stop_observer()
+
+
+def wait_for_mount(mount_point, timeout=None):
+    """
+    Warte, bis der angegebene Mount-Punkt gemountet ist (ereignisbasiert über MountTracker).
+
+    :param mount_point: Pfad zum Mount-Punkt (z.B. /media/raphi/hdd/)
+    :param timeout: Maximale Wartezeit in Sekunden (None: ohne Begrenzung)
+    :return: True, wenn gemountet; False sonst
+    """
+    tracker = MountTracker([mount_point])
+    try:
+        if not tracker.is_mounted(mount_point):
+            logger.info(f"Mount-Punkt {mount_point} nicht gefunden. Warte auf das Einhängen...")
+            tracker.start()
+            if not tracker.wait_mounted(mount_point, timeout):
+                logger.error(f"Timeout: Mount-Punkt {mount_point} nicht gefunden nach {timeout} Sekunden.")
+                return False
+    finally:
+        tracker.stop()
+    logger.info(f"Mount-Punkt {mount_point} ist gemountet.")
+    return True
+
+
+def clean_old_logs(backup_folders):
+    """
+    Löscht alte Log-Dateien, die älter als 60 Tage sind.
+
+    :param backup_folders: Liste der Backup-Verzeichnisse
+    """
+    main_log_filename = MAIN_LOG_FILE
+    cutoff_time = datetime.datetime.now() - datetime.timedelta(days=60)
+    # Lösche Hauptprozess-Logs älter als 2 Monate (60 Tage)
+    if os.path.exists(main_log_filename):
+        try:
+            modification_time = datetime.datetime.fromtimestamp(os.path.getmtime(main_log_filename))
+            if modification_time < cutoff_time:
+                os.remove(main_log_filename)
+                logger.info(f"[CLEAN] Alte Haupt-Log-Datei gelöscht: {main_log_filename}")
+        except Exception as e:
+            logger.error(f"[ERROR] Konnte alte Haupt-Log-Datei nicht löschen: {e}")
+
+    # Lösche Shrink-Logs älter als 2 Monate
+    for folder in backup_folders:
+        for root, dirs, files in os.walk(folder):
+            for file in files:
+                if file == "shrink.log":
+                    shrink_log_path = os.path.join(root, file)
+                    try:
+                        modification_time = datetime.datetime.fromtimestamp(os.path.getmtime(shrink_log_path))
+                        if modification_time < cutoff_time:
+                            os.remove(shrink_log_path)
+                            logger.info(f"[CLEAN] Alte Shrink-Log-Datei gelöscht: {shrink_log_path}")
+                    except Exception as e:
+                        logger.error(f"[ERROR] Konnte alte Shrink-Log-Datei nicht löschen: {e}")
+
+
+def start_metrics_export(settings_file):
+    """
+    Startet den Metrik-Export gemäß den Einstellungen 'metrics_port' und 'metrics_textfile'.
+
+    :param settings_file: Pfad zur Einstellungsdatei
+    """
+    settings = load_settings(settings_file)
+    try:
+        if settings.get('metrics_port'):
+            start_http_server(int(settings['metrics_port']))
+        if settings.get('metrics_textfile'):
+            start_textfile_writer(settings['metrics_textfile'])
+    except (OSError, ValueError) as e:
+        logger.error(f"[METRICS ERROR] Metrik-Export konnte nicht gestartet werden: {e}")
+
+
+def start_event_trace(settings_file, observer, backup_folders):
+    """
+    Zeichnet den Ereignisstrom auf, wenn in den Einstellungen 'event_trace_file' gesetzt ist.
+
+    :param settings_file: Pfad zur Einstellungsdatei
+    :param observer: Observer, an dem der Rekorder zusätzlich registriert wird
+    :param backup_folders: Liste der Backup-Verzeichnisse
+    :return: TraceRecorder oder None
+    """
+    settings = load_settings(settings_file)
+    trace_file = settings.get('event_trace_file')
+    if not trace_file or not backup_folders:
+        return None
+    from event_trace import TraceRecorder
+    try:
+        recorder = TraceRecorder(trace_file, backup_folders)
+    except OSError as e:
+        logger.error(f"[TRACE ERROR] Trace-Datei {trace_file} konnte nicht angelegt werden: {e}")
+        return None
+    for folder in backup_folders:
+        observer.schedule(recorder, folder, recursive=True)
+    logger.info(f"[TRACE] Ereignisse werden nach {trace_file} aufgezeichnet.")
+    return recorder
+
+
+def load_backup_folders(settings_file):
+    """
+    Lädt die Backup-Verzeichnisse aus der Einstellungsdatei ('backup_roots' und 'backup_folders').
+
+    :param settings_file: Pfad zur Einstellungsdatei
+    :return: Liste der Backup-Verzeichnisse
+    """
+    return [root.path for root in load_roots(load_settings(settings_file))]
+
+
+def save_backup_folders(settings_file, backup_folders):
+    """
+    Speichert die Backup-Verzeichnisse in der Einstellungsdatei.
+
+    :param settings_file: Pfad zur Einstellungsdatei
+    :param backup_folders: Liste der Backup-Verzeichnisse
+    """
+    get_config(settings_file).update(backup_folders=backup_folders)
@@ -0,0 +1,172 @@
+# V0.1a/shrink_api.py
+"""
+Programmierschnittstelle ohne GUI für eigene Automatisierungen.
+
+    from shrink_api import shrink_image, CancelToken
+
+    result = shrink_image('/pfad/backup.img', ['-Z'], on_progress=print)
+    print(result.returncode, result.bytes_before, result.bytes_after, result.phases)
+
+    # In einer eigenen asyncio-Ereignisschleife, mehrere Images gleichzeitig:
+    token = CancelToken()
+    results = await asyncio.gather(*(shrink_image_async(path, cancel_token=token) for path in paths))
+
+    # Aus einem anderen Thread: anhalten, fortsetzen, abbrechen
+    token.pause()
+    token.resume()
+    token.cancel()
+
+    # In einer Coroutine der Ereignisschleife das Ergebnis abwarten
+    paused = await token.pause()
+
+Alte Backups werden nur gelöscht, wenn 'delete_backups' ausdrücklich in settings gesetzt ist.
+"""
+import time
+import asyncio
+import threading
+from collections import namedtuple
+from config import SETTINGS_FILE, get_config
+from shrink_history import image_size
+from shrink_job import ShrinkJob
+from async_runner import get_runner
+
+# Ergebnis eines Shrinks
+# img_path:     Pfad zum Image
+# returncode:   Rückgabewert von pishrink.sh (-1 bei Fehler vor dem Start, Zeitlimit oder Abbruch)
+# bytes_before: Größe vor dem Shrinken oder None
+# bytes_after:  Größe danach (auch komprimiert als .gz/.xz) oder None
+# seconds:      Gesamtdauer in Sekunden
+# phases:       Dict Phase -> Dauer in Sekunden
+# errors:       Liste der Fehlermeldungen
+# cancelled:    True, wenn über CancelToken abgebrochen
+# skipped:      Grund, falls das Image bereits von einem anderen Job geshrinkt wird bzw. wurde, sonst None
+ShrinkResult = namedtuple('ShrinkResult', ['img_path', 'returncode', 'bytes_before', 'bytes_after', 'seconds',
+                                           'phases', 'errors', 'cancelled', 'skipped'], defaults=[None])
+
+
+def combine_results(results):
+    """
+    Fasst die Ergebnisse von ShrinkJob.pause bzw. resume zusammen.
+
+    :param results: Liste aus bool bzw. Futures (Aufruf in der Ereignisschleife)
+    :return: True, wenn es Jobs gab und alle erfolgreich waren, oder ein Future mit diesem Ergebnis
+    """
+    if not any(asyncio.isfuture(result) for result in results):
+        return bool(results) and all(results)
+
+    async def wait():
+        return all([await result if asyncio.isfuture(result) else result for result in results])
+
+    return asyncio.ensure_future(wait())
+
+
+class CancelToken:
+    """
+    Abbruchsignal für einen oder mehrere Shrinks, aus beliebigem Thread auslösbar.
+    Laufende Shrinks lassen sich darüber auch anhalten und fortsetzen.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.jobs = []
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+    def pause(self):
+        """
+        Hält alle laufenden Shrinks an (SIGSTOP an den Prozessbaum).
+
+        :return: True, wenn alle angehalten wurden; in der Ereignisschleife ein Future mit diesem Ergebnis
+        """
+        return combine_results([job.pause() for job in self.bound_jobs()])
+
+    def resume(self):
+        """
+        :return: True, wenn alle fortgesetzt wurden; in der Ereignisschleife ein Future mit diesem Ergebnis
+        """
+        return combine_results([job.resume() for job in self.bound_jobs()])
+
+    def bound_jobs(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def bind(self, job):
+        with self.lock:
+            if not self.cancelled:
+                self.jobs.append(job)
+                return
+        job.cancel()
+
+    def unbind(self, job):
+        with self.lock:
+            if job in self.jobs:
+                self.jobs.remove(job)
+
+
+def job_settings(options=None, settings=None, settings_file=SETTINGS_FILE):
+    """
+    :param options: PiShrink-Optionen (None: aus den Einstellungen)
+    :param settings: Einstellungen, die die Datei überschreiben
+    :param settings_file: Einstellungsdatei für pishrink_script und Standardwerte
+    :return: Einstellungen für den ShrinkJob
+    """
+    merged = get_config(settings_file).snapshot()
+    merged['delete_backups'] = False
+    merged.update(settings or {})
+    if options is not None:
+        merged['pishrink_options'] = list(options)
+    return merged
+
+
+async def shrink_image_async(img_path, options=None, on_progress=None, cancel_token=None, settings=None,
+                             on_line=None, phase_timeouts=None, settings_file=SETTINGS_FILE, compress_threads=None):
+    """
+    Shrinkt ein Image in der laufenden Ereignisschleife.
+
+    :param img_path: Pfad zum Image
+    :param options: PiShrink-Optionen, z.B. ['-a', '-Z'] (None: aus den Einstellungen)
+    :param on_progress: Callback für ProgressEvents
+    :param cancel_token: Optionales CancelToken
+    :param settings: Einstellungen, die settings.json überschreiben (z.B. pishrink_script)
+    :param on_line: Callback für jede Ausgabezeile
+    :param phase_timeouts: Dict Phase -> maximale Dauer in Sekunden (None: aus dem Verlauf abgeleitet,
+                           ein hängender Prozess wird zusätzlich nach 'stall_timeout' beendet)
+    :param settings_file: Einstellungsdatei
+    :param compress_threads: Threads für die parallele Komprimierung (-a), z.B. aus MemoryBudget.admit
+    :return: ShrinkResult
+    """
+    errors = []
+    job = ShrinkJob(img_path, job_settings(options, settings, settings_file), on_line=on_line,
+                    on_progress=on_progress, on_error=errors.append, phase_timeouts=phase_timeouts,
+                    compress_threads=compress_threads)
+    bytes_before = image_size(img_path)
+    started = time.monotonic()
+    if cancel_token:
+        cancel_token.bind(job)
+    try:
+        returncode = await job.run_async()
+    finally:
+        if cancel_token:
+            cancel_token.unbind(job)
+    return ShrinkResult(img_path, returncode, bytes_before, image_size(img_path), time.monotonic() - started,
+                        dict(job.phase_timer.durations) if job.phase_timer else {}, errors, job.cancel_requested,
+                        job.skipped)
+
+
+def shrink_image(img_path, options=None, on_progress=None, cancel_token=None, settings=None, on_line=None,
+                 phase_timeouts=None, settings_file=SETTINGS_FILE, compress_threads=None):
+    """
+    Shrinkt ein Image und wartet auf das Ergebnis (Parameter wie shrink_image_async).
+
+    Der Prozess läuft in der gemeinsamen Ereignisschleife, der Aufruf blockiert nur den aufrufenden Thread.
+
+    :return: ShrinkResult
+    """
+    return get_runner().run(shrink_image_async(img_path, options, on_progress, cancel_token, settings, on_line,
+                                               phase_timeouts, settings_file, compress_threads))
@@ -0,0 +1,120 @@
+# V0.1a/shrink_cleanup.py
+"""
+Aufräumen nach einem abgebrochenen pishrink.sh.
+
+pishrink.sh hängt die Root-Partition als Loop-Device ein (losetup -f --show -o ...),
+mountet sie für das Autoexpand in ein mktemp-Verzeichnis und sichert dort etc/rc.local
+als rc.local.bak. Sein cleanup-Trap läuft nicht, wenn die Prozessgruppe mit SIGKILL
+beendet wurde. Dieses Modul macht die Schritte für ein Image rückgängig:
+
+1. rc.local.bak auf eingehängten Loop-Devices des Images zurückspielen
+2. Loop-Device aushängen und das temporäre Verzeichnis entfernen
+3. Loop-Device freigeben (losetup -d)
+
+Alle Schritte sind idempotent und betreffen nur Loop-Devices, deren Quelldatei das Image ist.
+"""
+import os
+import glob
+import tempfile
+import subprocess
+from log_handler import logger  # Zentralen Logger importieren
+from mount_tracker import MOUNTINFO, parse_mount_sources
+
+SYS_BLOCK = '/sys/block'
+COMMAND_TIMEOUT = 60  # Sekunden pro Befehl (umount kann bei vollem Schreibcache dauern)
+
+
+def run_privileged(argv):
+    """
+    Führt einen Befehl als root aus (ohne Rückfrage über 'sudo -n', falls nötig).
+
+    :param argv: Befehl als Liste
+    :return: True bei Erfolg
+    """
+    if os.geteuid() != 0:
+        argv = ['sudo', '-n'] + list(argv)
+    try:
+        result = subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                timeout=COMMAND_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error(f"[CLEANUP ERROR] {' '.join(argv)} fehlgeschlagen: {e}")
+        return False
+    if result.returncode != 0:
+        logger.error(f"[CLEANUP ERROR] {' '.join(argv)} fehlgeschlagen: {result.stderr.strip()}")
+    return result.returncode == 0
+
+
+def loop_devices_for(img_path, sys_block=SYS_BLOCK):
+    """
+    :param img_path: Pfad zum Image
+    :param sys_block: Pfad zu /sys/block
+    :return: Liste der Loop-Devices (z.B. '/dev/loop3'), deren Quelldatei das Image ist
+    """
+    img_path = os.path.realpath(img_path)
+    devices = []
+    for backing_file in sorted(glob.glob(os.path.join(sys_block, 'loop*', 'loop', 'backing_file'))):
+        try:
+            with open(backing_file, 'r') as f:
+                backing = f.read().strip()
+        except OSError:
+            continue
+        if backing == img_path:
+            devices.append('/dev/' + backing_file.split(os.sep)[-3])
+    return devices
+
+
+def mount_points_for(device, mountinfo=MOUNTINFO):
+    """
+    :param device: Blockgerät, z.B. '/dev/loop3'
+    :param mountinfo: Pfad zur Mount-Tabelle
+    :return: Mount-Punkte des Geräts (zuletzt eingehängte zuerst)
+    """
+    try:
+        with open(mountinfo, 'r') as f:
+            mounts = parse_mount_sources(f.read())
+    except OSError:
+        return []
+    return [mount_point for source, mount_point in reversed(mounts) if source == device]
+
+
+def restore_rc_local(mount_point):
+    """
+    Spielt etc/rc.local.bak zurück, das pishrink.sh vor dem Schreiben des Autoexpand-Skripts anlegt.
+
+    :param mount_point: Mount-Punkt der Root-Partition
+    """
+    backup = os.path.join(mount_point, 'etc', 'rc.local.bak')
+    if os.path.exists(backup):
+        logger.info(f"[CLEANUP] Stelle rc.local wieder her: {backup}")
+        run_privileged(['mv', '-f', backup, os.path.join(mount_point, 'etc', 'rc.local')])
+
+
+def is_temp_dir(path):
+    # Nur von mktemp -d angelegte Verzeichnisse entfernen, nie einen fremden Mount-Punkt
+    return os.path.dirname(path) in ('/tmp', tempfile.gettempdir()) and os.path.basename(path).startswith('tmp.')
+
+
+def cleanup_image(img_path, sys_block=SYS_BLOCK, mountinfo=MOUNTINFO):
+    """
+    Gibt Loop-Devices und temporäre Mounts frei, die pishrink.sh für ein Image angelegt hat.
+    Der pishrink-Prozess muss bereits beendet sein.
+
+    :param img_path: Pfad zum Image
+    :param sys_block: Pfad zu /sys/block
+    :param mountinfo: Pfad zur Mount-Tabelle
+    :return: True, wenn danach kein Loop-Device des Images mehr übrig ist
+    """
+    devices = loop_devices_for(img_path, sys_block)
+    if not devices:
+        return True
+    for device in devices:
+        logger.warning(f"[CLEANUP] Loop-Device {device} von {img_path} noch angehängt, räume auf.")
+        for mount_point in mount_points_for(device, mountinfo):
+            restore_rc_local(mount_point)
+            if run_privileged(['umount', mount_point]) and is_temp_dir(mount_point):
+                run_privileged(['rmdir', mount_point])
+        run_privileged(['losetup', '-d', device])
+    remaining = loop_devices_for(img_path, sys_block)
+    if remaining:
+        logger.error(f"[CLEANUP ERROR] Loop-Devices konnten nicht freigegeben werden: {remaining}")
+    return not remaining
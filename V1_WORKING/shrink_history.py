@@ -0,0 +1,325 @@
+# V0.1a/shrink_history.py
+import os
+import csv
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from log_handler import logger  # Zentralen Logger importieren
+from metrics import PHASE_DURATION, BYTES_SAVED, JOBS_FINISHED
+
+# Verlaufsdatenbank liegt neben dem Haupt-Log
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'shrink_history.db')
+
+# Phasen, für die Zeitspannen aufgezeichnet werden (Reihenfolge für Anzeige und Export)
+SPAN_PHASES = ['start', 'copy', 'read', 'fsck', 'minsize', 'resize', 'truncate', 'compress', 'postprocess']
+
+# Dateiendungen, unter denen das Image nach der Komprimierung liegt
+COMPRESSED_EXTENSIONS = ['.gz', '.xz']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    img_path TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    exit_code INTEGER,
+    bytes_before INTEGER,
+    bytes_after INTEGER
+);
+CREATE TABLE IF NOT EXISTS spans (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    phase TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    bytes_before INTEGER,
+    bytes_after INTEGER
+);
+CREATE INDEX IF NOT EXISTS spans_phase ON spans(phase);
+"""
+
+
+def image_size(img_path):
+    """
+    Ermittelt die aktuelle Größe eines Images, auch nach der Komprimierung.
+
+    :param img_path: Pfad zum Image
+    :return: Größe in Bytes oder None
+    """
+    for path in [img_path] + [img_path + ext for ext in COMPRESSED_EXTENSIONS]:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            continue
+    return None
+
+
+class ShrinkHistory:
+    """
+    Persistenter Verlauf aller Shrink-Jobs mit Zeitspannen pro Phase (SQLite).
+    """
+
+    def __init__(self, db_path=HISTORY_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        with self.lock, self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:  # Commit bzw. Rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def start_job(self, img_path, bytes_before):
+        """
+        Legt einen neuen Job an.
+
+        :param img_path: Pfad zum Image
+        :param bytes_before: Größe des Images vor dem Shrinken
+        :return: ID des Jobs
+        """
+        with self.lock, self._connect() as conn:
+            cursor = conn.execute("INSERT INTO jobs (img_path, started, bytes_before) VALUES (?, ?, ?)",
+                                  (img_path, time.time(), bytes_before))
+            return cursor.lastrowid
+
+    def add_span(self, job_id, phase, started, duration, bytes_before, bytes_after):
+        """
+        Speichert die Zeitspanne einer Phase.
+
+        :param job_id: ID des Jobs
+        :param phase: Schlüssel der Phase
+        :param started: Startzeitpunkt (Unix-Zeit)
+        :param duration: Dauer in Sekunden
+        :param bytes_before: Imagegröße zu Beginn der Phase
+        :param bytes_after: Imagegröße am Ende der Phase
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute("INSERT INTO spans (job_id, phase, started, duration, bytes_before, bytes_after) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (job_id, phase, started, duration, bytes_before, bytes_after))
+
+    def finish_job(self, job_id, exit_code, bytes_after):
+        """
+        Schließt einen Job ab.
+
+        :param job_id: ID des Jobs
+        :param exit_code: Rückgabewert von pishrink.sh
+        :param bytes_after: Größe des Images nach dem Shrinken
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET finished = ?, exit_code = ?, bytes_after = ? WHERE id = ?",
+                         (time.time(), exit_code, bytes_after, job_id))
+
+    def recent_jobs(self, limit=100):
+        """
+        Liefert die letzten Jobs mit ihren Phasendauern.
+
+        :param limit: Maximale Anzahl Jobs
+        :return: Liste von Dicts (neueste zuerst), 'phases' bildet Phase -> Dauer ab
+        """
+        with self.lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            jobs = [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY started DESC LIMIT ?", (limit,))]
+            for job in jobs:
+                job['phases'] = {}
+                for row in conn.execute("SELECT phase, duration FROM spans WHERE job_id = ?", (job['id'],)):
+                    job['phases'][row['phase']] = job['phases'].get(row['phase'], 0.0) + row['duration']
+        return jobs
+
+    def iter_spans(self):
+        """
+        Liefert alle Zeitspannen mit den zugehörigen Jobdaten (älteste zuerst).
+
+        :return: Liste von Dicts
+        """
+        with self.lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT s.job_id, j.img_path, s.phase, s.started, s.duration, s.bytes_before, s.bytes_after, "
+                "j.exit_code FROM spans s JOIN jobs j ON j.id = s.job_id ORDER BY s.started")
+            return [dict(row) for row in rows]
+
+    def export_csv(self, file_path):
+        """
+        Exportiert alle Zeitspannen als CSV-Datei.
+
+        :param file_path: Zieldatei
+        :return: Anzahl exportierter Zeilen
+        """
+        spans = self.iter_spans()
+        fields = ['job_id', 'img_path', 'phase', 'started', 'duration', 'bytes_before', 'bytes_after', 'exit_code']
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(spans)
+        logger.info(f"[HISTORY] {len(spans)} Zeitspannen als CSV exportiert nach {file_path}")
+        return len(spans)
+
+    def export_jsonl(self, file_path):
+        """
+        Exportiert alle Zeitspannen als JSON Lines.
+
+        :param file_path: Zieldatei
+        :return: Anzahl exportierter Zeilen
+        """
+        spans = self.iter_spans()
+        with open(file_path, 'w') as f:
+            for span in spans:
+                f.write(json.dumps(span) + "\n")
+        logger.info(f"[HISTORY] {len(spans)} Zeitspannen als JSONL exportiert nach {file_path}")
+        return len(spans)
+
+    def size_history(self, directories, limit=20):
+        """
+        Liefert die Imagegrößen erfolgreicher Shrinks unterhalb von Verzeichnissen (z.B. einer Backup-Wurzel).
+
+        :param directories: Verzeichnisse, z.B. Pfad und realpath der Wurzel
+        :param limit: Maximale Anzahl Jobs
+        :return: Liste von (Start, Bytes vorher, Bytes nachher), neueste zuerst
+        """
+        prefixes = [directory.rstrip(os.sep) + os.sep for directory in set(directories)]
+        if not prefixes:
+            return []
+        # substr statt LIKE, da '_' und '%' in Pfaden vorkommen können
+        condition = ' OR '.join(['substr(img_path, 1, ?) = ?'] * len(prefixes))
+        params = [value for prefix in prefixes for value in (len(prefix), prefix)]
+        with self.lock, self._connect() as conn:
+            return conn.execute(
+                f"SELECT started, bytes_before, bytes_after FROM jobs WHERE exit_code = 0 AND bytes_before > 0 "
+                f"AND bytes_after > 0 AND ({condition}) ORDER BY started DESC LIMIT ?", params + [limit]).fetchall()
+
+    def predict_phase_duration(self, phase, size_bytes, samples=10):
+        """
+        Schätzt die Dauer einer Phase aus den letzten erfolgreichen Läufen.
+
+        Verwendet den Median der Sekunden pro Byte, damit einzelne Ausreißer
+        (z.B. eine Dateisystemreparatur) die Schätzung nicht verzerren.
+
+        :param phase: Schlüssel der Phase
+        :param size_bytes: Größe des Images zu Beginn der Phase
+        :param samples: Anzahl berücksichtigter Läufe
+        :return: Geschätzte Dauer in Sekunden oder None
+        """
+        if not size_bytes:
+            return None
+        with self.lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT s.duration, s.bytes_before FROM spans s JOIN jobs j ON j.id = s.job_id "
+                "WHERE s.phase = ? AND j.exit_code = 0 AND s.bytes_before > 0 "
+                "ORDER BY s.started DESC LIMIT ?", (phase, samples)).fetchall()
+        if not rows:
+            return None
+        rates = sorted(duration / bytes_before for duration, bytes_before in rows)
+        return rates[len(rates) // 2] * size_bytes
+
+    def phase_timeouts(self, size_bytes, factor, minimum):
+        """
+        Leitet Zeitlimits pro Phase aus den Schätzungen früherer Läufe ab.
+        Phasen ohne Verlauf erhalten kein Limit (dort greift nur die Stillstandserkennung).
+
+        :param size_bytes: Größe des Images
+        :param factor: Vielfaches der geschätzten Dauer
+        :param minimum: Mindestlimit in Sekunden
+        :return: Dict Phase -> Zeitlimit in Sekunden
+        """
+        timeouts = {}
+        for phase in SPAN_PHASES:
+            predicted = self.predict_phase_duration(phase, size_bytes)
+            if predicted is not None:
+                timeouts[phase] = max(minimum, predicted * factor)
+        return timeouts
+
+    def predict_job_duration(self, size_bytes):
+        """
+        Schätzt die Gesamtdauer eines Jobs als Summe der Phasenschätzungen.
+
+        :param size_bytes: Größe des Images
+        :return: Geschätzte Dauer in Sekunden oder None
+        """
+        predictions = [self.predict_phase_duration(phase, size_bytes) for phase in SPAN_PHASES]
+        predictions = [p for p in predictions if p is not None]
+        return sum(predictions) if predictions else None
+
+
+class PhaseTimer:
+    """
+    Misst die Zeitspannen der Phasen eines laufenden Jobs und schreibt sie in den Verlauf.
+    """
+
+    def __init__(self, history, img_path):
+        self.history = history
+        self.img_path = img_path
+        self.bytes_before = image_size(img_path)
+        self.job_id = history.start_job(img_path, self.bytes_before)
+        self.phase = None
+        self.phase_started = None
+        self.phase_started_mono = None
+        self.phase_bytes = None
+        self.phase_predicted = None  # Dauer der laufenden Phase laut Verlauf, einmal pro Phase abgefragt
+        self.durations = {}  # Phase -> Sekunden (dieser Lauf)
+
+    def enter(self, phase):
+        """
+        Beendet die laufende Phase und beginnt eine neue.
+
+        :param phase: Schlüssel der neuen Phase
+        """
+        if phase == self.phase:
+            return
+        self.close_phase()
+        if phase in SPAN_PHASES:
+            self.phase = phase
+            self.phase_started = time.time()
+            self.phase_started_mono = time.monotonic()
+            self.phase_bytes = image_size(self.img_path)
+            try:
+                self.phase_predicted = self.history.predict_phase_duration(phase, self.phase_bytes)
+            except sqlite3.Error as e:
+                logger.error(f"[HISTORY ERROR] Prognose nicht verfügbar: {e}")
+                self.phase_predicted = None
+
+    def close_phase(self):
+        if self.phase is None:
+            return
+        duration = time.monotonic() - self.phase_started_mono
+        self.durations[self.phase] = self.durations.get(self.phase, 0.0) + duration
+        PHASE_DURATION.observe(duration, phase=self.phase)
+        try:
+            self.history.add_span(self.job_id, self.phase, self.phase_started, duration,
+                                  self.phase_bytes, image_size(self.img_path))
+        except sqlite3.Error as e:
+            logger.error(f"[HISTORY ERROR] Zeitspanne konnte nicht gespeichert werden: {e}")
+        self.phase = None
+
+    def estimate_remaining(self, phase=None):
+        """
+        Schätzt die Restzeit der laufenden Phase aus dem Verlauf (ohne Datenbankzugriff).
+
+        :param phase: Phase des Fortschritts; weicht die gemessene Phase noch ab, gibt es keine Schätzung
+        :return: Restzeit in Sekunden oder None
+        """
+        predicted = self.phase_predicted
+        if self.phase is None or (phase is not None and phase != self.phase) or predicted is None:
+            return None
+        return max(0.0, predicted - (time.monotonic() - self.phase_started_mono))
+
+    def finish(self, exit_code):
+        """
+        Schließt die letzte Phase und den Job ab.
+
+        :param exit_code: Rückgabewert von pishrink.sh
+        """
+        self.close_phase()
+        bytes_after = image_size(self.img_path)
+        JOBS_FINISHED.inc(result='success' if exit_code == 0 else 'failed')
+        if exit_code == 0 and self.bytes_before and bytes_after is not None and bytes_after < self.bytes_before:
+            BYTES_SAVED.inc(self.bytes_before - bytes_after)
+        try:
+            self.history.finish_job(self.job_id, exit_code, bytes_after)
+        except sqlite3.Error as e:
+            logger.error(f"[HISTORY ERROR] Job konnte nicht abgeschlossen werden: {e}")
@@ -0,0 +1,391 @@
+# V0.1a/shrink_job.py
+import os
+import shlex
+import asyncio
+import threading
+from log_handler import logger  # Zentralen Logger importieren
+from async_runner import AsyncProcess, PhaseTimeout, ProcessStalled, get_runner
+from shrink_history import ShrinkHistory, PhaseTimer
+from shrink_cleanup import cleanup_image
+from io_throttle import IoThrottle
+from job_registry import get_registry
+from space_budget import pishrink_arguments
+from shrink_utils import BACKUP_PATTERN, delete_old_backups
+from metrics import ACTIVE_JOBS, JOBS_KILLED
+from config import PISHRINK_SCRIPT, SCHEMA
+
+
+def compress_env(options, threads):
+    """
+    Umgebungsvariablen, mit denen pishrink.sh die Optionen der parallelen Komprimierung ersetzt
+    (PISHRINK_XZ bzw. PISHRINK_GZIP, siehe ZIP_PARALLEL_OPTIONS).
+
+    :param options: PiShrink-Optionen
+    :param threads: Kompressions-Threads oder None (unverändert)
+    :return: Liste 'NAME=Wert' für sudo
+    """
+    if threads is None or '-a' not in options:
+        return []
+    if '-Z' in options:
+        return [f'PISHRINK_XZ=-T{threads}']
+    if '-z' in options:
+        return [f'PISHRINK_GZIP=-f9 -p{threads}']
+    return []
+
+
+def build_argv(img_path, options=(), pishrink_script=PISHRINK_SCRIPT, compress_threads=None):
+    """
+    Baut den pishrink.sh-Aufruf für ein Image.
+
+    :param img_path: Pfad zum Image
+    :param options: PiShrink-Optionen, z.B. ['-a', '-z']
+    :param pishrink_script: Pfad zu pishrink.sh
+    :param compress_threads: Threads für die parallele Komprimierung (None: pishrink-Standard, alle Kerne)
+    :return: Befehl als Liste (ohne Shell)
+    """
+    # sudo übernimmt VAR=Wert vor dem Befehl, sofern sudoers das Setzen erlaubt (bei ALL implizit)
+    return ['sudo'] + compress_env(options, compress_threads) + ['bash', pishrink_script] + list(options) + [img_path]
+
+
+def build_command(img_path, options=(), pishrink_script=PISHRINK_SCRIPT, compress_threads=None):
+    """
+    Wie build_argv, aber als anzeigbarer und bearbeitbarer String (z.B. im Befehlsfeld der GUI).
+
+    :return: Befehl als String, mit shlex.split wieder zerlegbar
+    """
+    return shlex.join(build_argv(img_path, options, pishrink_script, compress_threads))
+
+
+class ShrinkJob:
+    """
+    Ein Shrink-Lauf ohne GUI: startet pishrink.sh, wertet den Fortschritt aus,
+    schreibt den Verlauf und führt die Nachbearbeitung aus.
+
+    Rückmeldungen erfolgen über Callbacks, die im Leser-Thread aufgerufen werden.
+    """
+
+    def __init__(self, img_path, settings=None, command=None, on_line=None, on_progress=None, on_error=None,
+                 backup_pattern=BACKUP_PATTERN, phase_timeouts=None, stall_timeout=None, compress_threads=None):
+        """
+        :param img_path: Pfad zum Image
+        :param settings: Einstellungen (logging_enabled, delete_backups, delete_hours, pishrink_options)
+        :param command: Fertiger Befehl als String oder Liste (z.B. aus der GUI bearbeitet),
+                        sonst aus den Einstellungen gebaut. Wird ohne Shell ausgeführt.
+        :param on_line: Callback für jede Ausgabezeile
+        :param on_progress: Callback für ProgressEvents
+        :param on_error: Callback für Fehlermeldungen
+        :param backup_pattern: Muster der Backup-Ordner für das Löschen alter Backups
+        :param phase_timeouts: Dict Phase -> maximale Dauer in Sekunden
+                               (None: aus dem Verlauf und der Imagegröße abgeleitet)
+        :param stall_timeout: Sekunden ohne Ausgabe und I/O bis zum Beenden (None: 'stall_timeout', 0: aus)
+        :param compress_threads: Threads für 'xz -T'/'pigz -p' bei -a (None: alle Kerne), nur ohne command
+        """
+        self.img_path = img_path
+        self.settings = settings or {}
+        if command is None:
+            self.argv = build_argv(img_path, self.settings.get('pishrink_options', []),
+                                   self.settings.get('pishrink_script', PISHRINK_SCRIPT), compress_threads)
+        else:
+            self.argv = shlex.split(command) if isinstance(command, str) else list(command)
+        self.command = shlex.join(self.argv)
+        self.phase_timeouts = phase_timeouts
+        self.stall_timeout = stall_timeout if stall_timeout is not None else self.setting('stall_timeout')
+        self.cancel_requested = False
+        self.needs_cleanup = False  # pishrink.sh wurde gewaltsam beendet
+        self.loop = None
+        self.task = None
+        self.process = None
+        self.on_line = on_line
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.backup_pattern = backup_pattern
+        self.phase_timer = None
+        self.progress_phase = None  # Letzte an phase_timer gemeldete Phase
+        self.last_progress = None
+        self.shrink_log = None
+        self.log_lines = []  # Ausgabezeilen, die noch ins Haupt-Log bzw. shrink.log geschrieben werden
+        self.log_lock = threading.Lock()
+        self.history_tail = None  # Letzter Schritt der Verlauf-/Log-Schreibzugriffe im Thread-Pool
+        self.returncode = None
+        self.registry = get_registry()
+        self.skipped = None  # Grund, falls das Image bereits anderswo geshrinkt wird bzw. wurde
+
+    def limit_compression(self, threads):
+        """
+        Übernimmt die Kompressions-Threads aus dem MemoryBudget in einen fertigen Befehl (z.B. aus der GUI).
+        Aufruf vor dem Start.
+
+        :param threads: Threads aus MemoryBudget.admit (None: unverändert)
+        :return: False, wenn der Befehl nicht mit sudo beginnt oder bereits eigene PISHRINK_-Variablen setzt
+        """
+        env = compress_env(pishrink_arguments(self.argv)[0], threads)
+        if not env or self.argv[:1] != ['sudo'] or any(arg.startswith('PISHRINK_') for arg in self.argv):
+            return False
+        self.argv[1:1] = env
+        self.command = shlex.join(self.argv)
+        return True
+
+    def setting(self, key):
+        value = self.settings.get(key)
+        return SCHEMA[key][1] if value is None else value
+
+    @property
+    def shrink_log_path(self):
+        if not self.settings.get('logging_enabled', False):
+            return None
+        return os.path.join(os.path.dirname(self.img_path), "shrink.log")
+
+    def run(self):
+        """
+        Führt den Job synchron aus (der Prozess läuft in der gemeinsamen Ereignisschleife).
+
+        :return: Rückgabewert von pishrink.sh (-1 bei Fehlern vor dem Start oder nach Abbruch)
+        """
+        return get_runner().run(self.run_async())
+
+    async def run_async(self):
+        """
+        Führt den Job in der laufenden Ereignisschleife aus. Blockierende Schritte
+        (Verlauf, Löschen alter Backups) laufen im Thread-Pool der Schleife.
+
+        :return: Rückgabewert von pishrink.sh (-1 bei Fehlern vor dem Start, nach Abbruch oder
+                 wenn das Image übersprungen wurde, siehe skipped)
+        """
+        loop = asyncio.get_running_loop()
+        self.loop = loop
+        self.task = asyncio.current_task()
+        # Doppelte Auslöser und andere Prozesse: dieselbe Image-Version wird systemweit nur einmal geshrinkt
+        claim_id, self.skipped = await loop.run_in_executor(None, self.registry.claim, self.img_path)
+        if self.skipped:
+            logger.info(f"[SHRINK] Übersprungen, {self.img_path} {self.skipped}.")
+            self.returncode = -1
+            return self.returncode
+        ACTIVE_JOBS.inc()
+        try:
+            logger.info(f"[SHRINK] Startet Shrink-Prozess: {self.command}")
+            await loop.run_in_executor(None, self.prepare)
+            try:
+                if self.cancel_requested:
+                    raise asyncio.CancelledError()
+                ceiling = self.settings.get('io_latency_ceiling_ms')
+                self.process = AsyncProcess(self.argv, self.handle_output_line, self.handle_progress,
+                                            self.phase_timeouts, stall_timeout=self.stall_timeout,
+                                            io_throttle=IoThrottle(self.img_path, ceiling) if ceiling else None)
+                self.returncode = await self.process.run()
+            except asyncio.CancelledError:
+                if not self.cancel_requested:
+                    raise  # Abbruch von außen (z.B. Task des Aufrufers), nicht über cancel()
+                logger.warning(f"[SHRINK] Shrink-Prozess abgebrochen: {self.command}")
+                self.needs_cleanup = self.process is not None
+                self.returncode = -1
+            except (PhaseTimeout, ProcessStalled) as e:
+                error_message = f"{e}. Prozess wurde beendet: {self.img_path}"
+                logger.error(f"[ERROR] {error_message}")
+                JOBS_KILLED.inc(reason='stall' if isinstance(e, ProcessStalled) else 'timeout')
+                self.report_error(error_message)
+                self.needs_cleanup = True
+                self.returncode = -1
+            await self.drain_history()  # Ausgabezeilen im Log vor der Abschlussmeldung
+            logger.info(f"[SHRINK] Shrink-Prozess abgeschlossen ({self.returncode}): {self.command}")
+            await loop.run_in_executor(None, self.finish)
+        except Exception as e:
+            error_message = f"Fehler beim Ausführen des Befehls: {e}"
+            logger.error(f"[ERROR] {error_message}")
+            self.report_error(error_message)
+            if self.phase_timer:
+                self.phase_timer.finish(-1)
+            self.returncode = -1
+        finally:
+            await self.drain_history()
+            if self.shrink_log:
+                self.shrink_log.close()
+                self.shrink_log = None
+            ACTIVE_JOBS.dec()
+            await loop.run_in_executor(None, self.registry.release, claim_id, self.img_path, self.returncode == 0)
+        return self.returncode
+
+    def prepare(self):
+        if self.shrink_log_path:
+            self.shrink_log = open(self.shrink_log_path, 'a')
+        self.phase_timer = self.create_phase_timer()
+        if self.phase_timeouts is None and self.phase_timer:
+            self.phase_timeouts = self.history_timeouts()
+
+    def history_timeouts(self):
+        # Zeitlimits wachsen mit der Imagegröße; ohne Verlauf gibt es keine, nur die Stillstandserkennung
+        try:
+            timeouts = self.phase_timer.history.phase_timeouts(
+                self.phase_timer.bytes_before, self.setting('phase_timeout_factor'), self.setting('phase_timeout_min'))
+        except Exception as e:
+            logger.error(f"[HISTORY ERROR] Zeitlimits nicht verfügbar: {e}")
+            return None
+        if timeouts:
+            logger.info(f"[SHRINK] Zeitlimits pro Phase: "
+                        f"{', '.join(f'{phase} {int(limit)} s' for phase, limit in timeouts.items())}")
+        return timeouts
+
+    def finish(self):
+        if self.phase_timer:
+            self.phase_timer.enter('postprocess')
+        if self.needs_cleanup and not cleanup_image(self.img_path):
+            self.report_error(f"Loop-Device von {self.img_path} konnte nicht freigegeben werden, siehe Log.")
+        if self.cancel_requested:
+            # Abgebrochener Shrink: ältere Backups bleiben unangetastet
+            logger.info("[DELETE] Job abgebrochen, alte Backups werden nicht gelöscht.")
+        elif self.returncode != 0:
+            # Fehlgeschlagen oder vom Wächter beendet: das neueste Image ist evtl. halb verkleinert
+            # bzw. halb komprimiert, ältere Backups sind dann die einzigen brauchbaren
+            logger.info(f"[DELETE] Shrink fehlgeschlagen ({self.returncode}), alte Backups werden nicht gelöscht.")
+        else:
+            self.post_process()
+        if self.phase_timer:
+            self.phase_timer.finish(self.returncode)
+
+    def cancel(self):
+        """
+        Bricht den Job ab (aus beliebigem Thread, auch bevor er gestartet ist).
+        """
+        self.cancel_requested = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._cancel_process)
+
+    def _cancel_process(self):
+        # Läuft in der Ereignisschleife: nur den laufenden Prozess abbrechen, Vor- und Nachbereitung
+        # werden über cancel_requested übersprungen
+        if self.process is not None and self.process.running:
+            self.task.cancel()
+
+    @property
+    def paused(self):
+        return self.process is not None and self.process.paused
+
+    def pause(self):
+        """
+        Hält pishrink.sh mit allen Kindprozessen an (SIGSTOP), z.B. damit ein laufendes
+        Backup die volle Bandbreite der Platte erhält. Aus beliebigem Thread aufrufbar.
+
+        :return: True, wenn der Prozess angehalten wurde; in der Ereignisschleife ein Future mit diesem
+                 Ergebnis, das der Aufrufer abwarten muss
+        """
+        return self._call_in_loop(self._pause)
+
+    def resume(self):
+        """
+        Setzt einen angehaltenen Job fort (SIGCONT).
+
+        :return: True, wenn der Prozess fortgesetzt wurde; in der Ereignisschleife ein Future (siehe pause)
+        """
+        return self._call_in_loop(self._resume)
+
+    async def _pause(self):
+        paused = self.process is not None and self.process.running and await self.process.pause()
+        if paused:
+            logger.info(f"[SHRINK] Shrink-Prozess angehalten: {self.img_path}")
+        return paused
+
+    async def _resume(self):
+        resumed = self.process is not None and await self.process.resume()
+        if resumed:
+            logger.info(f"[SHRINK] Shrink-Prozess fortgesetzt: {self.img_path}")
+        return resumed
+
+    def _call_in_loop(self, function):
+        # Prozesszustand wird nur in der Ereignisschleife geändert
+        if self.loop is None:
+            return False
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            # Aus der Schleife selbst (z.B. CancelToken in einer Coroutine) kann nicht blockierend gewartet
+            # werden: das Ergebnis als Future zurückgeben, statt einen Erfolg vorzutäuschen
+            return asyncio.ensure_future(function())
+        return asyncio.run_coroutine_threadsafe(function(), self.loop).result()
+
+    def create_phase_timer(self):
+        # Verlauf ist optional: Fehler beim Öffnen der Datenbank dürfen den Shrink nicht verhindern
+        try:
+            return PhaseTimer(ShrinkHistory(), self.img_path)
+        except Exception as e:
+            logger.error(f"[HISTORY ERROR] Shrink-Verlauf nicht verfügbar: {e}")
+            return None
+
+    def run_history(self, function, *args):
+        """
+        Führt einen Schreibzugriff (Verlauf, Log-Dateien) im Thread-Pool aus, in der Reihenfolge der Aufrufe,
+        damit die gemeinsame Ereignisschleife nicht auf Datei- und SQLite-Zugriffe wartet.
+        Aufruf im Thread der Ereignisschleife.
+        """
+        previous = self.history_tail
+
+        async def step():
+            if previous is not None:
+                await previous
+            try:
+                await self.loop.run_in_executor(None, function, *args)
+            except Exception as e:
+                logger.error(f"[HISTORY ERROR] Schreibzugriff fehlgeschlagen: {e}")
+
+        self.history_tail = asyncio.ensure_future(step())
+
+    async def drain_history(self):
+        # Ausstehende Schreibzugriffe abwarten (vor dem Abschluss des Verlaufs bzw. dem Schließen von shrink.log)
+        if self.history_tail is not None:
+            await self.history_tail
+
+    def write_output(self):
+        # Im Thread-Pool: die FileHandler des Loggers schreiben synchron
+        with self.log_lock:
+            lines, self.log_lines = self.log_lines, []
+        for line in lines:
+            logger.info(f"[SHRINK OUTPUT] {line}")
+        if self.shrink_log and lines:
+            self.shrink_log.write("".join(line + "\n" for line in lines))
+            self.shrink_log.flush()
+
+    def handle_output_line(self, line):
+        with self.log_lock:
+            self.log_lines.append(line)
+            first = len(self.log_lines) == 1
+        if first:
+            # Weitere Zeilen sammeln sich, bis der Schreibzugriff läuft
+            self.run_history(self.write_output)
+        if self.on_line:
+            self.on_line(line)
+
+    def handle_progress(self, event):
+        self.last_progress = event
+        if self.phase_timer:
+            if event.phase != self.progress_phase:
+                self.progress_phase = event.phase
+                self.run_history(self.enter_phase, event.phase)
+            elif event.eta is None and event.phase != 'done':
+                # Restzeit aus früheren Läufen schätzen (Prognose wird einmal pro Phase geladen)
+                event = event._replace(eta=self.phase_timer.estimate_remaining(event.phase))
+        if self.on_progress:
+            self.on_progress(event)
+
+    def enter_phase(self, phase):
+        # Im Thread-Pool: Zeitspanne speichern und Prognose der neuen Phase laden, Restzeit danach nachreichen
+        self.phase_timer.enter(phase)
+        if phase != 'done' and self.phase_timer.estimate_remaining(phase) is not None:
+            self.loop.call_soon_threadsafe(self.report_eta, phase)
+
+    def report_eta(self, phase):
+        event = self.last_progress
+        if event is not None and event.phase == phase and event.eta is None and self.on_progress:
+            self.on_progress(event._replace(eta=self.phase_timer.estimate_remaining(phase)))
+
+    def report_error(self, error_message):
+        if self.on_error:
+            self.on_error(error_message)
+
+    def post_process(self):
+        # Löschen alter Backups, falls aktiviert
+        if self.settings.get('delete_backups', False):
+            hours = self.settings.get('delete_hours', 168)
+            logger.info(f"[DELETE] Lösche Backups älter als {hours} Stunden")
+            delete_old_backups(self.img_path, hours, on_error=self.report_error, backup_pattern=self.backup_pattern)
+        else:
+            logger.info("[DELETE] Löschfunktion nicht aktiviert.")
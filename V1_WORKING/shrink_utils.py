@@ -0,0 +1,99 @@
+# V0.1a/shrink_utils.py
+import os
+import re
+import time
+import shutil
+import datetime
+from log_handler import logger  # Zentralen Logger importieren
+from metrics import BACKUPS_DELETED, DELETED_BYTES, DELETE_SECONDS
+
+# Muster der Backup-Ordner von raspiBackup (Datum und Uhrzeit als Gruppen)
+BACKUP_PATTERN = r"raspihaupt-dd-backup-(\d{8})-(\d{6})"
+
+
+def folder_size(folder_path):
+    """
+    Ermittelt den belegten Speicher eines Ordners.
+
+    Zählt belegte Blöcke statt der scheinbaren Größe, da die Images sparse sein können.
+
+    :param folder_path: Pfad zum Ordner
+    :return: Belegte Bytes
+    """
+    total = 0
+    for root, dirs, files in os.walk(folder_path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def delete_old_backups(img_path, hours, on_error=None, backup_pattern=BACKUP_PATTERN):
+    """
+    Löscht Backup-Ordner neben dem Ordner des Images, die älter als die angegebene Zeit sind.
+
+    Das Alter wird aus dem Ordnernamen bestimmt, der Ordner des aktuellen Images
+    wird nie gelöscht.
+
+    :param img_path: Pfad zum gerade verarbeiteten Image
+    :param hours: Aufbewahrungszeit in Stunden
+    :param on_error: Optionaler Callback für Fehlermeldungen (z.B. Fehlerdialog)
+    :param backup_pattern: Regulärer Ausdruck für Backup-Ordner mit Datums- und Zeitgruppe
+    :return: Anzahl gelöschter Ordner
+    """
+    current_folder = os.path.dirname(img_path)
+    backup_dir = os.path.dirname(current_folder)
+    logger.debug(f"[DELETE] Backup-Verzeichnis: {backup_dir}")
+    cutoff_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
+    pattern = re.compile(backup_pattern)
+    deleted = 0
+    backups_found = False  # Flag, um zu überprüfen, ob Backups gefunden wurden
+    try:
+        with os.scandir(backup_dir) as entries:
+            items = [entry for entry in entries if entry.is_dir()]
+        for entry in items:
+            item_path = entry.path
+            folder_name = entry.name
+            logger.debug(f"[DELETE] Überprüfe Ordner: {folder_name}")
+            if item_path == current_folder:
+                logger.debug(f"[DELETE] Überspringe aktuelles Backup: {item_path}")
+                continue  # Überspringen des aktuellen Backups
+            match = pattern.match(folder_name)
+            if not match:
+                logger.debug(f"[DELETE] Ordner {folder_name} entspricht nicht dem Muster und wird übersprungen.")
+                continue
+            folder_datetime_str = match.group(1) + match.group(2)  # 'YYYYMMDDHHMMSS'
+            try:
+                folder_datetime = datetime.datetime.strptime(folder_datetime_str, '%Y%m%d%H%M%S')
+            except ValueError as ve:
+                logger.error(f"[ERROR] Ungültiges Datum/Uhrzeit im Ordnernamen {folder_name}: {ve}")
+                continue
+            logger.debug(f"[DELETE] Ordnerzeit: {folder_datetime}, Grenzzeit: {cutoff_time}")
+            if folder_datetime < cutoff_time:
+                backups_found = True
+                try:
+                    size = folder_size(item_path)
+                    delete_started = time.monotonic()
+                    shutil.rmtree(item_path)
+                    DELETE_SECONDS.inc(time.monotonic() - delete_started)
+                    BACKUPS_DELETED.inc()
+                    DELETED_BYTES.inc(size)
+                    deleted += 1
+                    logger.info(f"[DELETE] Altes Backup gelöscht: {item_path}")
+                except Exception as e:
+                    error_message = f"Konnte {item_path} nicht löschen: {e}"
+                    logger.error(f"[ERROR] {error_message}")
+                    if on_error:
+                        on_error(error_message)
+        if not backups_found:
+            logger.info("[DELETE] Keine alten Backups zum Löschen gefunden.")
+        else:
+            logger.info("[DELETE] Löschvorgang abgeschlossen.")
+    except Exception as e:
+        error_message = f"Fehler beim Löschen alter Backups: {e}"
+        logger.error(f"[ERROR] {error_message}")
+        if on_error:
+            on_error(error_message)
+    return deleted
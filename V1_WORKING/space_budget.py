@@ -0,0 +1,228 @@
+# V0.1a/space_budget.py
+"""
+Platzabhängige Zulassung von Shrinks.
+
+pishrink.sh braucht zeitweise zusätzlichen Speicherplatz neben dem Image:
+
+- Komprimierung (-z/-Z): gzip bzw. xz schreiben die komprimierte Datei, bevor das Image
+  gelöscht wird; im schlimmsten Fall (nicht komprimierbare Daten) so groß wie das Image
+- Kopie (zweites Argument): cp schreibt eine vollständige Kopie auf das Ziel-Laufwerk,
+  zusammen mit der Komprimierung dort also bis zum Doppelten
+
+Vor dem Start wird dieser Bedarf pro Laufwerk reserviert. Frei ist, was der gemeinsame
+SpaceSampler zuletzt gemessen hat, abzüglich der Reservierungen laufender Jobs und
+'min_free_space_mb'. Reicht der Platz nicht, wird (falls aktiviert) zuerst die normale
+Aufbewahrung ('delete_backups', 'delete_hours') vorgezogen, danach wartet der Job.
+
+Beispiel in settings.json:
+
+    "min_free_space_mb": 2048
+"""
+import os
+import threading
+from contextlib import contextmanager
+from log_handler import logger  # Zentralen Logger importieren
+from schedule_policy import device_of
+
+COMPRESS_OVERHEAD = 1.01  # gzip/xz sind bei nicht komprimierbaren Daten etwas größer als die Eingabe
+RECHECK_SECONDS = 60  # Wartende Jobs prüfen spätestens so oft neu (andere Prozesse geben Platz frei)
+
+
+class InsufficientSpace(Exception):
+    """
+    Der Shrink passt nicht auf das Laufwerk, und kein anderer Job gibt Platz frei.
+    """
+
+
+def allocated_bytes(path):
+    """
+    :param path: Datei
+    :return: Belegte Bytes (Images sind oft sparse) oder 0
+    """
+    try:
+        return os.stat(path).st_blocks * 512
+    except OSError:
+        return 0
+
+
+def pishrink_arguments(argv):
+    """
+    Zerlegt einen pishrink.sh-Aufruf (z.B. ShrinkJob.argv) in Optionen und Positionsargumente.
+
+    :param argv: Befehl als Liste
+    :return: (Optionen, [Image, optional Kopie])
+    """
+    for index, arg in enumerate(argv):
+        if os.path.basename(arg).startswith('pishrink'):
+            rest = argv[index + 1:]
+            break
+    else:
+        return [], []
+    options = [arg for arg in rest if arg.startswith('-')]
+    return options, [arg for arg in rest if not arg.startswith('-')]
+
+
+def space_needed(img_path, options, copy_to=None):
+    """
+    Schätzt den zusätzlichen Speicherplatz eines Shrinks im schlimmsten Fall.
+
+    :param img_path: Pfad zum Image
+    :param options: PiShrink-Optionen
+    :param copy_to: Ziel einer Kopie (zweites Argument von pishrink.sh) oder None
+    :return: Dict Verzeichnis -> Bytes (nur Verzeichnisse mit Bedarf)
+    """
+    size = allocated_bytes(img_path)
+    compress = '-z' in options or '-Z' in options
+    needed = {}
+    if copy_to:
+        target = os.path.dirname(os.path.abspath(copy_to))
+        needed[target] = size + (int(size * COMPRESS_OVERHEAD) if compress else 0)
+    elif compress:
+        needed[os.path.dirname(os.path.abspath(img_path))] = int(size * COMPRESS_OVERHEAD)
+    return needed
+
+
+def describe_shortfall(directory, missing):
+    return f"zu wenig Speicherplatz in {directory} (fehlen {missing / 2**30:.1f} GB)"
+
+
+def device_or_none(directory):
+    try:
+        return device_of(directory)
+    except OSError:
+        return None
+
+
+class SpaceBudget:
+    """
+    Reserviert Speicherplatz für gleichzeitig laufende Shrinks, pro Laufwerk.
+    """
+
+    def __init__(self, space_sampler=None, min_free_mib=1024):
+        """
+        :param space_sampler: Gemeinsamer SpaceSampler (ohne Messwert oder Sampler: statvfs)
+        :param min_free_mib: Speicherplatz, der nach dem schlimmsten Fall frei bleiben muss
+        """
+        self.space_sampler = space_sampler
+        self.min_free_mib = min_free_mib
+        self.condition = threading.Condition()
+        self.reserved = {}  # Schlüssel -> {(major, minor): Bytes}
+
+    def configure(self, min_free_mib):
+        """
+        Übernimmt geänderte Einstellungen ('min_free_space_mb').
+        """
+        with self.condition:
+            self.min_free_mib = min_free_mib
+            self.condition.notify_all()
+
+    def wake(self):
+        # Wartende Jobs neu prüfen lassen (z.B. nach einem Abbruch)
+        with self.condition:
+            self.condition.notify_all()
+
+    def free_bytes(self, directory, refresh=False):
+        """
+        :param directory: Verzeichnis auf dem Laufwerk
+        :param refresh: Den Sampler vorher neu messen lassen (nach Löschungen oder freigegebenen Jobs)
+        :return: Freie Bytes (ohne Reservierungen) oder None
+        """
+        if self.space_sampler:
+            if refresh:
+                self.space_sampler.sample()
+            free = self.space_sampler.free_bytes(directory)
+            if free is not None:
+                return free
+        try:
+            statvfs = os.statvfs(directory)
+        except OSError as e:
+            logger.warning(f"[SPACE] Speicherplatz für {directory} nicht verfügbar: {e}")
+            return None
+        return statvfs.f_bavail * statvfs.f_frsize
+
+    def shortfall(self, needed, refresh=False):
+        """
+        Aufruf mit gehaltener Condition.
+
+        :param needed: Dict Verzeichnis -> Bytes aus space_needed
+        :return: (Verzeichnis, fehlende Bytes) für das erste Laufwerk, das nicht reicht, oder None
+        """
+        for directory, size in needed.items():
+            free = self.free_bytes(directory, refresh)
+            device = device_or_none(directory)
+            if free is None or device is None:
+                continue
+            reserved = sum(devices.get(device, 0) for devices in self.reserved.values())
+            missing = size + reserved + self.min_free_mib * 2**20 - free
+            if missing > 0:
+                return directory, missing
+        return None
+
+    def defer_reason(self, needed, refresh=False):
+        """
+        Prüft ohne Reservierung, ob ein Shrink jetzt passt (z.B. für den automatischen Start der GUI).
+
+        :param needed: Dict Verzeichnis -> Bytes aus space_needed
+        :return: Grund für das Zurückstellen oder None
+        """
+        with self.condition:
+            short = self.shortfall(needed, refresh)
+        return describe_shortfall(*short) if short else None
+
+    def others_reserved(self, needed):
+        # Hält ein anderer Job Platz auf einem der Laufwerke, lohnt sich das Warten
+        devices = {device_or_none(directory) for directory in needed} - {None}
+        return any(devices & set(reserved) for reserved in self.reserved.values())
+
+    @contextmanager
+    def admit(self, key, needed, on_wait=None, cancelled=None, make_room=None, wait=True, force=False):
+        """
+        Reserviert den Speicherplatz eines Shrinks und gibt ihn danach wieder frei.
+
+        :param key: Eindeutiger Schlüssel des Jobs
+        :param needed: Dict Verzeichnis -> Bytes aus space_needed
+        :param on_wait: Callback(Grund) beim Warten, Callback(None) beim Start
+        :param cancelled: Funktion ohne Parameter; True bricht das Warten ab
+        :param make_room: Funktion ohne Parameter, die bei Platzmangel einmal Platz schafft
+                          (z.B. Aufbewahrung vorziehen); True, wenn etwas gelöscht wurde
+        :param wait: False: InsufficientSpace auslösen, statt zu warten, wenn kein anderer Job Platz freigibt
+        :param force: Ohne Prüfung sofort reservieren (z.B. vom Benutzer trotz Platzmangel bestätigt)
+        :raises InsufficientSpace: siehe wait
+        """
+        room_made = False
+        with self.condition:
+            refresh = False
+            while not force and not (cancelled and cancelled()):
+                short = self.shortfall(needed, refresh)
+                if short is None:
+                    break
+                reason = describe_shortfall(*short)
+                if make_room and not room_made:
+                    room_made = True
+                    logger.info(f"[SPACE] Job {key}: {reason}, ziehe die Aufbewahrung vor.")
+                    self.condition.release()  # Löschen kann dauern, andere Jobs sollen derweil freigeben können
+                    try:
+                        deleted = make_room()
+                    finally:
+                        self.condition.acquire()
+                    if deleted:
+                        refresh = True
+                        continue
+                if not wait and not self.others_reserved(needed):
+                    raise InsufficientSpace(reason)
+                if on_wait:
+                    on_wait(reason)
+                self.condition.wait(RECHECK_SECONDS)
+                refresh = True
+            self.reserved[key] = {}
+            for directory, size in needed.items():
+                device = device_or_none(directory)
+                self.reserved[key][device] = self.reserved[key].get(device, 0) + size
+        if on_wait:
+            on_wait(None)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.reserved.pop(key, None)
+                self.condition.notify_all()
@@ -0,0 +1,107 @@
+# V0.1a/startup_profile.py
+"""
+Messung der Startzeit (--profile-startup).
+
+Misst wie 'python -X importtime' die Importzeit jedes Moduls (eigene und
+kumulierte Zeit) sowie frei gesetzte Zeitmarken bis zur Betriebsbereitschaft.
+Muss vor allen anderen Projektmodulen importiert und mit install() aktiviert werden.
+Verwendet bewusst keinen Logger, damit log_handler ebenfalls gemessen wird.
+"""
+import sys
+import time
+import importlib.abc
+
+FLAG = '--profile-startup'
+
+_started = time.perf_counter()
+_installed = False
+_records = []  # (Modulname, eigene Zeit, kumulierte Zeit, Tiefe)
+_marks = []  # (Bezeichnung, Sekunden seit Start)
+_stack = []  # Laufende Importe: [Startzeit, Zeit der Unterimporte]
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader):
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        _stack.append([time.perf_counter(), 0.0])
+        try:
+            self.loader.exec_module(module)
+        finally:
+            started, children = _stack.pop()
+            cumulative = time.perf_counter() - started
+            if _stack:
+                _stack[-1][1] += cumulative
+            _records.append((module.__name__, cumulative - children, cumulative, len(_stack)))
+
+    def __getattr__(self, name):
+        # Weitere Loader-Methoden (get_code, get_resource_reader, ...) durchreichen
+        return getattr(self.loader, name)
+
+
+class _TimedFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def enabled():
+    return _installed
+
+
+def install(argv=None):
+    """
+    Aktiviert die Messung, wenn --profile-startup übergeben wurde. Das Flag wird aus argv entfernt.
+
+    :param argv: Argumentliste (Standard: sys.argv)
+    :return: True, wenn die Messung aktiv ist
+    """
+    global _installed
+    argv = sys.argv if argv is None else argv
+    if FLAG not in argv:
+        return False
+    argv.remove(FLAG)
+    if not _installed:
+        sys.meta_path.insert(0, _TimedFinder())
+        _installed = True
+    return True
+
+
+def mark(label):
+    """
+    Setzt eine Zeitmarke (z.B. 'Tray angezeigt'), wenn die Messung aktiv ist.
+    """
+    if _installed:
+        _marks.append((label, time.perf_counter() - _started))
+
+
+def report(top=25, stream=None):
+    """
+    Gibt die Importzeiten und Zeitmarken aus, wenn die Messung aktiv ist.
+
+    :param top: Anzahl der langsamsten Module (nach kumulierter Zeit)
+    :param stream: Ausgabeziel (Standard: sys.stderr)
+    """
+    if not _installed:
+        return
+    stream = stream or sys.stderr
+    total_imports = sum(record[1] for record in _records)
+    stream.write(f"[STARTUP] {len(_records)} Module in {total_imports * 1000:.1f} ms importiert\n")
+    stream.write("[STARTUP] import time:  self [us] | cumulative | imported package\n")
+    # Langsamste Module nach kumulierter Zeit, eingerückt nach Importtiefe
+    for name, own, cumulative, depth in sorted(_records, key=lambda record: record[2], reverse=True)[:top]:
+        stream.write(f"[STARTUP] import time: {own * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}\n")
+    for label, seconds in _marks:
+        stream.write(f"[STARTUP] {label}: {seconds * 1000:.1f} ms nach Start\n")
+    stream.flush()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# V0.1a/tests/test_config.py
+"""
+Tests für ConfigService: Typprüfung, Zusammenführen beim Speichern und Neuladen bei Änderungen.
+
+    python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from config import ConfigService, SCHEMA, coerce  # noqa: E402
+
+
+class ConfigServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'settings.json')
+        self.config = ConfigService(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        # Anderer Schreiber (z.B. Editor oder zweite Instanz); Zeitstempel vorrücken, damit refresh es sieht
+        stamp = os.stat(self.path).st_mtime_ns + 10**9 if os.path.exists(self.path) else None
+        with open(self.path, 'w') as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        if stamp:
+            os.utime(self.path, ns=(stamp, stamp))
+
+    def read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_defaults_without_file(self):
+        self.assertEqual(self.config.get('delete_hours'), SCHEMA['delete_hours'][1])
+        self.assertEqual(self.config.snapshot()['delete_hours'], SCHEMA['delete_hours'][1])
+
+    def test_values_are_coerced(self):
+        self.write({'delete_hours': '250', 'delete_backups': 'true', 'eigener_schluessel': 5})
+        self.assertEqual(self.config.get('delete_hours'), 250)
+        self.assertIs(self.config.get('delete_backups'), True)
+        self.assertEqual(self.config.get('eigener_schluessel'), 5)
+
+    def test_invalid_value_falls_back_to_default(self):
+        self.write({'delete_hours': 'viele'})
+        self.assertEqual(self.config.get('delete_hours'), SCHEMA['delete_hours'][1])
+
+    def test_update_merges_keys_of_other_writers(self):
+        self.config.update(delete_hours=100)
+        self.write(dict(self.read(), backup_folders=['/andere/instanz']))
+        self.config.update(delete_backups=True)
+        self.assertEqual(self.read(), {'delete_hours': 100, 'backup_folders': ['/andere/instanz'],
+                                       'delete_backups': True})
+        self.assertEqual(self.config.get('backup_folders'), ['/andere/instanz'])
+
+    def test_update_none_removes_key(self):
+        self.config.update(delete_hours=100, delete_backups=True)
+        self.config.update(delete_hours=None)
+        self.assertEqual(self.read(), {'delete_backups': True})
+
+    def test_update_rejects_invalid_value_without_writing(self):
+        self.config.update(delete_hours=100)
+        with self.assertRaises(ValueError):
+            self.config.update(delete_hours='viele', delete_backups=True)
+        self.assertEqual(self.read(), {'delete_hours': 100})
+
+    def test_update_leaves_no_temporary_file(self):
+        self.config.update(delete_hours=100)
+        self.assertEqual(os.listdir(self.tmp.name), ['settings.json'])
+
+    def test_update_over_corrupt_file_keeps_last_valid_state(self):
+        self.config.update(delete_hours=100)
+        self.write('{"delete_hours": 1')  # Halb geschrieben
+        self.config.update(delete_backups=True)
+        self.assertEqual(self.read(), {'delete_hours': 100, 'delete_backups': True})
+
+    def test_corrupt_file_keeps_last_valid_values(self):
+        self.write({'delete_hours': 100})
+        self.assertEqual(self.config.get('delete_hours'), 100)
+        self.write('kein json')
+        self.assertEqual(self.config.get('delete_hours'), 100)
+
+    def test_listeners_receive_changed_keys(self):
+        changes = []
+        self.config.add_listener(lambda changed, config: changes.append(changed))
+        self.write({'delete_hours': 100, 'delete_backups': False})
+        self.config.refresh()
+        self.write({'delete_hours': 200, 'delete_backups': False})
+        self.assertEqual(self.config.refresh(), {'delete_hours'})
+        self.assertEqual(self.config.refresh(), set())
+        self.assertEqual(changes, [{'delete_hours', 'delete_backups'}, {'delete_hours'}])
+
+
+class CoerceTest(unittest.TestCase):
+
+    def test_coerce(self):
+        self.assertEqual(coerce('delete_hours', '12'), 12)
+        self.assertIs(coerce('delete_backups', '0'), False)
+        self.assertIsNone(coerce('delete_hours', None))
+        self.assertEqual(coerce('unbekannt', 'x'), 'x')
+        for key, value in (('delete_hours', True), ('delete_backups', 'vielleicht'), ('backup_folders', 'a')):
+            with self.assertRaises(ValueError):
+                coerce(key, value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# V0.1a/tests/test_folder_tracker.py
+"""
+Tests für die Zustände von FolderTracker: Backoff, Abbruch, TTL, MAX_ENTRIES und erneutes Überwachen.
+
+Die Prüfungen laufen ohne den Thread des Trackers (check wird direkt aufgerufen), Zeitpunkte
+werden über next_check bzw. last_activity vorgegeben.
+
+    python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from folder_tracker import (FolderTracker, LOG_NAME, WATCHING, WAITING_FOR_LOG, QUEUED, DONE,  # noqa: E402
+                            FAILED)
+
+
+class FolderTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ready = []
+        self.failed = []
+        self.tracker = FolderTracker(lambda folder, images: self.ready.append((folder, images)),
+                                     self.failed.append, poll_seconds=5, settle_seconds=10,
+                                     retry_delays=(30, 60), watch_timeout=100, ttl=1000, max_entries=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def folder(self, name, age=0):
+        path = os.path.join(self.tmp.name, name)
+        os.mkdir(path)
+        if age:
+            stamp = time.time() - age
+            os.utime(path, (stamp, stamp))
+        return path
+
+    def entry(self, path):
+        return self.tracker.entries[path]
+
+    def test_arm_rejects_duplicates(self):
+        path = self.folder('a')
+        self.assertTrue(self.tracker.arm(path))
+        self.assertFalse(self.tracker.arm(path))
+        self.assertEqual(self.tracker.state(path), WATCHING)
+        self.assertEqual(len(self.tracker), 1)
+
+    def test_arm_ignores_missing_and_old_folders(self):
+        self.assertFalse(self.tracker.arm(os.path.join(self.tmp.name, 'fehlt')))
+        self.assertFalse(self.tracker.arm(self.folder('alt', age=2000)))
+        self.assertEqual(len(self.tracker), 0)
+
+    def test_watching_polls_until_log_appears(self):
+        path = self.folder('a')
+        self.tracker.arm(path)
+        entry = self.entry(path)
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, WATCHING)
+        self.assertAlmostEqual(entry.next_check - time.monotonic(), 5, delta=1)
+
+        open(os.path.join(path, LOG_NAME), 'w').close()
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, WAITING_FOR_LOG)
+        self.assertAlmostEqual(entry.next_check - time.monotonic(), 10, delta=1)
+
+    def test_watch_timeout_marks_failed(self):
+        path = self.folder('a')
+        self.tracker.arm(path)
+        entry = self.entry(path)
+        entry.last_activity -= 101
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, FAILED)
+
+    def test_touch_extends_watch_timeout(self):
+        path = self.folder('a')
+        self.tracker.arm(path)
+        entry = self.entry(path)
+        entry.last_activity -= 101
+        self.assertTrue(self.tracker.touch(path))
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, WATCHING)
+
+    def test_images_are_reported_sorted(self):
+        path = self.folder('a')
+        for name in (LOG_NAME, 'b.img', 'a.img', 'notiz.txt'):
+            open(os.path.join(path, name), 'w').close()
+        self.tracker.arm(path)
+        entry = self.entry(path)
+        self.tracker.check(entry)
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, DONE)
+        self.assertEqual(self.ready, [(path, [os.path.join(path, 'a.img'), os.path.join(path, 'b.img')])])
+
+    def test_retry_backoff_then_failed(self):
+        path = self.folder('a')
+        open(os.path.join(path, LOG_NAME), 'w').close()
+        self.tracker.arm(path)
+        entry = self.entry(path)
+        self.tracker.check(entry)  # raspiBackup.log gefunden
+        for attempt, delay in enumerate((30, 60), start=1):
+            self.tracker.check(entry)
+            self.assertEqual(entry.state, QUEUED)
+            self.assertEqual(entry.attempts, attempt)
+            self.assertAlmostEqual(entry.next_check - time.monotonic(), delay, delta=1)
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, FAILED)
+        self.assertEqual(len(self.failed), 1)
+        self.assertIn(path, self.failed[0])
+        self.assertEqual(self.ready, [])
+
+    def test_retry_finds_late_image(self):
+        path = self.folder('a')
+        open(os.path.join(path, LOG_NAME), 'w').close()
+        self.tracker.arm(path)
+        entry = self.entry(path)
+        self.tracker.check(entry)
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, QUEUED)
+        open(os.path.join(path, 'a.img'), 'w').close()
+        self.tracker.check(entry)
+        self.assertEqual(entry.state, DONE)
+        self.assertEqual(len(self.ready), 1)
+
+    def test_failed_folder_is_rearmed(self):
+        path = self.folder('a')
+        self.tracker.arm(path)
+        self.tracker.finish(self.entry(path), FAILED)
+        self.assertTrue(self.tracker.arm(path))
+        entry = self.entry(path)
+        self.assertEqual(entry.state, WATCHING)
+        self.assertEqual(entry.attempts, 0)
+
+    def test_done_folder_is_not_rearmed(self):
+        path = self.folder('a')
+        self.tracker.arm(path)
+        self.tracker.finish(self.entry(path), DONE)
+        self.assertFalse(self.tracker.arm(path))
+        self.assertEqual(self.tracker.state(path), DONE)
+
+    def test_ttl_evicts_finished_entries_only(self):
+        done, active = self.folder('fertig'), self.folder('aktiv')
+        self.tracker.arm(done)
+        self.tracker.arm(active)
+        self.tracker.finish(self.entry(done), DONE)
+        self.entry(done).last_activity -= 1001
+        self.entry(active).last_activity -= 1001
+        self.tracker.arm(self.folder('neu'))
+        self.assertIsNone(self.tracker.state(done))
+        self.assertEqual(self.tracker.state(active), WATCHING)
+
+    def test_configure_changes_ttl(self):
+        done = self.folder('fertig')
+        self.tracker.arm(done)
+        self.tracker.finish(self.entry(done), DONE)
+        self.entry(done).last_activity -= 1001
+        self.tracker.configure(5000)
+        self.tracker.arm(self.folder('neu'))
+        self.assertEqual(self.tracker.state(done), DONE)
+
+    def test_max_entries_evicts_oldest_finished(self):
+        paths = [self.folder(f'f{index}') for index in range(4)]
+        for path in paths:
+            self.tracker.arm(path)
+        for path in paths[1:]:
+            self.tracker.finish(self.entry(path), DONE)
+        self.tracker.arm(self.folder('neu'))
+        self.assertEqual(len(self.tracker), 4)
+        self.assertEqual(self.tracker.state(paths[0]), WATCHING)  # aktive Einträge bleiben
+        self.assertIsNone(self.tracker.state(paths[1]))
+        self.assertEqual(self.tracker.state(paths[2]), DONE)
+
+    def test_folders_by_state(self):
+        first, second = self.folder('a'), self.folder('b')
+        self.tracker.arm(first)
+        self.tracker.arm(second)
+        self.tracker.finish(self.entry(second), FAILED)
+        self.assertEqual(self.tracker.folders(WATCHING), [first])
+        self.assertEqual(self.tracker.folders(FAILED), [second])
+
+
+if __name__ == '__main__':
+    unittest.main()
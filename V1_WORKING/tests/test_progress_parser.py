@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# V0.1a/tests/test_progress_parser.py
+"""
+Tests für ProgressParser, ProgressThrottle und die Hilfsfunktionen in progress_parser.py.
+
+    python3 -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from progress_parser import (ProgressEvent, ProgressParser, ProgressThrottle, format_progress,  # noqa: E402
+                             parse_remaining, parse_size)
+
+BAR = '-' * 40
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProgressParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.parser = ProgressParser(clock=self.clock)
+
+    def phases(self, events):
+        return [event.phase for event in events]
+
+    def test_info_lines_switch_phases(self):
+        lines, events = self.parser.feed(b"pishrink.sh: Gathering data ...\n"
+                                         b"pishrink.sh: Checking filesystem ...\n"
+                                         b"pishrink.sh: Shrinking filesystem ...\n"
+                                         b"pishrink.sh: Shrinking image ...\n"
+                                         b"pishrink.sh: Using xz on the shrunk image ...\n"
+                                         b"pishrink.sh: Shrunk image.img from 10G to 2G ...\n")
+        self.assertEqual(self.phases(events), ['read', 'fsck', 'resize', 'truncate', 'compress', 'done'])
+        self.assertEqual(events[0].message, 'Gathering data')
+        self.assertEqual(events[-1].percent, 100.0)
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(self.parser.phase, 'done')
+
+    def test_unknown_info_line_keeps_phase(self):
+        self.parser.feed("pishrink.sh: Gathering data ...\n")
+        _, events = self.parser.feed("pishrink.sh: Irgendwas anderes ...\n")
+        self.assertEqual(events, [ProgressEvent('read', None, None, None, None, 'Irgendwas anderes')])
+
+    def test_e2fsck_summary_starts_minsize(self):
+        self.parser.feed("pishrink.sh: Checking filesystem ...\n")
+        _, events = self.parser.feed("rootfs: 1000/2000 files (0.1% non-contiguous), 3000/4000 blocks\n")
+        self.assertEqual(self.phases(events), ['minsize'])
+
+    def test_e2fsck_summary_outside_fsck_is_ignored(self):
+        _, events = self.parser.feed("rootfs: 1000/2000 files (0.1% non-contiguous), 3000/4000 blocks\n")
+        self.assertEqual(events, [])
+
+    def test_chunks_split_inside_line_and_utf8_character(self):
+        data = "pishrink.sh: Gathering data ...\nÄnderung\n".encode('utf-8')
+        split = data.index('Ä'.encode('utf-8')) + 1  # Mitten im Zwei-Byte-Zeichen
+        lines = []
+        for chunk in (data[:10], data[10:split], data[split:]):
+            chunk_lines, _ = self.parser.feed(chunk)
+            lines += chunk_lines
+        self.assertEqual(lines, ['pishrink.sh: Gathering data ...', 'Änderung'])
+
+    def test_carriage_return_lines_are_progress_only(self):
+        lines, events = self.parser.feed("  12.3 %   120 MiB / 1,000 MiB = 0.120   10 MiB/s   0:12   1 min 30 s\r")
+        self.assertEqual(lines, [])
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].phase, 'compress')
+        self.assertEqual(events[0].percent, 12.3)
+        self.assertEqual(events[0].eta, 90)
+
+    def test_resize_bar_reports_percent_and_eta(self):
+        self.parser.feed("pishrink.sh: Shrinking filesystem ...\nBegin pass 2 (max = 100)\n")
+        _, events = self.parser.feed(f"Relocating blocks             {BAR}")
+        self.assertEqual(events[-1].percent, 0.0)
+        self.clock.now = 10.0
+        _, events = self.parser.feed("\b" * 40 + "X" * 10)
+        self.assertEqual(events, [ProgressEvent('resize', 25.0, None, None, 30.0, 'Relocating blocks')])
+        _, events = self.parser.feed("")  # Unveränderter Balken: kein neues Ereignis
+        self.assertEqual(events, [])
+        lines, events = self.parser.feed("X" * 30 + "\n")
+        self.assertEqual(events[-1].percent, 100.0)
+        self.assertIsNone(events[-1].eta)
+        self.assertEqual(lines, ["Relocating blocks             " + "X" * 40])
+
+    def test_gzip_result(self):
+        _, events = self.parser.feed("image.img:\t 85.3% -- replaced with image.img.gz\n")
+        self.assertEqual(events, [ProgressEvent('compress', 100.0, None, None, 0, 'Komprimiert: image.img.gz')])
+
+    def test_flush_returns_unterminated_line(self):
+        lines, _ = self.parser.feed("ohne Zeilenende")
+        self.assertEqual(lines, [])
+        lines, _ = self.parser.flush()
+        self.assertEqual(lines, ['ohne Zeilenende'])
+        self.assertEqual(self.parser.flush(), ([], []))
+
+
+class HelperTest(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("1,000 MiB"), 1000 * 2**20)
+        self.assertEqual(parse_size("1.5 GB"), 1500000000)
+        self.assertIsNone(parse_size("12 Äpfel"))
+        self.assertIsNone(parse_size("kaputt"))
+
+    def test_parse_remaining(self):
+        self.assertEqual(parse_remaining("1 min 30 s"), 90)
+        self.assertEqual(parse_remaining("2 h 5 min"), 7500)
+        self.assertEqual(parse_remaining("0:45"), 45)
+        self.assertEqual(parse_remaining("1:02:03"), 3723)
+        self.assertIsNone(parse_remaining(""))
+        self.assertIsNone(parse_remaining("unbekannt"))
+
+    def test_format_progress(self):
+        self.assertEqual(format_progress(ProgressEvent('resize', 25.0, None, None, 95, '')),
+                         "Dateisystem verkleinern 25% (noch 1:35)")
+        self.assertEqual(format_progress(ProgressEvent('read', None, None, None, None, '')), "Partition einlesen")
+
+
+class ProgressThrottleTest(unittest.TestCase):
+
+    def test_throttles_percent_but_not_phase_changes(self):
+        clock = FakeClock()
+        throttle = ProgressThrottle(min_interval=0.5, clock=clock)
+        event = ProgressEvent('compress', 10.0, None, None, None, '')
+        self.assertTrue(throttle.accept(event))
+        clock.now = 0.1
+        self.assertFalse(throttle.accept(event._replace(percent=11.0)))
+        self.assertTrue(throttle.accept(event._replace(phase='done')))
+        clock.now = 0.2
+        self.assertTrue(throttle.accept(ProgressEvent('done', 100.0, None, None, None, '')))
+        clock.now = 0.8
+        self.assertTrue(throttle.accept(event._replace(phase='done', percent=50.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
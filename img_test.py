@@ -1,20 +1,243 @@
+#!/usr/bin/env python3
+"""
+Ereignisraten-Profiler für die Backup-Überwachung.
+
+Abonniert das Backup-Verzeichnis wie die Anwendung (rekursiver watchdog-Observer)
+und meldet periodisch:
+  - Ereignisse pro Sekunde nach Typ und nach Pfad-Präfix
+  - Anzahl der inotify-Watches des Prozesses
+  - Latenz-Perzentile des Handlers
+  - Wartezeit der Ereignisse in der Queue zwischen Emitter- und Dispatcher-Thread
+
+Beispiele:
+    python3 img_test.py
+    python3 img_test.py /media/raphi/hdd/backups/raspiHauptDD/raspihaupt --interval 10 --depth 2
+    python3 img_test.py --json --output profil.jsonl --app-handler
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
 from watchdog.observers import Observer
+from watchdog.observers.api import EventQueue
 from watchdog.events import FileSystemEventHandler
-import time
 
-class TestEventHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        print(f"Erstellt: {event.src_path}")
+DEFAULT_PATH = "/media/raphi/hdd/backups/raspiHauptDD/raspihaupt"
+BACKUP_PATTERN = r"raspihaupt-dd-backup-(\d{8})-(\d{6})"
+
+
+class TimedEventQueue(EventQueue):
+    """
+    Event-Queue des Observers, die den Zeitpunkt des Einreihens jedes Ereignisses festhält.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stamps = {}
+        self.stamps_lock = threading.Lock()
+
+    def put(self, item, block=True, timeout=None):
+        with self.stamps_lock:
+            self.stamps.setdefault(item[0], time.monotonic())
+        super().put(item, block, timeout)
+
+    def pop_stamp(self, event):
+        with self.stamps_lock:
+            return self.stamps.pop(event, None)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def inotify_watch_count(pid='self'):
+    """
+    Zählt die inotify-Watches eines Prozesses über /proc/<pid>/fdinfo.
+
+    :param pid: Prozess-ID oder 'self'
+    :return: Anzahl Watches oder None, wenn /proc nicht lesbar ist
+    """
+    fd_dir = f"/proc/{pid}/fd"
+    count = 0
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return None
+    for fd in fds:
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)) != 'anon_inode:inotify':
+                continue
+            with open(f"/proc/{pid}/fdinfo/{fd}") as f:
+                count += sum(1 for line in f if line.startswith('inotify wd:'))
+        except OSError:
+            continue
+    return count
+
+
+class ProfilingEventHandler(FileSystemEventHandler):
+    """
+    Zählt Ereignisse und misst Handler-Latenz sowie Queue-Wartezeit.
+    """
+
+    def __init__(self, roots, event_queue, depth=1, inner_handler=None):
+        super().__init__()
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.event_queue = event_queue
+        self.depth = depth
+        self.inner_handler = inner_handler
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Beginnt ein neues Messfenster und liefert das alte zurück.
+        """
+        with self.lock:
+            window = getattr(self, 'window', None)
+            self.window = {
+                'started': time.monotonic(),
+                'by_type': {},
+                'by_prefix': {},
+                'handler_seconds': [],
+                'queue_lag_seconds': [],
+            }
+        return window
+
+    def prefix(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root + os.sep):
+                parts = os.path.relpath(path, root).split(os.sep)
+                return os.sep.join(parts[:self.depth])
+        return path
+
+    def dispatch(self, event):
+        received = time.monotonic()
+        enqueued = self.event_queue.pop_stamp(event)
+        if self.inner_handler is not None:
+            self.inner_handler.dispatch(event)
+        prefix = self.prefix(event.src_path)
+        with self.lock:
+            window = self.window
+            window['by_type'][event.event_type] = window['by_type'].get(event.event_type, 0) + 1
+            window['by_prefix'][prefix] = window['by_prefix'].get(prefix, 0) + 1
+            if enqueued is not None:
+                window['queue_lag_seconds'].append(received - enqueued)
+            window['handler_seconds'].append(time.monotonic() - received)
+
+
+def summarize(window, observer, top=10):
+    elapsed = max(time.monotonic() - window['started'], 1e-9)
+    handler = window['handler_seconds']
+    lag = window['queue_lag_seconds']
+    prefixes = sorted(window['by_prefix'].items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'interval_seconds': elapsed,
+        'events': len(handler),
+        'events_per_second': len(handler) / elapsed,
+        'rate_by_type': {key: count / elapsed for key, count in sorted(window['by_type'].items())},
+        'rate_by_prefix': {key: count / elapsed for key, count in prefixes},
+        'inotify_watches': inotify_watch_count(),
+        'queue_depth': observer.event_queue.qsize(),
+        'handler_latency_ms': {name: (value * 1000 if value is not None else None)
+                               for name, value in (('p50', percentile(handler, 0.5)),
+                                                   ('p95', percentile(handler, 0.95)),
+                                                   ('p99', percentile(handler, 0.99)),
+                                                   ('max', max(handler) if handler else None))},
+        'queue_lag_ms': {name: (value * 1000 if value is not None else None)
+                         for name, value in (('p50', percentile(lag, 0.5)),
+                                             ('p95', percentile(lag, 0.95)),
+                                             ('p99', percentile(lag, 0.99)),
+                                             ('max', max(lag) if lag else None))},
+    }
+
+
+def format_ms(value):
+    return f"{value:8.3f}" if value is not None else "       -"
+
+
+def print_table(report):
+    lines = [
+        f"{report['time']}  Ereignisse: {report['events']}  ({report['events_per_second']:.1f}/s)  "
+        f"inotify-Watches: {report['inotify_watches']}  Queue: {report['queue_depth']}",
+        "",
+        f"{'Latenz [ms]':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}",
+    ]
+    for label, key in (('Handler', 'handler_latency_ms'), ('Queue', 'queue_lag_ms')):
+        values = report[key]
+        lines.append(f"{label:<14} {format_ms(values['p50'])} {format_ms(values['p95'])} "
+                     f"{format_ms(values['p99'])} {format_ms(values['max'])}")
+    lines.append("")
+    lines.append(f"{'Typ':<40}{'/s':>10}")
+    for key, rate in report['rate_by_type'].items():
+        lines.append(f"{key:<40}{rate:>10.2f}")
+    lines.append("")
+    lines.append(f"{'Pfad-Präfix':<40}{'/s':>10}")
+    for key, rate in report['rate_by_prefix'].items():
+        lines.append(f"{key[-40:]:<40}{rate:>10.2f}")
+    # Bildschirm leeren und Tabelle neu zeichnen
+    sys.stdout.write("\033[2J\033[H" + "\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+def load_app_handler(roots):
+    """
+    Lädt den BackupEventHandler aus V1_WORKING, ohne Überwachungs-Threads zu starten.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'V1_WORKING'))
+    from backup_monitor import BackupEventHandler
+    from event_trace import NullSignals, DispatchCounter
+    handler = BackupEventHandler(NullSignals(), roots, BACKUP_PATTERN)
+    handler.start_monitoring_folder = DispatchCounter()
+    return handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ereignisraten-Profiler für die Backup-Überwachung")
+    parser.add_argument('paths', nargs='*', default=[DEFAULT_PATH], help="Zu überwachende Verzeichnisse")
+    parser.add_argument('--interval', type=float, default=5.0, help="Berichtsintervall in Sekunden")
+    parser.add_argument('--depth', type=int, default=1, help="Anzahl Pfadebenen für die Präfix-Gruppierung")
+    parser.add_argument('--top', type=int, default=10, help="Anzahl angezeigter Pfad-Präfixe")
+    parser.add_argument('--json', action='store_true', help="JSON-Zeilen statt Live-Tabelle ausgeben")
+    parser.add_argument('--output', default=None, help="JSON-Zeilen an diese Datei anhängen")
+    parser.add_argument('--app-handler', action='store_true',
+                        help="Den BackupEventHandler der Anwendung mitmessen (ohne Ordner-Threads)")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
-    path = "/media/raphi/hdd/backups/raspiHauptDD/raspihaupt"
-    event_handler = TestEventHandler()
     observer = Observer()
-    observer.schedule(event_handler, path, recursive=True)
+    event_queue = TimedEventQueue()
+    observer._event_queue = event_queue  # Muss vor schedule() gesetzt werden, die Emitter übernehmen die Queue
+    inner_handler = load_app_handler(args.paths) if args.app_handler else None
+    event_handler = ProfilingEventHandler(args.paths, event_queue, args.depth, inner_handler)
+    for path in args.paths:
+        observer.schedule(event_handler, path, recursive=True)
     observer.start()
+
+    output = open(args.output, 'a') if args.output else None
     try:
         while True:
-            time.sleep(1)
+            time.sleep(args.interval)
+            report = summarize(event_handler.reset(), observer, args.top)
+            if args.json or output:
+                line = json.dumps(report)
+                if output:
+                    output.write(line + "\n")
+                    output.flush()
+                if args.json:
+                    print(line, flush=True)
+            if not args.json:
+                print_table(report)
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    if output:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()